@@ -0,0 +1,348 @@
+from __future__ import division, print_function
+
+"""runner_overhead.py - benchmarks of the overhead RunningShoes itself adds.
+
+Builds synthetic pipeline directories in a temporary directory, and measures:
+
+- discovery: how long making a RunningShoes takes (listing the directory and
+  reading each file's options) in a directory holding 10 prefixed files
+  alongside anywhere from 10 to 100,000 other files, without the discovery
+  index and with an index made by an earlier RunningShoes
+- dispatch: how much longer a pipeline of N trivial files takes to run than
+  running the same commands with subprocess directly, per file, along with
+  the median spawn_latency, sequentially, with logs, and in the warm Python
+  interpreter
+- reporting: how long pretty_file_data takes for N files
+- scaling: how long N sleeping, CPU-bound or output-heavy files take with
+  parallel = True and each of a range of max_workers
+
+Results are written as JSON, which can be compared against the results of
+another version with --compare:
+
+python benchmarks/runner_overhead.py --output before.json
+python benchmarks/runner_overhead.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runningshoes import RunningShoes
+
+
+# -- the bodies of the synthetic files, by kind; each is a Python file
+SCRIPTS = {
+    'noop': 'pass\n',
+    'sleep': 'import time\ntime.sleep({seconds})\n',
+    'cpu': ('import time\nend = time.process_time() + {seconds}\n'
+            'while time.process_time() < end:\n    pass\n'),
+    'output': ('import sys\nline = b"x" * 99 + b"\\n"\n'
+               'for _ in range({lines}):\n    sys.stdout.buffer.write(line)\n')
+}
+
+# -- how big each benchmark is, in full and with --quick
+SIZES = {
+    'full': {'extra_files': [10, 1000, 10000, 100000], 'repeats': 5,
+             'dispatch_steps': 50, 'report_rows': [10, 100, 1000, 10000],
+             'scaling_steps': 16, 'seconds': 0.2, 'lines': 100000},
+    'quick': {'extra_files': [10, 1000], 'repeats': 3,
+              'dispatch_steps': 10, 'report_rows': [10, 100],
+              'scaling_steps': 4, 'seconds': 0.05, 'lines': 10000}
+}
+
+
+def build_pipeline(directory, steps, kind = 'noop', extra_files = 0,
+                   same_prefix = False, seconds = 0.2, lines = 100000):
+    """Make a directory of synthetic prefixed Python files of one kind (see
+    SCRIPTS), along with extra_files empty files without a prefix. When
+    same_prefix is True, every file shares the prefix 1, forming one stage.
+    """
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    body = SCRIPTS[kind].format(seconds = seconds, lines = lines)
+    for i in range(1, steps + 1):
+        prefix = 1 if same_prefix else i
+        with open(os.path.join(directory, '{}-{}_{}.py'.format(
+                prefix, kind, i)), 'w') as f:
+            f.write(body)
+    for i in range(extra_files):
+        open(os.path.join(directory, 'data_{:06d}.csv'.format(i)), 'w').close()
+    return directory
+
+
+def runner(directory, **options):
+    """A RunningShoes for a synthetic pipeline, running .py files with this
+    interpreter.
+    """
+    return RunningShoes(directory,
+                        custom_extensions = {'.py': [sys.executable]},
+                        **options)
+
+
+def timed(function, repeats):
+    """Call function repeats times, returning the median number of seconds a
+    call took.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def quietly(function):
+    """Call function with our stdout sent to /dev/null, so that files' output
+    and reports do not flood the terminal.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            os.dup2(devnull.fileno(), 1)
+            return function()
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def backdate(directory, seconds = 60):
+    """Make a directory and everything in it look like it was last changed
+    seconds ago.
+    """
+    then = time.time() - seconds
+    for entry in os.scandir(directory):
+        os.utime(entry.path, (then, then))
+    os.utime(directory, (then, then))
+    return None
+
+
+def bench_discovery(root, sizes):
+    """How long making a RunningShoes takes with more and more unprefixed
+    files, each time from scratch, as a new process would.
+    """
+    results = []
+    for extra in sizes['extra_files']:
+        directory = build_pipeline(os.path.join(root, 'discovery'), 10,
+                                   extra_files = extra)
+        # -- make the index (and the state directory it lives in) up front,
+        # -- with everything looking older than it, as in a pipeline that is
+        # -- not being edited, so that every timed RunningShoes trusts it
+        # -- (see RACY_WINDOW)
+        runner(directory, cache = True)
+        backdate(directory)
+        runner(directory, cache = True)
+        results.append({
+            'benchmark': 'discovery',
+            'params': {'prefixed_files': 10, 'extra_files': extra},
+            'metrics': {
+                'scan_seconds': timed(
+                    lambda: runner(directory, cache = False),
+                    sizes['repeats']),
+                'indexed_seconds': timed(
+                    lambda: runner(directory, cache = True),
+                    sizes['repeats'])
+            }
+        })
+    return results
+
+
+def bench_dispatch(root, sizes):
+    """How much each file costs to run, beyond running its command."""
+    steps = sizes['dispatch_steps']
+    directory = build_pipeline(os.path.join(root, 'dispatch'), steps)
+    run = runner(directory, cache = False)
+    calls = [[sys.executable, os.path.join(directory, f)] for f in run.files]
+
+    def direct():
+        for call in calls:
+            subprocess.run(call, check = True)
+
+    baseline = timed(direct, sizes['repeats'])
+    results = []
+    for mode, options in [('sequential', {}), ('logs', {'logs': True}),
+                          ('warm_python', {'warm_python': True})]:
+        run = runner(directory, cache = False, **options)
+        elapsed = timed(lambda: quietly(run.run), sizes['repeats'])
+        timings = [info['timing'] for info in run.file_data['info'].values()]
+        results.append({
+            'benchmark': 'dispatch',
+            'params': {'steps': steps, 'mode': mode},
+            'metrics': {
+                'run_seconds': elapsed,
+                'direct_seconds': baseline,
+                'overhead_per_step_seconds': (elapsed - baseline) / steps,
+                'median_spawn_latency_seconds': statistics.median(
+                    t['spawn_latency'] for t in timings),
+                'outside_steps_seconds':
+                    run.file_data['meta']['timing']['elapsed'] -
+                    sum(t['elapsed'] for t in timings)
+            }
+        })
+    return results
+
+
+def bench_reporting(root, sizes):
+    """How long pretty_file_data takes for more and more files."""
+    results = []
+    directory = build_pipeline(os.path.join(root, 'reporting'), 1)
+    run = runner(directory, cache = False)
+    quietly(run.run)
+    info = run.file_data['info'][run.files[0]]
+    for rows in sizes['report_rows']:
+        files = tuple('{}-step_{}.py'.format(i, i) for i in range(1, rows + 1))
+        run.file_data = {'info': dict((f, info) for f in files),
+                         'meta': dict(run.file_data['meta'], files = files)}
+        results.append({
+            'benchmark': 'reporting',
+            'params': {'rows': rows},
+            'metrics': {'seconds': timed(run.pretty_file_data,
+                                         sizes['repeats'])}
+        })
+    return results
+
+
+def bench_scaling(root, sizes):
+    """How long a stage of files takes with more and more workers."""
+    steps = sizes['scaling_steps']
+    workers = sorted(set([1, 2, 4, 8, 16, os.cpu_count() or 1]))
+    workers = [w for w in workers if w <= steps]
+    results = []
+    for kind in ('sleep', 'cpu', 'output'):
+        directory = build_pipeline(os.path.join(root, 'scaling_' + kind),
+                                   steps, kind, same_prefix = True,
+                                   seconds = sizes['seconds'],
+                                   lines = sizes['lines'])
+        serial = None
+        for max_workers in workers:
+            run = runner(directory, cache = False, parallel = True,
+                         max_workers = max_workers, logs = True)
+            elapsed = timed(lambda: quietly(run.run), 1)
+            serial = serial or elapsed
+            results.append({
+                'benchmark': 'scaling',
+                'params': {'kind': kind, 'steps': steps,
+                           'max_workers': max_workers},
+                'metrics': {'seconds': elapsed,
+                            'speedup': serial / elapsed,
+                            'efficiency': serial / elapsed / max_workers}
+            })
+    return results
+
+
+BENCHMARKS = {
+    'discovery': bench_discovery,
+    'dispatch': bench_dispatch,
+    'reporting': bench_reporting,
+    'scaling': bench_scaling
+}
+
+
+def environment():
+    """What the benchmarks were run on and against."""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr = subprocess.DEVNULL,
+            cwd = os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'recorded': time.time()}
+
+
+def key(result):
+    """What identifies a result across runs of the benchmarks."""
+    return result['benchmark'], json.dumps(result['params'], sort_keys = True)
+
+
+def compare(results, baseline):
+    """Rows of (benchmark, params, metric, baseline, value, change) for every
+    metric in both results and baseline.
+    """
+    before = dict((key(r), r) for r in baseline['results'])
+    rows = []
+    for result in results['results']:
+        previous = before.get(key(result))
+        if previous is None:
+            continue
+        for metric, value in sorted(result['metrics'].items()):
+            old = previous['metrics'].get(metric)
+            if old is None:
+                continue
+            change = '{:+.1%}'.format(value / old - 1) if old else 'NA'
+            rows.append([result['benchmark'], key(result)[1], metric, old,
+                         value, change])
+    return rows
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(
+        description = 'Benchmark the overhead RunningShoes adds to a run.')
+    parser.add_argument('benchmarks', nargs = '*', metavar = 'benchmark',
+        help = 'which benchmarks to run (default is all of them: {})'.format(
+            ', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--quick', action = 'store_true',
+        help = 'run smaller versions of the benchmarks')
+    parser.add_argument('--output', default = None,
+        help = 'where to write the results (default is '
+               'benchmarks/results/<time>.json)')
+    parser.add_argument('--compare', default = None,
+        help = 'a previous results file to compare against')
+    parser.add_argument('--keep', action = 'store_true',
+        help = 'keep the synthetic pipelines instead of removing them')
+    args = parser.parse_args(args)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('No benchmark called {!r}!'.format(name))
+    return args
+
+
+def main(args = None):
+    args = parse_args(args)
+    sizes = SIZES['quick' if args.quick else 'full']
+    root = tempfile.mkdtemp(prefix = 'runningshoes-benchmarks-')
+    results = {'environment': environment(),
+               'sizes': 'quick' if args.quick else 'full', 'results': []}
+    try:
+        for name in args.benchmarks or sorted(BENCHMARKS):
+            print('Running {}...'.format(name), file = sys.stderr)
+            results['results'].extend(BENCHMARKS[name](root, sizes))
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors = True)
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results',
+        time.strftime('%Y%m%d-%H%M%S') + '.json')
+    if os.path.dirname(output) and not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent = 2)
+    from tabulate import tabulate
+    print(tabulate([[r['benchmark'], key(r)[1]] +
+                    ['{}={:.4g}'.format(k, v)
+                     for k, v in sorted(r['metrics'].items())]
+                    for r in results['results']], tablefmt = 'psql'))
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(tabulate(compare(results, baseline),
+                       headers = ['Benchmark', 'Params', 'Metric', 'Before',
+                                  'After', 'Change'], tablefmt = 'psql'))
+    print('Results written to {}'.format(output), file = sys.stderr)
+    return None
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,13 @@
-from runningshoes import RunningShoes
+__all__ = ['RunningShoes']
+
+
+def __getattr__(name):
+    # -- RunningShoes is imported the first time it is asked for, so that
+    # -- importing any part of the package (such as the command-line utility)
+    # -- does not import all of it
+    if name == 'RunningShoes':
+        from .runningshoes import RunningShoes
+        globals()['RunningShoes'] = RunningShoes
+        return RunningShoes
+    raise AttributeError('module {!r} has no attribute {!r}'.format(
+        __name__, name))
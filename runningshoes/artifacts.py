@@ -0,0 +1,272 @@
+from __future__ import print_function
+
+"""artifacts.py - ArtifactStore class, and helpers for using it from a file.
+
+Files run by a RunningShoes with artifacts = True can hand data to each other
+through the store, by name, instead of writing it out to disk and parsing it
+back:
+
+from runningshoes import artifacts
+
+artifacts.publish('events', events)   # -- in 3-pull_ingest.py
+events = artifacts.read('events')     # -- in 4-model.py
+"""
+
+import json
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import uuid
+
+
+# -- the environment variable that tells a file where the run's store is
+ARTIFACTS_VARIABLE = 'RUNNINGSHOES_ARTIFACTS'
+
+# -- where stores are made: shared memory where there is any, so that
+# -- artifacts never touch disk
+SHARED_MEMORY = '/dev/shm'
+
+# -- every artifact starts with MAGIC and the length of a JSON header, and its
+# -- payload starts at the next multiple of ALIGNMENT bytes after the header,
+# -- so that numpy and Arrow can use it in place
+MAGIC = b'RSARTIF1'
+HEADER_LENGTH = struct.Struct('<Q')
+ALIGNMENT = 64
+
+
+class ArtifactStore(object):
+    """A directory of named artifacts, in shared memory where possible, that
+    files in a run publish to and read from. Each artifact is one file, read
+    back by memory-mapping it, so that:
+
+    - numpy arrays (of anything but Python objects) come back as read-only
+      arrays over the mapped memory, without being copied
+    - Arrow tables and record batches are stored in the Arrow IPC format, and
+      come back as tables over the mapped memory, without being copied
+    - pandas DataFrames are stored as Arrow tables when pyarrow is installed
+      (and pickled otherwise), and come back as DataFrames
+    - bytes-like objects come back as read-only memoryviews
+    - anything else is pickled
+
+    numpy, pyarrow and pandas are all optional, and only imported when an
+    artifact needs them.
+
+    Examples -------------------------------------------------------------------
+
+    store = ArtifactStore.create()
+    store.publish('weights', numpy.ones((1000, 1000)))
+    weights = store.read('weights')
+    store.destroy()
+    """
+
+
+    def __init__(self, path):
+        """Initialize an ArtifactStore object for an existing store.
+
+        Parameters
+        ----------
+        path : string
+            the store's directory
+        """
+        self.path = path
+
+
+    @classmethod
+    def create(cls, root = None):
+        """Make a new, empty store in a directory of its own under root
+        (default is SHARED_MEMORY if it exists, and the temporary directory
+        otherwise).
+        """
+        if root is None:
+            root = SHARED_MEMORY if os.path.isdir(SHARED_MEMORY) else \
+                tempfile.gettempdir()
+        return cls(tempfile.mkdtemp(prefix = 'runningshoes-artifacts-',
+                                    dir = root))
+
+
+    @classmethod
+    def current(cls):
+        """The store of the run that this file is part of, raising an
+        Exception if it is not being run with artifacts.
+        """
+        path = os.environ.get(ARTIFACTS_VARIABLE)
+        if not path or not os.path.isdir(path):
+            raise Exception('No artifact store; run this file with '
+                            'RunningShoes(artifacts = True)!')
+        return cls(path)
+
+
+    def location(self, name):
+        """Where the artifact called name lives.
+        """
+        if not name or name.startswith('.') or os.sep in name:
+            raise ValueError('Invalid artifact name {!r}!'.format(name))
+        return os.path.join(self.path, name)
+
+
+    @staticmethod
+    def encode(data):
+        """Split data into a header dict describing it and a list of
+        bytes-like chunks holding it. Only numpy arrays, Arrow tables and
+        record batches, and pandas DataFrames are stored in their own formats;
+        anything else from those libraries (such as a pandas Series) is
+        pickled like any other object.
+        """
+        # -- the module a type comes from is checked first, so that numpy,
+        # -- pyarrow and pandas are only imported for data that needs them
+        module = type(data).__module__.split('.')[0]
+        if module == 'numpy':
+            import numpy
+            # -- subclasses (such as masked arrays) are pickled, since they
+            # -- hold more than their data, and so are scalars, which would
+            # -- come back as arrays
+            if type(data) is numpy.ndarray and not data.dtype.hasobject:
+                # -- unlike ascontiguousarray, keeps a 0-d array's shape
+                array = numpy.asarray(data, order = 'C')
+                return ({'kind': 'numpy',
+                         'dtype': numpy.lib.format.dtype_to_descr(
+                             array.dtype),
+                         'shape': list(array.shape)},
+                        [memoryview(array.reshape(-1).view(numpy.uint8))])
+        if module == 'pyarrow' or module == 'pandas':
+            try:
+                import pyarrow
+            except ImportError:
+                pyarrow = None
+            table = None
+            if pyarrow is not None and module == 'pandas':
+                import pandas
+                if isinstance(data, pandas.DataFrame):
+                    try:
+                        table = pyarrow.Table.from_pandas(data)
+                    except pyarrow.ArrowException:
+                        # -- such as a column of mixed Python objects
+                        table = None
+            elif pyarrow is not None:
+                if isinstance(data, pyarrow.RecordBatch):
+                    table = pyarrow.Table.from_batches([data])
+                elif isinstance(data, pyarrow.Table):
+                    table = data
+            if table is not None:
+                sink = pyarrow.BufferOutputStream()
+                with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                return ({'kind': 'pandas' if module == 'pandas' else 'arrow'},
+                        [sink.getvalue()])
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return {'kind': 'bytes'}, [memoryview(data).cast('B')]
+        return {'kind': 'pickle'}, [pickle.dumps(data, protocol = -1)]
+
+
+    @staticmethod
+    def decode(header, payload):
+        """Turn an artifact's header and a memoryview of its payload back into
+        the data that was published.
+        """
+        kind = header['kind']
+        if kind == 'numpy':
+            import numpy
+            dtype = numpy.lib.format.descr_to_dtype(header['dtype'])
+            return numpy.frombuffer(payload, dtype = dtype).reshape(
+                header['shape'])
+        if kind in ('arrow', 'pandas'):
+            import pyarrow
+            reader = pyarrow.ipc.open_file(pyarrow.py_buffer(payload))
+            table = reader.read_all()
+            return table.to_pandas() if kind == 'pandas' else table
+        if kind == 'bytes':
+            return payload
+        return pickle.loads(payload)
+
+
+    def publish(self, name, data):
+        """Publish data as the artifact called name, replacing any artifact
+        already called that. Readers only ever see a whole artifact.
+        """
+        header, chunks = self.encode(data)
+        encoded = json.dumps(header).encode('utf-8')
+        start = len(MAGIC) + HEADER_LENGTH.size + len(encoded)
+        padding = -start % ALIGNMENT
+        location = self.location(name)
+        temporary = os.path.join(self.path, '.{}.{}.{}.tmp'.format(
+            name, os.getpid(), uuid.uuid4().hex[:8]))
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded +
+                        b'\0' * padding)
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(temporary, location)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return location
+
+
+    def read(self, name):
+        """Read the artifact called name (see the class docstring for what
+        comes back), raising KeyError if there is none.
+        """
+        try:
+            f = open(self.location(name), 'rb')
+        except FileNotFoundError:
+            raise KeyError(name)
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) \
+                if size else b''
+        view = memoryview(mapped)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise Exception('{} is not an artifact!'.format(name))
+        length, = HEADER_LENGTH.unpack_from(view, len(MAGIC))
+        start = len(MAGIC) + HEADER_LENGTH.size
+        header = json.loads(bytes(view[start:start + length]).decode('utf-8'))
+        start += length
+        start += -start % ALIGNMENT
+        return self.decode(header, view[start:])
+
+
+    def names(self):
+        """The names of every artifact in the store.
+        """
+        return sorted(name for name in os.listdir(self.path)
+                      if not name.startswith('.'))
+
+
+    def remove(self, name):
+        """Remove the artifact called name. Anything already reading it keeps
+        its copy until it is done with it.
+        """
+        os.remove(self.location(name))
+        return None
+
+
+    def destroy(self):
+        """Remove the store and every artifact in it.
+        """
+        shutil.rmtree(self.path, ignore_errors = True)
+        return None
+
+
+def publish(name, data):
+    """Publish data as the artifact called name in the current run's store
+    (see ArtifactStore.publish).
+    """
+    return ArtifactStore.current().publish(name, data)
+
+
+def read(name):
+    """Read the artifact called name from the current run's store (see
+    ArtifactStore.read).
+    """
+    return ArtifactStore.current().read(name)
+
+
+def names():
+    """The names of every artifact in the current run's store.
+    """
+    return ArtifactStore.current().names()
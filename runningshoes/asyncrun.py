@@ -0,0 +1,279 @@
+from __future__ import division, print_function
+
+"""asyncrun.py - AsyncRunningShoes class.
+"""
+
+import asyncio
+from collections import OrderedDict
+import os
+import signal
+import time
+
+from .logs import CHUNK_SIZE, DRAIN_TIMEOUT, EXIT_POLL
+from .runningshoes import RESOURCE_RECHECK, RunningShoes, StepTimeout
+
+
+class AsyncRunningShoes(RunningShoes):
+    """A RunningShoes that runs its files with asyncio instead of threads, so
+    that many pipelines can be run from one event loop without a thread per
+    pipeline, or per running file. It follows the same plan as run: files in
+    prefix order, by stage when parallel is True, or by the dependency graph
+    when graph is True.
+
+    Files are run with asyncio.create_subprocess_exec, so the warm_python and
+    batch_hql options do not apply, and since the event loop reaps each
+    process itself, resource usage is only recorded for files run in cgroups
+    of their own.
+
+    Examples -------------------------------------------------------------------
+
+    Running a directory, at most four files at a time, giving up on any file
+    that takes longer than an hour:
+
+    run = AsyncRunningShoes('/path/to/pipeline', parallel = True)
+    asyncio.run(run.arun(concurrency = 4, timeout = 60 * 60))
+    """
+
+
+    async def pump_stream(self, stream, log, tee):
+        """Copy a subprocess's output stream into a log, a chunk at a time.
+        """
+        while True:
+            data = await stream.read(CHUNK_SIZE)
+            if not data:
+                return None
+            log.write(data)
+            if tee is not None:
+                tee.write(data)
+                tee.flush()
+
+
+    async def supervise(self, process, pumps):
+        """Wait for a process to exit while its output is pumped into its log,
+        then give the pumps at most DRAIN_TIMEOUT seconds to finish, so that
+        anything the process left running in the background holding its
+        output open cannot hold us up. Its returncode is known as soon as it
+        has exited, but process.wait also waits for its output to be closed,
+        so it is polled for instead.
+        """
+        pumps = [asyncio.ensure_future(pump) for pump in pumps]
+        try:
+            while process.returncode is None:
+                await asyncio.sleep(EXIT_POLL)
+            _, pending = await asyncio.wait(pumps, timeout = DRAIN_TIMEOUT)
+            if pending:
+                # -- stop reading output that something else still holds open;
+                # -- asyncio has no public way to close a process's pipes
+                process._transport.close()
+        finally:
+            for pump in pumps:
+                pump.cancel()
+        return None
+
+
+    async def arun_file(self, file_name, timeout = None):
+        """Runs a file, using its extension to determine how to run it, and
+        returns its returncode, along with what its cgroup accounted for if
+        it was run in one (see the confine method). When logs is set, the
+        file's stdout and stderr are streamed into its log.
+
+        The file runs in its own session, and if it takes longer than timeout
+        seconds, or the coroutine is cancelled, its whole process group is
+        killed before StepTimeout or asyncio.CancelledError is raised. A
+        directory is run as a sub-pipeline in a worker thread.
+        """
+        if os.path.isdir(file_name):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.run_subpipeline, file_name)
+        filename, file_extension = os.path.splitext(file_name)
+        call, cgroup = self.confine(file_name, self.extensions[
+            file_extension] + [file_name])
+        log = self.open_log(file_name) if self.logs is not None else None
+        output = asyncio.subprocess.PIPE if log is not None else None
+        try:
+            spawning = time.monotonic_ns()
+            process = await asyncio.create_subprocess_exec(
+                *call, stdout = output, stderr = output,
+                env = self.environment(), start_new_session = True)
+            timing = self.spawn_timing(spawning)
+            if log is not None:
+                tee_stdout, tee_stderr = self.tees()
+                waiting = self.supervise(process, [
+                    self.pump_stream(process.stdout, log, tee_stdout),
+                    self.pump_stream(process.stderr, log, tee_stderr)])
+            else:
+                waiting = process.wait()
+            try:
+                await asyncio.wait_for(waiting, timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise StepTimeout('{} timed out after {} seconds!'.format(
+                        file_name, timeout))
+                raise
+            return self.account({'returncode': process.returncode,
+                                 'timing': self.spawn_timing(spawning, log,
+                                                             timing)},
+                                cgroup)
+        finally:
+            if log is not None:
+                log.close()
+            if cgroup is not None:
+                cgroup.remove()
+
+
+    async def arun_step(self, file, timeout = None):
+        """Runs a single file from self.files, recording it in file_data and
+        retrying it just like run_step does. The file's timeout is
+        timeout_for(file) unless timeout is given.
+        """
+        if file in self.skip:
+            return self.skip_step(file)
+        if file in self.streams or file in self.streamed():
+            # -- streaming files are run together, in a worker thread
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.run_step, file)
+        if timeout is None:
+            timeout = self.timeout_for(file)
+        self.begin_step(file)
+        self.file_data['info'][file]['attempts'] = []
+        tries = self.retries_for(file) + 1
+        try:
+            for attempt in range(1, tries + 1):
+                self.begin_attempt(file)
+                try:
+                    self.check_result(file, await self.arun_file(
+                        self.directory + file, timeout))
+                except Exception as e:
+                    self.end_attempt(file, e)
+                    if attempt == tries:
+                        raise
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                    continue
+                self.end_attempt(file)
+                self.end_step(file, {})
+                break
+        except BaseException:
+            self.fail_step(file)
+            raise
+        return None
+
+
+    async def arun_graph(self, dependencies, limiter, timeout = None):
+        """Runs files following a dependency graph, starting each file once
+        every file it depends on has finished and the limiter lets it. What
+        happens when a file fails depends on on_failure, and when files are
+        started depends on the resource pool, just as for run_graph.
+
+        Parameters
+        ----------
+        dependencies : dict
+            maps each file to the files that have to finish before it starts
+
+        limiter : asyncio.Semaphore or similar
+            an async context manager that has to be entered to run a file
+
+        timeout : float (default is each file's timeout_for)
+            how many seconds each file may run for
+        """
+        tasks = {}
+        failures = OrderedDict()
+        broken = set()
+        # -- the reservations of the files waiting on the resource pool, in
+        # -- the order they started waiting
+        waiting = OrderedDict()
+
+        async def reserve(file):
+            request = None
+            if self.resource_pool is not None:
+                request = self.resources_for(file)
+            if request is None:
+                return None
+            waiting[file] = request
+            try:
+                while True:
+                    claimed = []
+                    for f, r in waiting.items():
+                        if f == file:
+                            break
+                        claimed.append(r)
+                    if self.resource_pool.try_reserve(request, claimed):
+                        return request
+                    await asyncio.sleep(RESOURCE_RECHECK / 10)
+            finally:
+                del waiting[file]
+
+        def stopped():
+            return failures and self.on_failure == 'fail-fast'
+
+        async def step(file):
+            await asyncio.gather(*[tasks[d] for d in dependencies[file]])
+            if stopped() or any(d not in self.file_data['info']
+                                for d in dependencies[file]):
+                return None
+            blockers = self.blocked_by(file, broken)
+            if blockers:
+                self.block_step(file, blockers)
+                broken.add(file)
+                return None
+            request = await reserve(file)
+            try:
+                async with limiter:
+                    if stopped():
+                        return None
+                    try:
+                        await self.arun_step(file, timeout)
+                    except Exception as e:
+                        failures[file] = e
+                        broken.add(file)
+            finally:
+                if request is not None:
+                    self.resource_pool.release(request)
+
+        for file in self.topological_order(dependencies):
+            tasks[file] = asyncio.ensure_future(step(file))
+        try:
+            await asyncio.gather(*tasks.values())
+        except asyncio.CancelledError:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions = True)
+            raise
+        self.raise_failures(failures)
+        return None
+
+
+    async def arun(self, incremental = False, resume = False,
+                   concurrency = None, timeout = None, limiter = None,
+                   report = True):
+        """Run all of the files, the asyncio way. See the run method for the
+        incremental and resume parameters.
+
+        Parameters
+        ----------
+        concurrency : int (default is max_workers)
+            the most files to run at the same time
+
+        timeout : float (default is each file's timeout_for)
+            how many seconds each file may run for before it is killed
+
+        limiter : asyncio.Semaphore or similar (default is one made from
+                  concurrency)
+            an async context manager that has to be entered to run a file,
+            for sharing one limit between many pipelines
+
+        report : bool (default is True)
+            whether to print out file_data when the run is finished
+        """
+        if limiter is None:
+            limiter = asyncio.Semaphore(concurrency or self.max_workers)
+        self.prepare_run(incremental, resume)
+        try:
+            await self.arun_graph(self.plan_dependencies(), limiter, timeout)
+        finally:
+            self.finish_run(report)
+        return None
@@ -0,0 +1,316 @@
+from __future__ import division, print_function
+
+"""cgroups.py - CgroupTree and StepCgroup classes, and confine, for running
+each file in a cgroup v2 group of its own.
+"""
+
+import os
+import re
+import signal
+import time
+import uuid
+
+
+# -- where to find the cgroup v2 hierarchy, and which group we are in
+MOUNTS = '/proc/self/mounts'
+SELF_CGROUP = '/proc/self/cgroup'
+
+# -- the controllers that step groups are given, when we are allowed to
+CONTROLLERS = ('memory', 'cpu')
+
+# -- the period, in microseconds, that cpu.max quotas are given over
+CPU_PERIOD = 100000
+
+# -- how long to wait for the processes a file left behind to die
+EMPTY_TIMEOUT = 2.0
+
+
+def cgroup_root():
+    """The directory of the cgroup v2 group we are running in, or None if
+    there is no cgroup v2 hierarchy.
+    """
+    mount = None
+    try:
+        with open(MOUNTS) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 2 and fields[2] == 'cgroup2':
+                    mount = fields[1]
+                    break
+        if mount is None:
+            return None
+        with open(SELF_CGROUP) as f:
+            for line in f:
+                if line.startswith('0::'):
+                    group = line[3:].strip()
+                    path = os.path.join(mount, group.lstrip('/'))
+                    return path if os.path.isdir(path) else None
+    except OSError:
+        pass
+    return None
+
+
+def read_keyed(path):
+    """Read a cgroup file of "key value" lines (such as cpu.stat) into a dict
+    of ints, which is empty if the file cannot be read.
+    """
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and fields[1].isdigit():
+                    values[fields[0]] = int(fields[1])
+    except OSError:
+        pass
+    return values
+
+
+def write(path, value):
+    """Write a value to a cgroup file, returning whether it was written.
+    """
+    try:
+        with open(path, 'w') as f:
+            f.write(value)
+    except OSError:
+        return False
+    return True
+
+
+def ulimit(memory_max):
+    """The shell command that limits the address space to memory_max GB.
+    """
+    return 'ulimit -v {}'.format(max(int(memory_max * 1024 ** 2), 1))
+
+
+def confine(call, cgroup = None, memory_max = None, group_memory_max = None):
+    """Wrap a command so that it starts in the group in the cgroup directory,
+    and/or with its address space limited to memory_max GB (with
+    RLIMIT_AS, by way of ulimit), by running it from a shell that moves
+    itself into the group and sets the limit before exec-ing the command.
+    Since the command only starts once it is in the group, everything it
+    starts is in the group too. If the shell cannot move itself into the
+    group, the command runs without it, with its address space limited to
+    group_memory_max GB instead, the memory limit the group would have
+    enforced.
+    """
+    if cgroup is None and memory_max is None:
+        return list(call)
+    script = 'exec "$@"'
+    if memory_max is not None:
+        script = ulimit(memory_max) + ' && ' + script
+    if cgroup is not None:
+        # -- the kernel can refuse the move (ex. with EACCES or EBUSY), which
+        # -- is no reason not to run the file
+        join = '{ echo $$ > "$0/cgroup.procs"; } 2>/dev/null'
+        if group_memory_max is not None:
+            join += ' || ' + ulimit(group_memory_max)
+        script = join + '; ' + script
+    return ['/bin/sh', '-c', script, cgroup or 'sh'] + list(call)
+
+
+class StepCgroup(object):
+    """A cgroup v2 group that one file runs in, which holds every process the
+    file starts, so that its limits apply to, and its accounting covers, the
+    whole process tree.
+
+    Examples -------------------------------------------------------------------
+
+    cgroup = tree.step('4-train_model.py')
+    memory_max, cpu_max = cgroup.limit(memory_max = 48, cpu_max = 8)
+    process = subprocess.Popen(confine(call, cgroup.path, memory_max))
+    process.wait()
+    usage = cgroup.usage()
+    cgroup.remove()
+    """
+
+
+    def __init__(self, path, controllers):
+        """Initialize a StepCgroup object for an existing group.
+
+        Parameters
+        ----------
+        path : string
+            the group's directory
+
+        controllers : set
+            the controllers enabled for the group
+        """
+        self.path = path
+        self.controllers = controllers
+
+
+    def limit(self, memory_max = None, cpu_max = None):
+        """Limit the group to memory_max GB of memory and cpu_max cores' worth
+        of CPU time, returning whichever of the two could not be set (because
+        its controller is not enabled), or None for each that was set or not
+        given.
+        """
+        if memory_max is not None and 'memory' in self.controllers and \
+                write(os.path.join(self.path, 'memory.max'),
+                      str(int(memory_max * 1024 ** 3))):
+            # -- keep the limit hard, rather than letting it spill into swap
+            write(os.path.join(self.path, 'memory.swap.max'), '0')
+            memory_max = None
+        if cpu_max is not None and 'cpu' in self.controllers and \
+                write(os.path.join(self.path, 'cpu.max'), '{} {}'.format(
+                    max(int(cpu_max * CPU_PERIOD), 1000), CPU_PERIOD)):
+            cpu_max = None
+        return memory_max, cpu_max
+
+
+    def usage(self):
+        """The resources used by everything that ran in the group: user_time
+        and system_time in seconds from cpu.stat, memory_peak in megabytes
+        from memory.peak, and oom_kills from memory.events, for whichever of
+        them the kernel reports. Nothing is reported if nothing ever ran in
+        the group, as happens when a file could not be moved into it (see
+        confine).
+        """
+        usage = {}
+        stat = read_keyed(os.path.join(self.path, 'cpu.stat'))
+        if stat.get('usage_usec') == 0:
+            return usage
+        if 'user_usec' in stat:
+            usage['user_time'] = stat['user_usec'] / 1e6
+            usage['system_time'] = stat['system_usec'] / 1e6
+        try:
+            with open(os.path.join(self.path, 'memory.peak')) as f:
+                usage['memory_peak'] = int(f.read()) / (1024 * 1024)
+        except (OSError, ValueError):
+            pass
+        events = read_keyed(os.path.join(self.path, 'memory.events'))
+        if 'oom_kill' in events:
+            usage['oom_kills'] = events['oom_kill']
+        return usage
+
+
+    def pids(self):
+        """The processes in the group.
+        """
+        try:
+            with open(os.path.join(self.path, 'cgroup.procs')) as f:
+                return [int(pid) for pid in f.read().split()]
+        except (OSError, ValueError):
+            return []
+
+
+    def remove(self):
+        """Kill anything the file left running in the group, and remove the
+        group.
+        """
+        if self.pids() and not write(os.path.join(self.path, 'cgroup.kill'),
+                                     '1'):
+            for pid in self.pids():
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+        deadline = time.time() + EMPTY_TIMEOUT
+        while True:
+            try:
+                os.rmdir(self.path)
+                return None
+            except FileNotFoundError:
+                return None
+            except OSError:
+                if time.time() > deadline:
+                    return None
+                time.sleep(0.01)
+
+
+class CgroupTree(object):
+    """A cgroup v2 group of our own, made inside a parent group, that holds a
+    StepCgroup for each running file. Limits need the memory and cpu
+    controllers to be enabled for the groups in it, which takes a parent
+    delegated to us (ex. by systemd, with Delegate=yes) that already passes
+    them on to its children in its cgroup.subtree_control. Since a group
+    with processes in it cannot pass controllers on (the kernel's "no
+    internal processes" rule), that parent must have no processes in it,
+    so the group we run in will not do; made inside it, files are kept in
+    groups of their own for accounting only. Only groups in the tree are
+    ever changed, never the parent.
+
+    Examples -------------------------------------------------------------------
+
+    tree = CgroupTree.create('/sys/fs/cgroup/user.slice/pipelines')
+    cgroup = tree.step('4-train_model.py')
+    ...
+    tree.destroy()
+    """
+
+
+    def __init__(self, path, controllers):
+        """Initialize a CgroupTree object for an existing group.
+
+        Parameters
+        ----------
+        path : string
+            the group's directory
+
+        controllers : set
+            the controllers enabled for the groups in it
+        """
+        self.path = path
+        self.controllers = controllers
+
+
+    @classmethod
+    def create(cls, parent = None):
+        """Make a new, empty group in parent (default is the group we run
+        in), enabling as many of CONTROLLERS for the groups in it as parent
+        passes on to it, or return None if we cannot make groups there, or
+        parent is given and has processes in it. parent is left as it is,
+        since other processes may depend on its settings.
+        """
+        if parent is None:
+            parent = cgroup_root()
+        elif StepCgroup(parent, set()).pids():
+            return None
+        if parent is None:
+            return None
+        path = os.path.join(parent, 'runningshoes-{}-{}'.format(
+            os.getpid(), uuid.uuid4().hex[:8]))
+        try:
+            os.mkdir(path)
+        except OSError:
+            return None
+        if not os.access(os.path.join(path, 'cgroup.procs'), os.W_OK):
+            os.rmdir(path)
+            return None
+        for controller in CONTROLLERS:
+            # -- fails unless parent passes the controller on to our group
+            write(os.path.join(path, 'cgroup.subtree_control'),
+                  '+' + controller)
+        try:
+            with open(os.path.join(path, 'cgroup.subtree_control')) as f:
+                controllers = set(f.read().split())
+        except OSError:
+            controllers = set()
+        return cls(path, controllers)
+
+
+    def step(self, name):
+        """Make a new StepCgroup in the tree for the file called name, or
+        return None if it cannot be made.
+        """
+        path = os.path.join(self.path, '{}-{}'.format(
+            re.sub(r'[^\w.-]', '_', name), uuid.uuid4().hex[:8]))
+        try:
+            os.mkdir(path)
+        except OSError:
+            return None
+        return StepCgroup(path, self.controllers)
+
+
+    def destroy(self):
+        """Remove the tree, and every group left in it.
+        """
+        try:
+            children = [e.path for e in os.scandir(self.path) if e.is_dir()]
+        except OSError:
+            children = []
+        for child in children:
+            StepCgroup(child, self.controllers).remove()
+        StepCgroup(self.path, self.controllers).remove()
+        return None
@@ -0,0 +1,277 @@
+from __future__ import print_function
+
+"""forkserver.py - ForkServer class, and the server it talks to.
+
+The server is this file run as a script, so that it does not need the
+runningshoes package to be importable by the Python it runs under:
+
+python forkserver.py <response fd> [module to preload ...]
+
+It imports the modules to preload once, then reads one JSON request per line
+on stdin. For each request it forks a child that runs a Python file as
+__main__, and writes one JSON line to the response fd when the child starts
+and another when it exits.
+"""
+
+import atexit
+import json
+import os
+import resource
+import runpy
+import select
+import signal
+import subprocess
+import sys
+import threading
+import traceback
+
+
+class ForkServer(object):
+    """A warm Python interpreter that has already imported a list of modules,
+    and that runs Python files in forked children of itself, so that each file
+    pays neither interpreter startup nor the cost of importing those modules.
+
+    Examples -------------------------------------------------------------------
+
+    server = ForkServer(['python'], preload = ['numpy', 'pandas'])
+    returncode, usage = server.run('/path/to/3-pull_ingest.py')
+    server.close()
+    """
+
+
+    def __init__(self, python = ['python'], preload = ()):
+        """Start the server, and wait for it to finish importing the modules
+        to preload.
+
+        Parameters
+        ----------
+        python : list (default is ['python'])
+            the command used to run the server
+
+        preload : list (default is no modules)
+            the modules to import in the server before any file is run
+        """
+        read_fd, write_fd = os.pipe()
+        self.process = subprocess.Popen(
+            python + [os.path.abspath(__file__), str(write_fd)] +
+            list(preload),
+            stdin = subprocess.PIPE, pass_fds = (write_fd,))
+        os.close(write_fd)
+        self.responses = os.fdopen(read_fd)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.next_id = 0
+        if json.loads(self.responses.readline() or 'null') != 'ready':
+            raise Exception('The fork server failed to start!')
+        self.reader = threading.Thread(target = self.read_responses)
+        self.reader.daemon = True
+        self.reader.start()
+
+
+    def read_responses(self):
+        """Read responses from the server, handing each one to the request it
+        answers, until the server exits.
+        """
+        for line in self.responses:
+            response = json.loads(line)
+            request = self.requests[response['id']]
+            request.update(response)
+            request['started'].set()
+            if 'returncode' in response:
+                request['done'].set()
+        for request in list(self.requests.values()):
+            request['started'].set()
+            request['done'].set()
+        return None
+
+
+    def start(self, file_name, args = (), cwd = None, env = None,
+              stdout = None, stderr = None, process_group = False):
+        """Start running a Python file as __main__ in a forked child of the
+        server, returning a request to pass to the wait method once the child
+        has been forked.
+
+        Parameters
+        ----------
+        file_name : string
+            the Python file to run
+
+        args : list (default is no arguments)
+            the arguments the file sees in sys.argv[1:]
+
+        cwd : string (default is our current working directory)
+            the working directory to run the file in
+
+        env : dict (default is our environment)
+            the environment variables to run the file with
+
+        stdout, stderr : string (default is the server's own)
+            the location of a FIFO, already opened for reading, for the child's
+            stdout or stderr to be written to
+
+        process_group : bool (default is False)
+            whether to put the child in a process group of its own, with the
+            same id as the child
+        """
+        with self.lock:
+            self.next_id += 1
+            request = {'done': threading.Event(), 'started': threading.Event()}
+            self.requests[self.next_id] = request
+            self.process.stdin.write((json.dumps({
+                'id': self.next_id,
+                'file': file_name,
+                'args': list(args),
+                'cwd': cwd or os.getcwd(),
+                'env': dict(os.environ if env is None else env),
+                'stdout': stdout,
+                'stderr': stderr,
+                'process_group': process_group
+            }) + '\n').encode('utf-8'))
+            self.process.stdin.flush()
+            request['id'] = self.next_id
+        request['started'].wait()
+        return request
+
+
+    def wait(self, request):
+        """Wait for a request's child to finish. Returns the child's return
+        code along with its resource usage as a resource.struct_rusage.
+        """
+        request['done'].wait()
+        del self.requests[request['id']]
+        if request.get('returncode') is None:
+            raise Exception('The fork server exited while running a file!')
+        return (request['returncode'],
+                resource.struct_rusage(request['usage']))
+
+
+    def run(self, file_name, **kwargs):
+        """Run a Python file as __main__ in a forked child of the server, and
+        wait for it to finish (see the start and wait methods).
+        """
+        return self.wait(self.start(file_name, **kwargs))
+
+
+    def close(self):
+        """Stop the server once every file it is running has finished.
+        """
+        self.process.stdin.close()
+        self.process.wait()
+        self.reader.join()
+        self.responses.close()
+        return None
+
+
+def run_child(request):
+    """Run a requested file as __main__ in a freshly forked child, and exit
+    with the status the file would have exited with under `python file`.
+    """
+    code = 0
+    try:
+        if request.get('process_group'):
+            os.setpgid(0, 0)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = [request['file']] + request['args']
+        sys.path.insert(0, os.path.dirname(request['file']))
+        runpy.run_path(request['file'], run_name = '__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file = sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(code)
+
+
+def serve(response_fd, preload):
+    """The server's main loop.
+    """
+    for module in preload:
+        try:
+            __import__(module)
+        except ImportError as e:
+            print('runningshoes fork server could not preload {}: {}'.format(
+                module, e), file = sys.stderr)
+    responses = os.fdopen(response_fd, 'w')
+
+    def respond(message):
+        responses.write(json.dumps(message) + '\n')
+        responses.flush()
+
+    # -- wake up the select below whenever a child exits
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    children = {}
+    buffer = b''
+    accepting = True
+    respond('ready')
+    while accepting or children:
+        readable = select.select(
+            [0, wakeup_read] if accepting else [wakeup_read], [], [])[0]
+        if wakeup_read in readable:
+            os.read(wakeup_read, 4096)
+        while children:
+            pid, status, usage = os.wait4(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            respond({'id': children.pop(pid),
+                     'returncode': os.waitstatus_to_exitcode(status),
+                     'usage': list(usage)})
+        if 0 not in readable:
+            continue
+        data = os.read(0, 65536)
+        if not data:
+            accepting = False
+        buffer += data
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            request = json.loads(line.decode('utf-8'))
+            # -- open any FIFOs before forking, so that they are already open
+            # -- for writing by the time the client hears the child started
+            outputs = [(os.open(request[name], os.O_WRONLY), fd)
+                       for name, fd in (('stdout', 1), ('stderr', 2))
+                       if request.get(name)]
+            pid = os.fork()
+            if pid == 0:
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                for fd in (response_fd, wakeup_read, wakeup_write):
+                    os.close(fd)
+                devnull = os.open(os.devnull, os.O_RDONLY)
+                outputs.append((devnull, 0))
+                for source, target in outputs:
+                    os.dup2(source, target)
+                    os.close(source)
+                run_child(request)
+            if request.get('process_group'):
+                # -- set the child's process group from both sides, so that it
+                # -- is in place before the client hears the child started
+                try:
+                    os.setpgid(pid, pid)
+                except OSError:
+                    pass
+            for source, _ in outputs:
+                os.close(source)
+            children[pid] = request['id']
+            respond({'id': request['id'], 'pid': pid})
+    return None
+
+
+if __name__ == '__main__':
+    # -- the server's own directory should not shadow the files' imports
+    del sys.path[0]
+    serve(int(sys.argv[1]), sys.argv[2:])
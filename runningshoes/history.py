@@ -0,0 +1,212 @@
+from __future__ import division, print_function
+
+"""history.py - RunHistory class.
+"""
+
+import os
+import sqlite3
+import statistics
+import time
+
+
+# -- the history database used when no other location is given
+DEFAULT_HISTORY = os.path.join(os.path.expanduser('~'), '.runningshoes',
+                               'history.db')
+
+# -- per-file metrics kept in the history database, all of which are numbers
+# -- taken from a RunningShoes object's file_data; elapsed is in seconds
+METRICS = ('elapsed', 'user_time', 'system_time', 'max_rss', 'block_input',
+           'block_output', 'voluntary_switches', 'involuntary_switches')
+
+# -- metrics that are checked for regressions by default
+REGRESSION_METRICS = ('elapsed', 'max_rss')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    directory TEXT NOT NULL,
+    recorded REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    directory TEXT NOT NULL,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    {metrics}
+);
+CREATE INDEX IF NOT EXISTS steps_directory_step
+    ON steps (directory, step, run_id);
+""".format(metrics = ',\n    '.join(m + ' REAL' for m in METRICS))
+
+
+class RunHistory(object):
+    """A SQLite database of every run's per-file timings and resource usage,
+    indexed by directory and file, used to spot files that have gotten slower
+    or hungrier than they used to be.
+
+    Examples -------------------------------------------------------------------
+
+    Recording runs (RunningShoes does this itself when given a history):
+
+    run = RunningShoes(history = RunHistory())
+    run.run()
+
+    Flagging files whose latest run took more than twice as long, or used more
+    than twice as much memory, as the median of their previous 20 runs:
+
+    history = RunHistory(threshold = 1.0, window = 20)
+    print(history.report(run.directory))
+    """
+
+
+    def __init__(self, path = DEFAULT_HISTORY, threshold = 0.5, window = 10):
+        """Initialize a RunHistory object, creating the database if it does not
+        exist yet.
+
+        Parameters
+        ----------
+        path : string (default is ~/.runningshoes/history.db)
+            where the SQLite database lives
+
+        threshold : float (default is 0.5)
+            how far above its baseline, as a fraction of the baseline, a metric
+            has to be to count as a regression
+
+        window : int (default is 10)
+            how many previous successful runs of a file make up its baseline
+        """
+        self.path = path
+        self.threshold = threshold
+        self.window = window
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+        connection.close()
+
+
+    def connect(self):
+        """Open a connection to the database.
+        """
+        return sqlite3.connect(self.path, timeout = 30)
+
+
+    @staticmethod
+    def status(info):
+        """The status of a file from its entry in file_data['info'].
+        """
+        if info.get('skipped'):
+            return 'skipped'
+        if info.get('blocked_by'):
+            return 'blocked'
+        return 'success' if info['ran'] else 'failure'
+
+
+    @staticmethod
+    def metric(info, metric):
+        """The value of a metric from a file's entry in file_data['info'], or
+        None if it was not recorded.
+        """
+        if metric == 'elapsed':
+            return info.get('timing', {}).get('elapsed')
+        return info.get(metric)
+
+
+    def record(self, runner):
+        """Append the per-file timings and resource usage of a RunningShoes
+        object's last run to the database, returning the id of the run.
+        """
+        with self.connect() as connection:
+            run_id = connection.execute(
+                'INSERT INTO runs (directory, recorded) VALUES (?, ?)',
+                (runner.directory, time.time())).lastrowid
+            for file, info in runner.file_data['info'].items():
+                connection.execute(
+                    'INSERT INTO steps (run_id, directory, step, status, {}) '
+                    'VALUES (?, ?, ?, ?, {})'.format(
+                        ', '.join(METRICS), ', '.join('?' for _ in METRICS)),
+                    [run_id, runner.directory, file, self.status(info)] +
+                    [self.metric(info, m) for m in METRICS])
+        connection.close()
+        return run_id
+
+
+    def last_run(self, directory):
+        """The id of the most recent run recorded for a directory, or None.
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                'SELECT MAX(id) FROM runs WHERE directory = ?',
+                (directory,)).fetchone()
+        connection.close()
+        return row[0]
+
+
+    def baseline(self, directory, step, metric, before = None):
+        """The median of a metric over the last `window` successful runs of a
+        file, only counting runs before the run with id `before` if given, or
+        None if the file has never run successfully.
+        """
+        query = ('SELECT {} FROM steps WHERE directory = ? AND step = ? AND '
+                 "status = 'success' AND {} IS NOT NULL").format(metric, metric)
+        parameters = [directory, step]
+        if before is not None:
+            query += ' AND run_id < ?'
+            parameters.append(before)
+        query += ' ORDER BY run_id DESC LIMIT ?'
+        parameters.append(self.window)
+        with self.connect() as connection:
+            values = [row[0] for row in
+                      connection.execute(query, parameters).fetchall()]
+        connection.close()
+        return statistics.median(values) if values else None
+
+
+    def regressions(self, directory, run_id = None,
+                    metrics = REGRESSION_METRICS):
+        """Compare every file that ran successfully in a run (by default the
+        directory's most recent run) against its baseline, returning a list of
+        dicts describing each metric that is more than `threshold` above it.
+        """
+        if run_id is None:
+            run_id = self.last_run(directory)
+        if run_id is None:
+            return []
+        with self.connect() as connection:
+            rows = connection.execute(
+                'SELECT step, {} FROM steps WHERE run_id = ? AND '
+                "status = 'success' ORDER BY step".format(', '.join(metrics)),
+                (run_id,)).fetchall()
+        connection.close()
+        regressions = []
+        for row in rows:
+            for metric, value in zip(metrics, row[1:]):
+                if value is None:
+                    continue
+                baseline = self.baseline(directory, row[0], metric,
+                                         before = run_id)
+                if baseline and value > baseline * (1 + self.threshold):
+                    regressions.append({
+                        'step': row[0],
+                        'metric': metric,
+                        'value': value,
+                        'baseline': baseline,
+                        'change': value / baseline - 1
+                    })
+        return regressions
+
+
+    def report(self, directory, run_id = None):
+        """Pretty version of regressions to be printed out.
+        """
+        from tabulate import tabulate
+        regressions = self.regressions(directory, run_id)
+        if not regressions:
+            return 'No regressions beyond {:.0%} of baseline.'.format(
+                self.threshold)
+        headers = ['File name', 'Metric', 'Value', 'Baseline', 'Change']
+        return tabulate([[r['step'], r['metric'], r['value'], r['baseline'],
+                          '{:+.0%}'.format(r['change'])]
+                         for r in regressions],
+                        headers = headers, tablefmt = 'psql')
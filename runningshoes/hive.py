@@ -0,0 +1,129 @@
+from __future__ import print_function
+
+"""hive.py - HiveSession class.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import uuid
+
+from .logs import CHUNK_SIZE
+
+
+# -- how a marker line is echoed from inside a Hive CLI script. For Beeline,
+# -- use '!sh echo {}' instead.
+HIVE_MARKER = '!echo {};'
+
+
+class HiveSession(object):
+    """Run many .hql files in a single Hive session, so that they share one
+    JVM startup instead of paying for one each, while still telling when each
+    file starts and finishes.
+
+    The files are concatenated into one script, with a marker echoed before
+    and after each file. The markers are picked out of the session's output
+    as it runs, and everything else it prints is passed through to stdout.
+    Nothing is reset between files, so whatever one file changes in the
+    session, such as the database it USEs, a SET, or a temporary table, is
+    still in effect for the files after it.
+
+    Examples -------------------------------------------------------------------
+
+    session = HiveSession(['hive', '-f'])
+    for event, value in session.run(['2-build_tables.hql', '3-pull.hql']):
+        print(event, value)
+    """
+
+
+    def __init__(self, command = ['hive', '-f'], marker = HIVE_MARKER):
+        """Initialize a HiveSession object.
+
+        Parameters
+        ----------
+        command : list (default is ['hive', '-f'])
+            the command that runs a script, given the script's location
+
+        marker : string (default is HIVE_MARKER)
+            a line of HQL that echoes its one {} placeholder to stdout
+        """
+        self.command = command
+        self.marker = marker
+        self.token = '__runningshoes_{}__'.format(uuid.uuid4().hex[:12])
+        self.pattern = re.compile(
+            r'^' + self.token + r' (start|end) (\d+)\s*$')
+
+
+    @staticmethod
+    def write_stdout(data):
+        """Pass a line of the session's output through to our stdout.
+        """
+        sys.stdout.buffer.write(data)
+        sys.stdout.flush()
+        return None
+
+
+    def script(self, files):
+        """Concatenate files into one script with markers around each file,
+        returning the location of the script.
+        """
+        descriptor, script = tempfile.mkstemp(suffix = '.hql')
+        with os.fdopen(descriptor, 'w') as f:
+            for index, file_name in enumerate(files):
+                with open(file_name) as hql:
+                    contents = hql.read().strip()
+                if contents and not contents.endswith(';'):
+                    contents += '\n;'
+                f.write('\n'.join([
+                    self.marker.format('{} start {}'.format(self.token, index)),
+                    contents,
+                    self.marker.format('{} end {}'.format(self.token, index)),
+                    '']))
+        return script
+
+
+    def run(self, files, output = None, start_new_session = False):
+        """Run files in one session. This is a generator of (event, value)
+        pairs: first ('started', process) with the session's subprocess.Popen
+        object, then ('start', index) and ('end', index) as the file at that
+        index in files starts and finishes, then ('exit', process) once the
+        session has closed its output, leaving the process for the caller to
+        wait for.
+
+        Parameters
+        ----------
+        files : list
+            the .hql files to run, in order
+
+        output : function (default is writing to stdout)
+            called with the bytes of each line the session prints, other than
+            the markers. When given, the session's stderr is merged into its
+            stdout so that both reach it.
+
+        start_new_session : bool (default is False)
+            whether to run the session in its own session and process group
+        """
+        script = self.script(files)
+        if output is None:
+            stderr = None
+            output = self.write_stdout
+        else:
+            stderr = subprocess.STDOUT
+        try:
+            process = subprocess.Popen(self.command + [script],
+                                       stdout = subprocess.PIPE,
+                                       stderr = stderr,
+                                       start_new_session = start_new_session)
+            yield 'started', process
+            for line in iter(lambda: process.stdout.readline(CHUNK_SIZE), b''):
+                match = self.pattern.match(line.decode('utf-8', 'replace'))
+                if match is None:
+                    output(line)
+                else:
+                    yield match.group(1), int(match.group(2))
+            process.stdout.close()
+            yield 'exit', process
+        finally:
+            os.remove(script)
@@ -0,0 +1,157 @@
+from __future__ import print_function
+
+"""index.py - DiscoveryIndex class.
+"""
+
+import json
+import os
+
+
+# -- bump whenever the layout of the index changes, so old indexes are ignored
+INDEX_VERSION = 1
+
+# -- how close, in nanoseconds, an mtime can be to when the index was written
+# -- for a change made just after it to go unnoticed, since some filesystems
+# -- only keep mtimes to the nearest two seconds (FAT) or second (ext3, HFS+)
+RACY_WINDOW = 2 * 10 ** 9
+
+
+class DiscoveryIndex(object):
+    """A small on-disk index of what discovering a directory found, so that
+    a directory on a slow (such as network) filesystem does not have to be
+    listed, nor its files read, every time a RunningShoes is made for it.
+
+    The index keeps the order, name, extension and kind (file or directory)
+    of each entry we run. This listing is only trusted while the directory's
+    mtime, inode and device are the ones it was made with, which changes
+    whenever an entry is added, removed or renamed. Each file's declared
+    options and content hash are also kept, and only trusted while the file's
+    own mtime, size and inode are unchanged, which costs one stat per file
+    instead of reading it. As with git's "racy" index entries, nothing whose
+    mtime is within RACY_WINDOW of when the index was written is trusted,
+    since it could have changed again since without its mtime changing.
+
+    Examples -------------------------------------------------------------------
+
+    index = DiscoveryIndex('/path/to/pipeline/',
+                           '/path/to/pipeline/.runningshoes/index.json')
+    entries = index.entries()  # -- None if the directory has changed
+    """
+
+
+    def __init__(self, directory, path):
+        """Initialize a DiscoveryIndex object, loading the index at path if
+        there is one.
+
+        Parameters
+        ----------
+        directory : string
+            the directory being indexed
+
+        path : string
+            where the index lives
+        """
+        self.directory = directory
+        self.path = path
+        self.dirty = False
+        self.data = None
+        self.written = None
+        try:
+            with open(path) as f:
+                self.data = json.load(f)
+                # -- the filesystem's own clock, at its own granularity
+                self.written = os.fstat(f.fileno()).st_mtime_ns
+        except (OSError, ValueError):
+            pass
+        if not isinstance(self.data, dict) or \
+                self.data.get('version') != INDEX_VERSION:
+            self.data = {'version': INDEX_VERSION, 'directory': None,
+                         'entries': None, 'files': {}}
+
+
+    @staticmethod
+    def signature(path):
+        """What has to stay the same about a file or directory for what we
+        know about it to still be true, or None if it does not exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size, stat.st_ino, stat.st_dev]
+
+
+    def racy(self, signature):
+        """Whether a signature's mtime is too close to when the index was
+        written to tell whether it changed again after that.
+        """
+        return self.written is not None and signature is not None and \
+            signature[0] > self.written - RACY_WINDOW
+
+
+    def entries(self):
+        """The indexed (order, name, extension, is_dir) entries, or None if
+        the directory has changed since they were indexed.
+        """
+        if self.data['entries'] is None or \
+                self.data['directory'] != self.signature(self.directory) or \
+                self.racy(self.data['directory']):
+            return None
+        return [tuple(e) for e in self.data['entries']]
+
+
+    def set_entries(self, entries, signature):
+        """Index a directory's (order, name, extension, is_dir) entries, as
+        found when the directory had the given signature (taken before it was
+        listed, so that a change made while it was being listed is noticed).
+        """
+        self.data['directory'] = signature
+        self.data['entries'] = [list(e) for e in entries]
+        self.dirty = True
+        return None
+
+
+    def lookup(self, path, key):
+        """The indexed value of key ('hash' or 'options') for a file, or None
+        if there is none or the file has changed since it was indexed.
+        """
+        known = self.data['files'].get(path)
+        if known is None or key not in known or \
+                known['signature'] != self.signature(path) or \
+                self.racy(known['signature']):
+            return None
+        return known[key]
+
+
+    def store(self, path, key, value, signature):
+        """Index the value of key for a file that had the given signature
+        before the value was worked out.
+        """
+        if signature is None:
+            return None
+        known = self.data['files'].get(path)
+        if known is None or known['signature'] != signature:
+            known = self.data['files'][path] = {'signature': signature}
+        known[key] = value
+        self.dirty = True
+        return None
+
+
+    def save(self):
+        """Write the index out atomically if anything has changed, ignoring
+        failures, since the index is only ever a shortcut.
+        """
+        if not self.dirty:
+            return None
+        temporary = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(temporary, 'w') as f:
+                json.dump(self.data, f)
+            os.replace(temporary, self.path)
+        except OSError:
+            return None
+        self.dirty = False
+        return None
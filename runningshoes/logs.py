@@ -0,0 +1,158 @@
+from __future__ import print_function
+
+"""logs.py - StepLog class, and pump for streaming output into it.
+"""
+
+import os
+import selectors
+import time
+
+
+# -- the most bytes read from a stream at once, which bounds how much of a
+# -- file's output is ever held in memory
+CHUNK_SIZE = 64 * 1024
+
+# -- once a file's own process has exited, the most seconds spent reading what
+# -- is left in its streams, since a process it left running in the background
+# -- can hold them open for as long as it likes
+DRAIN_TIMEOUT = 0.5
+
+# -- how often, in seconds, to check whether a file's process has exited while
+# -- its streams are quiet
+EXIT_POLL = 0.05
+
+
+class StepLog(object):
+    """A log file for one file's output. Each time a StepLog is opened for a
+    file, the log from its previous run is rotated out of the way, and the log
+    is also rotated whenever it grows past max_bytes, keeping at most
+    `backups` old logs as <path>.1, <path>.2, and so on. When the first
+    output was written is kept in first_output, on the monotonic clock in
+    nanoseconds.
+
+    Examples -------------------------------------------------------------------
+
+    log = StepLog('logs/3-pull_ingest.py.log', max_bytes = 10 * 1024 * 1024)
+    log.write(b'some output')
+    log.close()
+    """
+
+
+    def __init__(self, path, max_bytes = 100 * 1024 * 1024, backups = 5):
+        """Initialize a StepLog object, opening a fresh log at path.
+
+        Parameters
+        ----------
+        path : string
+            where the log lives
+
+        max_bytes : int (default is 100 MB)
+            the size a log can grow to before it is rotated, or 0 for no limit
+
+        backups : int (default is 5)
+            how many rotated logs to keep
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None
+        self.first_output = None
+        self.open()
+
+
+    def open(self):
+        """Rotate any existing log and open a fresh one.
+        """
+        if os.path.exists(self.path):
+            self.rotate()
+        self.file = open(self.path, 'wb')
+        self.size = 0
+        return None
+
+
+    def rotate(self):
+        """Shift <path>.n to <path>.n+1, dropping the oldest, then move the log
+        itself to <path>.1.
+        """
+        if self.backups < 1:
+            os.remove(self.path)
+            return None
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists('{}.{}'.format(self.path, n)):
+                os.replace('{}.{}'.format(self.path, n),
+                           '{}.{}'.format(self.path, n + 1))
+        os.replace(self.path, self.path + '.1')
+        return None
+
+
+    def write(self, data):
+        """Write bytes to the log, rotating it first if they would take it past
+        max_bytes.
+        """
+        if self.first_output is None and data:
+            self.first_output = time.monotonic_ns()
+        if self.max_bytes and self.size and \
+                self.size + len(data) > self.max_bytes:
+            self.file.close()
+            self.open()
+        self.file.write(data)
+        self.size += len(data)
+        return None
+
+
+    def close(self):
+        self.file.close()
+        return None
+
+
+def pump(streams, log, exited = None):
+    """Copy everything written to a set of file descriptors into a log until
+    every one of them is closed, reading whichever is ready at most CHUNK_SIZE
+    bytes at a time so that a chatty file never grows our memory. Once exited
+    says the process writing to them has finished, only what is already
+    waiting in them is read, for at most DRAIN_TIMEOUT seconds, so that
+    anything it left running in the background with them open cannot hold
+    us up.
+
+    Parameters
+    ----------
+    streams : list
+        (file descriptor, tee) pairs, where tee is a binary file object that
+        whatever is read from the file descriptor is also written to, or None
+
+    log : StepLog
+        the log to write everything to
+
+    exited : callable (default is None)
+        returns True once the process writing to the streams has exited, or
+        None to read until every stream is closed
+    """
+    selector = selectors.DefaultSelector()
+    for fd, tee in streams:
+        selector.register(fd, selectors.EVENT_READ, tee)
+    draining = None
+    try:
+        while selector.get_map():
+            if draining is None and exited is not None and exited():
+                draining = time.monotonic() + DRAIN_TIMEOUT
+            if draining is None:
+                ready = selector.select(None if exited is None else EXIT_POLL)
+            else:
+                ready = selector.select(0)
+                if not ready or time.monotonic() > draining:
+                    break
+            for key, _ in ready:
+                try:
+                    data = os.read(key.fd, CHUNK_SIZE)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                log.write(data)
+                if key.data is not None:
+                    key.data.write(data)
+                    key.data.flush()
+    finally:
+        selector.close()
+    return None
@@ -0,0 +1,306 @@
+from __future__ import division, print_function
+
+"""orchestrate.py - Orchestrator and FairLimiter classes.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+import glob
+import os
+
+from .asyncrun import AsyncRunningShoes
+
+
+class FairLimiter(object):
+    """Shares a fixed number of slots between many pipelines. Whenever a slot
+    frees up and more than one pipeline is waiting for one, it goes to the
+    waiting pipeline with the fewest slots already, and ties go to whichever
+    pipeline was served least recently, so a pipeline with many files ready to
+    run cannot starve the others.
+
+    Examples -------------------------------------------------------------------
+
+    limiter = FairLimiter(8)
+    async with limiter.slot('/pipelines/a/'):
+        ...
+    """
+
+
+    def __init__(self, capacity):
+        """Initialize a FairLimiter object.
+
+        Parameters
+        ----------
+        capacity : int
+            how many slots there are to share
+        """
+        self.capacity = capacity
+        self.running = {}
+        self.waiting = OrderedDict()
+
+
+    def in_use(self):
+        """How many slots are taken.
+        """
+        return sum(self.running.values())
+
+
+    async def acquire(self, key):
+        """Wait for a slot for the pipeline called key.
+        """
+        if not self.waiting and self.in_use() < self.capacity:
+            self.running[key] = self.running.get(key, 0) + 1
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(key)
+            raise
+        return None
+
+
+    def release(self, key):
+        """Give back a slot held by the pipeline called key.
+        """
+        self.running[key] -= 1
+        self.dispatch()
+        return None
+
+
+    def dispatch(self):
+        """Hand free slots to waiting pipelines, fewest slots held first.
+        """
+        while self.waiting and self.in_use() < self.capacity:
+            key = min(self.waiting, key = lambda k: self.running.get(k, 0))
+            future = self.waiting[key].popleft()
+            if self.waiting[key]:
+                self.waiting.move_to_end(key)
+            else:
+                del self.waiting[key]
+            if future.cancelled():
+                continue
+            self.running[key] = self.running.get(key, 0) + 1
+            future.set_result(None)
+        return None
+
+
+    def slot(self, key):
+        """An async context manager holding one slot for the pipeline called
+        key, for passing to AsyncRunningShoes.arun as its limiter.
+        """
+        return Slot(self, key)
+
+
+class Slot(object):
+    """One pipeline's view of a FairLimiter (see FairLimiter.slot).
+    """
+
+
+    def __init__(self, limiter, key):
+        self.limiter = limiter
+        self.key = key
+
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.key)
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        self.limiter.release(self.key)
+        return False
+
+
+class Orchestrator(object):
+    """Run many pipeline directories at once from a single process, sharing
+    one budget of running files between them fairly (see FairLimiter), and
+    report on all of them together.
+
+    Examples -------------------------------------------------------------------
+
+    Running every pipeline under /pipelines, at most 16 files at a time
+    across all of them, with the files in each pipeline run in stages:
+
+    orchestrator = Orchestrator(['/pipelines/*'], max_workers = 16,
+                                parallel = True)
+    orchestrator.run()
+    """
+
+
+    def __init__(self, directories, max_workers = None, **options):
+        """Initialize an Orchestrator object, setting up an AsyncRunningShoes
+        for every directory. A directory that cannot be set up (for example,
+        because it has two files with the same prefix) is recorded in errors
+        rather than stopping the rest.
+
+        Parameters
+        ----------
+        directories : list
+            the directories to run, any of which may be a glob pattern
+
+        max_workers : int (default is the number of CPUs)
+            the most files to run at the same time, across every directory
+
+        options
+            passed on to each directory's AsyncRunningShoes. When resources
+            or capacity is given, every directory reserves from one shared
+            ResourcePool. When logs is a directory, each directory's logs go
+            in a directory of their own inside it, named after the directory
+            (see short_names), and when trace is a path, each directory's
+            trace goes next to it, with the name added, so that no two
+            directories write to the same place.
+        """
+        self.directories = self.expand_directories(directories)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        capacity = options.get('capacity')
+        if options.get('resources') or capacity is not None:
+            from .resources import ResourcePool
+            if not isinstance(capacity, ResourcePool):
+                options['capacity'] = ResourcePool(**(capacity or {}))
+        self.runners = OrderedDict()
+        self.errors = OrderedDict()
+        names = self.short_names(self.directories)
+        for directory in self.directories:
+            own = dict(options)
+            if options.get('logs') not in (None, True, False):
+                own['logs'] = os.path.join(options['logs'], names[directory])
+            if options.get('trace') not in (None, True, False):
+                base, extension = os.path.splitext(options['trace'])
+                own['trace'] = '{}-{}{}'.format(base, names[directory],
+                                                extension)
+            try:
+                self.runners[directory] = AsyncRunningShoes(directory, **own)
+            except Exception as e:
+                self.errors[directory] = e
+        self.file_data = OrderedDict(
+            (d, r.file_data) for d, r in self.runners.items())
+
+
+    @staticmethod
+    def expand_directories(directories):
+        """Expand any glob patterns in a list of directories, dropping anything
+        that is not a directory and any duplicates. Raises an Exception naming
+        every directory or pattern that does not match a directory, since it
+        is most likely a typo.
+        """
+        if isinstance(directories, str):
+            directories = [directories]
+        expanded = []
+        unmatched = []
+        for pattern in directories:
+            matched = False
+            for directory in sorted(glob.glob(os.path.expanduser(pattern))):
+                directory = AsyncRunningShoes.ensure_trailing_slash(
+                    os.path.abspath(directory))
+                if not os.path.isdir(directory):
+                    continue
+                matched = True
+                if directory not in expanded:
+                    expanded.append(directory)
+            if not matched:
+                unmatched.append(pattern)
+        if unmatched:
+            raise Exception('No directory matches {}!'.format(
+                ', '.join(unmatched)))
+        return expanded
+
+
+    @staticmethod
+    def short_names(directories):
+        """A short name for each directory that is unique among them, as a
+        dict: its base name, unless another directory shares it, in which
+        case its whole path with the separators replaced.
+        """
+        bases = [os.path.basename(os.path.normpath(d)) for d in directories]
+        names = {}
+        for directory, base in zip(directories, bases):
+            if bases.count(base) > 1:
+                base = os.path.normpath(directory).strip(os.sep).replace(
+                    os.sep, '_')
+            names[directory] = base
+        return names
+
+
+    async def arun(self, incremental = False, resume = False,
+                   timeout = None):
+        """Run every directory at once, the asyncio way. A directory that fails
+        does not stop the others; its error is recorded in errors.
+
+        Parameters
+        ----------
+        incremental : bool (default is False)
+            passed on to each AsyncRunningShoes.arun
+
+        resume : bool (default is False)
+            passed on to each AsyncRunningShoes.arun, so that each directory
+            resumes its own last run
+
+        timeout : float (default is each file's own timeout)
+            how many seconds each file may run for before it is killed
+        """
+        limiter = FairLimiter(self.max_workers)
+        directories = list(self.runners)
+        results = await asyncio.gather(
+            *[self.runners[d].arun(incremental = incremental,
+                                   resume = resume, timeout = timeout,
+                                   limiter = limiter.slot(d),
+                                   report = False)
+              for d in directories],
+            return_exceptions = True)
+        for directory, result in zip(directories, results):
+            if isinstance(result, BaseException):
+                self.errors[directory] = result
+        return None
+
+
+    def format_file_data(self):
+        """Every directory's formatted file_data, as one list of lists with the
+        directory in the first column.
+        """
+        results = []
+        for directory, runner in self.runners.items():
+            for row in runner.format_file_data():
+                results.append([directory] + row)
+        return results
+
+
+    def pretty_file_data(self):
+        """Pretty version of every directory's file_data to be printed out,
+        followed by any directories that failed.
+        """
+        from tabulate import tabulate
+        headers = ['Directory'] + AsyncRunningShoes.file_data_headers()
+        pretty = tabulate(self.format_file_data(), headers = headers,
+                          tablefmt = 'psql')
+        if self.errors:
+            pretty += '\n' + tabulate(
+                [[d, '{}: {}'.format(type(e).__name__, e)]
+                 for d, e in self.errors.items()],
+                headers = ['Directory', 'Error'], tablefmt = 'psql')
+        return pretty
+
+
+    def __str__(self):
+        return self.pretty_file_data()
+
+
+    __repr__ = __str__
+
+
+    def run(self, incremental = False, resume = False, timeout = None):
+        """Run every directory, print out the combined report, and raise an
+        Exception if any directory failed. See the arun method for the
+        parameters.
+        """
+        try:
+            asyncio.run(self.arun(incremental = incremental,
+                                  resume = resume, timeout = timeout))
+        finally:
+            print(self.pretty_file_data())
+        if self.errors:
+            raise Exception('{} of {} directories failed!'.format(
+                len(self.errors), len(self.directories)))
+        return None
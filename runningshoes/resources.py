@@ -0,0 +1,203 @@
+from __future__ import division, print_function
+
+"""resources.py - ResourcePool class, and helpers for reading how busy the
+machine is.
+"""
+
+import os
+import re
+import threading
+
+
+# -- where Linux reports how much memory there is, and how much is available
+MEMINFO = '/proc/meminfo'
+
+# -- memory sizes may be given with a suffix; without one they are in GB
+MEMORY_SIZE = re.compile(r'^\s*([0-9.]+)\s*([kmgt]?)i?b?\s*$', re.IGNORECASE)
+MEMORY_UNITS = {'k': 1 / 1024 ** 2, 'm': 1 / 1024, 'g': 1, 't': 1024, '': 1}
+
+# -- the guardrails: no file is started while the machine's load average plus
+# -- the file's cores would be over LOAD_LIMIT times the cores there are, or
+# -- while less than MEMORY_FLOOR of the memory there is would be available
+LOAD_LIMIT = 1.25
+MEMORY_FLOOR = 0.05
+
+
+def read_meminfo(field):
+    """A field (ex. 'MemAvailable') from /proc/meminfo, in GB, or None if it
+    cannot be read.
+    """
+    try:
+        with open(MEMINFO) as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name == field:
+                    return int(value.split()[0]) / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def memory_total():
+    """How much memory the machine has, in GB, or None if it is not known.
+    """
+    return read_meminfo('MemTotal')
+
+
+def memory_available():
+    """How much memory could be used right now without swapping, in GB, or
+    None if it is not known.
+    """
+    return read_meminfo('MemAvailable')
+
+
+def load_average():
+    """The machine's load average over the last minute, or None if it is not
+    known.
+    """
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def parse_memory(value):
+    """Parse an amount of memory, such as 16, '16', '16G' or '512MB', into GB.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = MEMORY_SIZE.match(str(value))
+    if match is None:
+        raise ValueError('Invalid amount of memory {!r}!'.format(value))
+    return float(match.group(1)) * MEMORY_UNITS[match.group(2).lower()]
+
+
+class ResourcePool(object):
+    """The cores and memory of a machine, handed out to running files so that
+    the files running at the same time never reserve more than there is.
+
+    A request is a (cores, memory in GB, exclusive) tuple. A request fits when
+    its cores and memory fit alongside everything already reserved, and when
+    it is not exclusive and nothing exclusive is running; an exclusive request
+    only fits when nothing else is running. Requests for more than the pool
+    has are cut down to the whole pool, and any request fits an idle pool, so
+    that every file gets to run eventually.
+
+    With guardrails on, a request also has to fit what the machine says is
+    free right now: its memory has to be available in /proc/meminfo, and the
+    load average has to leave room for its cores (see LOAD_LIMIT and
+    MEMORY_FLOOR), so that work from outside the pool is taken into account.
+
+    Reserving and releasing are thread-safe, so one pool can be shared by the
+    runs of many pipelines.
+
+    Examples -------------------------------------------------------------------
+
+    pool = ResourcePool(cores = 32, memory = 128)
+    request = (4, 16, False)
+    if pool.try_reserve(request):
+        ...
+        pool.release(request)
+    """
+
+
+    def __init__(self, cores = None, memory = None, guardrails = True):
+        """Initialize a ResourcePool object.
+
+        Parameters
+        ----------
+        cores : float (default is the number of CPUs)
+            how many cores there are to hand out
+
+        memory : float (default is the machine's total memory)
+            how many GB of memory there are to hand out, or None for no limit
+            if the machine's memory is not known
+
+        guardrails : bool (default is True)
+            whether to also check the machine's available memory and load
+            average before handing anything out
+        """
+        self.cores = cores or os.cpu_count() or 1
+        self.memory = memory or memory_total()
+        self.guardrails = guardrails
+        self.reserved_cores = 0
+        self.reserved_memory = 0
+        self.holders = 0
+        self.exclusive = False
+        self.lock = threading.Lock()
+
+
+    def clamp(self, request):
+        """Cut a request down to what the pool has in all.
+        """
+        cores, memory, exclusive = request
+        cores = min(cores, self.cores)
+        if self.memory is not None:
+            memory = min(memory, self.memory)
+        return cores, memory, exclusive
+
+
+    def fits(self, request, claimed = ()):
+        """Whether a request could be reserved right now, while leaving room
+        for the claimed requests (those of files ahead of it in line), so
+        that smaller files behind a big one cannot keep it waiting forever.
+        """
+        if self.holders == 0:
+            return True
+        cores, memory, exclusive = self.clamp(request)
+        claimed = [self.clamp(c) for c in claimed]
+        if exclusive or self.exclusive or any(c[2] for c in claimed):
+            return False
+        cores_needed = self.reserved_cores + cores + sum(c[0] for c in claimed)
+        memory_needed = self.reserved_memory + memory + \
+            sum(c[1] for c in claimed)
+        if cores_needed > self.cores:
+            return False
+        if self.memory is not None and memory_needed > self.memory:
+            return False
+        if self.guardrails:
+            available = memory_available()
+            if available is not None and self.memory is not None and \
+                    available - memory < self.memory * MEMORY_FLOOR:
+                return False
+            load = load_average()
+            if load is not None and cores and \
+                    max(load, self.reserved_cores) + cores > \
+                    self.cores * LOAD_LIMIT:
+                return False
+        return True
+
+
+    def reserve(self, request):
+        """Reserve a request, whether or not it fits.
+        """
+        cores, memory, exclusive = self.clamp(request)
+        self.reserved_cores += cores
+        self.reserved_memory += memory
+        self.exclusive = self.exclusive or exclusive
+        self.holders += 1
+        return None
+
+
+    def try_reserve(self, request, claimed = ()):
+        """Reserve a request if it fits (see the fits method), returning
+        whether it was reserved.
+        """
+        with self.lock:
+            if not self.fits(request, claimed):
+                return False
+            self.reserve(request)
+        return True
+
+
+    def release(self, request):
+        """Give back a reserved request.
+        """
+        cores, memory, exclusive = self.clamp(request)
+        with self.lock:
+            self.reserved_cores -= cores
+            self.reserved_memory -= memory
+            if exclusive:
+                self.exclusive = False
+            self.holders -= 1
+        return None
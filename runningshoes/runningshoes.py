@@ -3,12 +3,198 @@ from __future__ import division, print_function
 """runningshoes.py - RunningShoes class.
 """
 
-import csv
+from collections import OrderedDict
+import contextlib
+import hashlib
+import heapq
+import json
 import os
+import re
+import signal
+import stat
 import subprocess
-from tabulate import tabulate
+import sys
+import threading
 import time
 
+from .index import DiscoveryIndex
+
+# -- everything that only some runs need (the thread pool, reporting, run
+# -- history, the fork server, Hive sessions, logs and watching) is imported
+# -- where it is used, so that importing runningshoes, and so starting the
+# -- command-line utility, stays fast
+
+
+# -- an optional JSON file in the directory declaring each file's options
+MANIFEST_NAME = 'runningshoes.json'
+
+# -- a directory inside the directory being run where state is kept between runs
+STATE_DIRECTORY = '.runningshoes'
+
+# -- the environment variable that tells a pair of streaming files where the
+# -- named pipe between them is
+STREAM_VARIABLE = 'RUNNINGSHOES_STREAM'
+
+# -- resources used by each file's process, as recorded in file_data, and the
+# -- column headers they are shown under in pretty_file_data; memory_peak is
+# -- only recorded for files run in a cgroup of their own
+RESOURCE_COLUMNS = [
+    ('user_time', 'CPU user'),
+    ('system_time', 'CPU sys'),
+    ('max_rss', 'Peak RSS (MB)'),
+    ('memory_peak', 'Group peak (MB)'),
+    ('block_input', 'Blocks in'),
+    ('block_output', 'Blocks out'),
+    ('voluntary_switches', 'Vol ctx sw'),
+    ('involuntary_switches', 'Invol ctx sw')
+]
+
+# -- options that may be declared in a file's leading comments, like so:
+# --     # needs: 2-build_tables
+STEP_OPTIONS = ('needs', 'inputs', 'outputs', 'timeout', 'retries', 'stream',
+                'cores', 'memory', 'exclusive', 'memory_max', 'cpu_max')
+HEADER_LINES = 30
+HEADER_OPTION = re.compile(r'^\s*(?:#|--|//)\s*(' + '|'.join(STEP_OPTIONS) +
+                           r')\s*:\s*(.*?)\s*$')
+
+# -- options that reserve part of the machine for a file while it runs
+RESOURCE_OPTIONS = ('cores', 'memory', 'exclusive')
+
+# -- options that limit what a file may use while it runs
+LIMIT_OPTIONS = ('memory_max', 'cpu_max')
+
+# -- how often to look at the machine again while files are waiting on the
+# -- resource pool's guardrails
+RESOURCE_RECHECK = 1.0
+
+# -- how long a timed out file's processes get to exit after SIGTERM before
+# -- they are sent SIGKILL
+KILL_GRACE = 10
+
+
+# -- what to do when a file fails: stop starting new files, keep running the
+# -- files that do not depend on it, or keep running everything
+FAILURE_POLICIES = ('fail-fast', 'continue-independent', 'continue')
+
+
+class StepFailed(Exception):
+    """Raised when a file fails, such as by exiting with a non-zero exit code.
+    """
+
+
+    def __init__(self, message, file = None, returncode = None):
+        Exception.__init__(self, message)
+        self.file = file
+        self.returncode = returncode
+
+
+class StepTimeout(StepFailed):
+    """Raised when a file runs for longer than its timeout.
+    """
+    pass
+
+
+class PipelineFailed(Exception):
+    """Raised at the end of a run that carried on past failures, with the
+    error from each file that failed in failures.
+    """
+
+
+    def __init__(self, failures):
+        Exception.__init__(self, '{} file(s) failed: {}'.format(
+            len(failures), ', '.join(failures)))
+        self.failures = failures
+
+
+class Watchdog(object):
+    """Kill a process group if it is still running after a timeout, sending
+    SIGTERM and then, KILL_GRACE seconds later, SIGKILL. Used as a context
+    manager around waiting for the process, it also kills the group if the
+    wait is interrupted by an exception, and raises StepTimeout on the way out
+    if the timeout passed.
+
+    Examples -------------------------------------------------------------------
+
+    process = subprocess.Popen(call, start_new_session = True)
+    with Watchdog(process.pid, 600, '3-pull_ingest.py'):
+        process.wait()
+    """
+
+
+    def __init__(self, pid, timeout, name):
+        """Initialize a Watchdog object, starting the clock.
+
+        Parameters
+        ----------
+        pid : int
+            the id of the process group to kill, or None to kill nothing
+
+        timeout : float
+            how many seconds the process group may run for, or None for no
+            limit
+
+        name : string
+            what the process is running, for the StepTimeout message
+        """
+        self.pid = pid
+        self.name = name
+        self.expired = False
+        self.finished = threading.Event()
+        self.timer = None
+        self.arm(timeout)
+
+
+    def arm(self, timeout):
+        """Restart the clock with a new timeout, or None for no limit.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timeout = timeout
+        self.timer = None
+        if timeout is not None:
+            self.timer = threading.Timer(timeout, self.expire)
+            self.timer.daemon = True
+            self.timer.start()
+        return None
+
+
+    def kill(self, signum):
+        """Send a signal to the process group, if it is still around.
+        """
+        if self.pid is None:
+            return None
+        try:
+            os.killpg(self.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+        return None
+
+
+    def expire(self):
+        """Kill the process group because the timeout has passed.
+        """
+        self.expired = True
+        self.kill(signal.SIGTERM)
+        if not self.finished.wait(KILL_GRACE):
+            self.kill(signal.SIGKILL)
+        return None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.kill(signal.SIGKILL)
+        self.finished.set()
+        if self.timer is not None:
+            self.timer.cancel()
+        if exc_type is None and self.expired:
+            raise StepTimeout('{} timed out after {} seconds!'.format(
+                self.name, self.timeout))
+        return False
+
 
 class RunningShoes(object):
     """Run all of the files in a directory with a prefix of <integer>- in the
@@ -47,10 +233,112 @@ class RunningShoes(object):
 
     print run.default_extensions()  # -- see the defaults
     print run.extensions()  # -- see the defaults + any custom extensions
+
+    Running files that share an integer prefix at the same time, with at most
+    four files running at once:
+
+    run = RunningShoes(parallel = True, max_workers = 4)
+
+    Running each file as soon as the files it needs have finished, using the
+    `needs`, `inputs` and `outputs` declared in its leading comments or in a
+    runningshoes.json manifest:
+
+    run = RunningShoes(graph = True)
+
+    Only running the files that have changed, or that depend on something that
+    has changed, since they last ran successfully:
+
+    run.run(incremental = True)
+
+    Picking up where a failed run left off, without re-running the files that
+    already ran successfully:
+
+    run.resume()
+
+    Keeping every run's timings in a SQLite database, and flagging files that
+    have gotten much slower or hungrier than usual:
+
+    run = RunningShoes(history = '~/.runningshoes/history.db')
+
+    Running .py files in forked children of a warm Python interpreter that has
+    already imported numpy and pandas:
+
+    run = RunningShoes(warm_python = True, preload = ['numpy', 'pandas'])
+
+    Running consecutive .hql files in one Hive session instead of starting a
+    new JVM for each, which the files have to be written for, since anything
+    one of them changes in the session (USE, SET, temporary tables) carries
+    over into the files after it:
+
+    run = RunningShoes(batch_hql = True)
+
+    Capturing each file's stdout and stderr in its own log, in
+    .runningshoes/logs, while still showing it on the terminal:
+
+    run = RunningShoes(logs = True, tee = True)
+
+    Killing any .hql file that runs for over an hour, and retrying
+    3-pull_ingest.py up to twice, waiting 30 and then 60 seconds in between:
+
+    run = RunningShoes(timeouts = {'.hql': 3600},
+                       retries = {'3-pull_ingest': 2}, backoff = 30)
+
+    Carrying on with the files that do not depend on a file that failed:
+
+    run = RunningShoes(graph = True, on_failure = 'continue-independent')
+
+    Seeing what a run would do, without running anything:
+
+    run.dry_run()
+
+    Streaming a file's output straight into the next file, which runs at the
+    same time, by declaring `# stream: stdout` (or `# stream: <path>` for a
+    named pipe) in its leading comments. With 1-extract.sh declaring
+    `# stream: stdout`, 2-load.py reads 1-extract.sh's output from its stdin:
+
+    run = RunningShoes()
+
+    Running up to 32 cores' and 120 GB's worth of files at a time, where
+    4-train_model.py declares `# cores: 8` and `# memory: 48` and .hql files
+    each reserve 2 cores, and never running 5-reindex.sh alongside anything:
+
+    run = RunningShoes(graph = True, capacity = {'cores': 32, 'memory': 120},
+                       resources = {'.hql': {'cores': 2},
+                                    '5-reindex': {'exclusive': True}})
+
+    Running each file in a cgroup of its own, inside a group delegated to us,
+    so that 4-train_model.py, which declares `# memory_max: 64`, is killed if
+    it uses over 64 GB rather than taking down everything else:
+
+    run = RunningShoes(graph = True,
+                       cgroups = '/sys/fs/cgroup/user.slice/pipelines')
+
+    Writing each run out as a timeline, to .runningshoes/trace.json, that can
+    be opened in Perfetto (see Tracer):
+
+    run = RunningShoes(parallel = True, trace = True)
+
+    Letting files hand data to each other in shared memory (see
+    runningshoes.artifacts) instead of writing it to disk:
+
+    run = RunningShoes(artifacts = True)
+
+    A directory with a prefix, such as 3-ingest/, is a sub-pipeline: its own
+    prefixed files are run (with the same settings) as one step, which can run
+    alongside its siblings like any other file, and whose timings and resource
+    usage roll up into that step in file_data and the report.
     """
 
 
-    def __init__(self, directory = os.getcwd(), custom_extensions = None):
+    def __init__(self, directory = os.getcwd(), custom_extensions = None,
+                 parallel = False, max_workers = None, graph = False,
+                 history = None, warm_python = False, preload = (),
+                 batch_hql = False, hql_marker = None, logs = None,
+                 tee = False, log_max_bytes = 100 * 1024 * 1024,
+                 log_backups = 5, timeouts = None, retries = None,
+                 backoff = 1.0, on_failure = 'fail-fast', cache = True,
+                 artifacts = False, resources = None, capacity = None,
+                 cgroups = False, limits = None, trace = None):
         """Initialize a RunFiles object, setting up all of the necessary
         variables. Custom extensions will overwrite the default extensions with
         the same key.
@@ -64,9 +352,207 @@ class RunningShoes(object):
             Keys are extensions (ex. .'sh') and values are the terminal commands
             to run those programs (ex. ['bash']) contained in lists. Defaults
             are provided in the default_extensions method. Any
+
+        parallel : bool (default is False)
+            when True, files that share an integer prefix form a stage and are
+            run at the same time, and the next stage starts only once every
+            file in the current stage has finished. When False, files sharing
+            a prefix are an error.
+
+        max_workers : int (default is the number of CPUs)
+            the most files to run at the same time when parallel or graph is
+            True; the files in a stage larger than this wait for a free worker
+
+        graph : bool (default is False)
+            when True, files are run as soon as the files they depend on have
+            finished instead of in strict prefix order. See the dependencies
+            method for how dependencies are declared.
+
+        history : string or RunHistory (default is None)
+            a RunHistory, or the path to its SQLite database, that every run's
+            per-file timings and resource usage are appended to. The history is
+            also used to estimate how long each file takes when scheduling.
+
+        warm_python : bool (default is False)
+            when True, .py files are run as __main__ in forked children of a
+            single long-lived Python interpreter (see ForkServer), started with
+            the command for .py files, instead of in a fresh interpreter each.
+            Each file runs with /dev/null as its stdin.
+
+        preload : list (default is no modules)
+            modules for the warm interpreter to import once, up front, so that
+            .py files importing them get them for free
+
+        batch_hql : bool (default is False)
+            when True, each run of consecutive .hql files is run in a single
+            Hive session, using the command for .hql files, rather than with
+            one session per file (see HiveSession). Off by default, since
+            the files then share the session's state: a USE, SET or
+            temporary table in one file carries over into the files after
+            it. Only applies when files are run sequentially, and never to
+            files with retries.
+
+        hql_marker : string (default is HIVE_MARKER)
+            a line of HQL that echoes its {} placeholder, used to tell when each
+            file in a Hive session starts and finishes. The default works with
+            the Hive CLI; use '!sh echo {}' with Beeline.
+
+        logs : string or bool (default is None)
+            a directory to capture each file's stdout and stderr in, as
+            <file name>.log, or True for .runningshoes/logs in the directory.
+            Output is streamed into the logs as it is written (see StepLog).
+            When None, files write straight to our own stdout and stderr.
+
+        tee : bool (default is False)
+            when capturing logs, also pass each file's output through to our
+            own stdout and stderr as it is written
+
+        log_max_bytes : int (default is 100 MB)
+            the size a log can grow to before it is rotated
+
+        log_backups : int (default is 5)
+            how many rotated logs to keep for each file
+
+        timeouts : dict (default is no timeouts)
+            how many seconds files may run for before their whole process group
+            is killed and StepTimeout is raised. Keys are file names (with or
+            without their extension), extensions (ex. '.hql'), or '*' for every
+            other file. A `# timeout:` declared by a file takes precedence.
+
+        retries : dict (default is no retries)
+            how many more times to try files that fail, keyed like timeouts. A
+            `# retries:` declared by a file takes precedence.
+
+        backoff : float (default is 1.0)
+            how many seconds to wait before the first retry of a file, doubling
+            with each retry after that
+
+        on_failure : string (default is 'fail-fast')
+            what to do once a file has failed (exited with a non-zero exit
+            code, timed out, or could not be run). 'fail-fast' starts no new
+            files and raises the file's error once the files already running
+            have finished. 'continue-independent' carries on with every file
+            that does not depend on a failed file (see the dependencies
+            method), recording the rest as blocked. 'continue' carries on with
+            every file. Both of the latter raise PipelineFailed at the end.
+
+        cache : bool (default is True)
+            whether to keep what discovering the directory found (each file's
+            order, extension, declared options and content hash) in
+            .runningshoes/index.json, so that the directory does not have to
+            be listed again until it changes (see DiscoveryIndex)
+
+        artifacts : bool (default is False)
+            whether to give each run an ArtifactStore, in shared memory, that
+            its files can publish data to and read data from by name with
+            runningshoes.artifacts. The store is removed when the run ends.
+
+        resources : dict (default is no reservations)
+            what files reserve from the machine while they run when parallel
+            or graph is True, keyed like timeouts, with dicts of 'cores',
+            'memory' (in GB, or with a suffix such as '512M') and 'exclusive'
+            (run alone) as values. A `# cores:`, `# memory:` or
+            `# exclusive:` declared by a file takes precedence. Files are only
+            started once their reservation fits (see ResourcePool); a file
+            that reserves nothing else reserves one core.
+
+        capacity : dict or ResourcePool (default is the whole machine)
+            the 'cores' and 'memory' (in GB) there are to reserve from, and
+            'guardrails', whether to also hold files back while the machine's
+            available memory or load average says it is busy (default is
+            True), or a ResourcePool to share with other runs. Files are only
+            scheduled by their reservations when capacity or resources is
+            given, or when a file declares any.
+
+        cgroups : bool or string (default is False)
+            whether to run each file in a cgroup v2 group of its own (see
+            CgroupTree), when cgroups can be used, so that its limits cover,
+            and its user_time, system_time and memory_peak are accounted for
+            across, every process it starts, or the path of a group delegated
+            to us, with no processes in it, to make the groups in. Groups
+            made inside the group we run in can only be used for accounting,
+            so there memory_max is kept to as an rlimit instead, and cpu_max
+            not at all. The warm Python interpreter and Hive sessions are not
+            run in groups.
+
+        limits : dict (default is no limits)
+            hard limits on what files may use while they run, keyed like
+            timeouts, with dicts of 'memory_max' (in GB, or with a suffix
+            such as '512M') and 'cpu_max' (in cores) as values. A
+            `# memory_max:` or `# cpu_max:` declared by a file takes
+            precedence. Limits are set on each file's group, or, without one,
+            memory_max limits the file's address space (see confine) and
+            cpu_max is not enforced.
+
+        trace : string or bool (default is None)
+            a file to write each run out to as a Chrome trace (see Tracer),
+            or True for .runningshoes/trace.json in the directory
         """
         self.directory = self.ensure_trailing_slash(directory)
+        self.parallel = parallel
+        self.graph = graph
+        self.index = None
+        if cache:
+            self.index = DiscoveryIndex(self.directory, os.path.join(
+                self.directory + STATE_DIRECTORY, 'index.json'))
         self.files = self.identify_files()
+        self.stages = self.group_stages(self.files)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.options = self.read_options()
+        self.streams = self.stream_pairs()
+        self.skip = set()
+        self.excluded = set()
+        self.incremental = False
+        self.resuming = False
+        self.journal = None
+        self.journal_error = None
+        self.declared_dependencies = None
+        self.lock = threading.Lock()
+        if isinstance(history, str):
+            from .history import RunHistory
+            history = RunHistory(os.path.expanduser(history))
+        self.history = history
+        self.warm_python = warm_python
+        self.preload = preload
+        self.fork_server = None
+        self.batch_hql = batch_hql
+        self.hql_marker = hql_marker
+        if logs is True:
+            logs = self.state_file('logs')
+        if logs is not None and not os.path.isdir(logs):
+            os.makedirs(logs)
+        self.logs = logs
+        self.tee = tee
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        self.timeouts = timeouts or {}
+        self.retries = retries or {}
+        self.backoff = backoff
+        if on_failure not in FAILURE_POLICIES:
+            raise ValueError('on_failure must be one of {}!'.format(
+                ', '.join(FAILURE_POLICIES)))
+        self.on_failure = on_failure
+        self.artifacts = artifacts
+        self.artifact_store = None
+        self.owns_artifact_store = False
+        self.resources = resources or {}
+        self.resource_pool = None
+        if capacity is not None or self.resources or any(
+                o in options for options in self.options.values()
+                for o in RESOURCE_OPTIONS):
+            from .resources import ResourcePool
+            self.resource_pool = capacity
+            if not isinstance(capacity, ResourcePool):
+                self.resource_pool = ResourcePool(**(capacity or {}))
+        self.cgroups = cgroups
+        self.limits = limits or {}
+        self.cgroup_tree = None
+        self.owns_cgroup_tree = False
+        if trace is True:
+            trace = self.state_file('trace.json')
+        self.trace = trace
+        self.tracer = None
+        self.owns_tracer = False
         self.extensions = self.default_extensions()
         if custom_extensions is not None:
             for k, v in custom_extensions.items():
@@ -78,6 +564,8 @@ class RunningShoes(object):
                 'initialized': time.strftime('%c')
             }
         }
+        if self.index is not None:
+            self.index.save()
 
 
     @staticmethod
@@ -89,6 +577,28 @@ class RunningShoes(object):
         return directory
 
 
+    @staticmethod
+    def write_json(file_name, data):
+        """Write data to a JSON file atomically, so that the file is never left
+        half written if we are interrupted.
+        """
+        temporary = '{}.{}.tmp'.format(file_name, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(data, f, indent = 2, sort_keys = True)
+        os.replace(temporary, file_name)
+        return None
+
+
+    def state_file(self, name):
+        """The location of a file that keeps state between runs, creating the
+        state directory if it does not exist yet.
+        """
+        state_directory = self.directory + STATE_DIRECTORY
+        if not os.path.isdir(state_directory):
+            os.makedirs(state_directory)
+        return os.path.join(state_directory, name)
+
+
     @staticmethod
     def default_extensions():
         """Where we define the default extensions. 'extensions' maps file
@@ -103,95 +613,1556 @@ class RunningShoes(object):
         }
 
 
+    @staticmethod
+    def parse_file_name(file_name):
+        """Parse a file name once, returning its integer prefix (the order to
+        run it in), or None if it is not a file we want to run.
+        """
+        prefix, dash, _ = file_name.partition('-')
+        if not dash:
+            return None
+        try:
+            return int(prefix)
+        except ValueError:
+            return None
+
+
     @staticmethod
     def should_we_run_this_file(file_name):
         """Given the string for a file name, determines 1. whether or not to we
         want to run the file, and 2. if so, what order to run it in.
         """
-        parts = file_name.split('-')
-        if len(parts) < 2:
-            return False
-        try:
-            int(parts[0])
-        except:
+        order = RunningShoes.parse_file_name(file_name)
+        if order is None:
             return False
-        return (True, int(parts[0]))
+        return (True, order)
 
 
     def identify_files(self):
         """Identify which files to run, create a list of files to run in the
-        order which they should be run in.
+        order which they should be run in. Prefixed directories are included,
+        and run as sub-pipelines (see the run_subpipeline method).
+
+        The directory is read once with os.scandir, each name is parsed once,
+        and entries are filtered on their type as reported by the directory
+        listing, so that a directory holding many data files next to its
+        scripts does not cost a stat call per entry. When there is an index,
+        the directory is only listed if it has changed since it was indexed.
+        Each file's order is kept in file_orders. A directory with nothing to
+        run gives an empty tuple.
         """
-        files = os.listdir(self.directory)
-        files_orders = sorted([[self.should_we_run_this_file(f)[1], f] for f
-                               in files if self.should_we_run_this_file(f)])
-        orders, files = zip(*files_orders)
-        if len(orders) != len(set(orders)):
+        entries = None
+        if self.index is not None:
+            entries = self.index.entries()
+        if entries is None:
+            entries = self.scan_directory()
+        self.file_orders = dict((name, order) for order, name, _, _ in entries)
+        files = tuple(name for _, name, _, _ in entries)
+        if not (self.parallel or self.graph) and \
+                len(files) != len(set(self.file_orders.values())):
             raise Exception('One or more files have the same integer prefix!')
         return files
 
 
-    def run_file(self, file_name):
-        """Runs a file, using its extension to determine how to run it.
+    def scan_directory(self):
+        """List the directory, returning a sorted list of (order, name,
+        extension, is_dir) for each entry we want to run, and indexing it
+        when there is an index.
+        """
+        signature = None
+        if self.index is not None:
+            # -- make the state directory first, since making it changes the
+            # -- directory's mtime and would invalidate the index
+            try:
+                self.state_file('index.json')
+            except OSError:
+                pass
+            signature = self.index.signature(self.directory)
+        entries = []
+        with os.scandir(self.directory) as listing:
+            for entry in listing:
+                order = self.parse_file_name(entry.name)
+                if order is None:
+                    continue
+                is_dir = entry.is_dir()
+                if is_dir or entry.is_file():
+                    entries.append((order, entry.name,
+                                    os.path.splitext(entry.name)[1], is_dir))
+        entries.sort()
+        if self.index is not None:
+            self.index.set_entries(entries, signature)
+        return entries
+
+
+    def group_stages(self, files):
+        """Group an ordered sequence of files into stages, where each stage is
+        a tuple of the files that share an integer prefix.
+        """
+        stages = []
+        last_order = None
+        for file in files:
+            order = self.file_orders.get(file)
+            if order is None:
+                order = self.parse_file_name(file)
+            if order != last_order:
+                stages.append([])
+                last_order = order
+            stages[-1].append(file)
+        return [tuple(stage) for stage in stages]
+
+
+    def read_options(self):
+        """Read the options declared for each file, as a dict mapping each file
+        to a dict of options. Options come from the leading comment lines of
+        each file (lines starting with #, -- or //), for example
+
+        # needs: 1-transfer_data, 2-build_tables
+        # inputs: raw/events.csv
+        # outputs: tables/events.parquet
+
+        and from an optional runningshoes.json manifest in the directory, which
+        maps file names (with or without their extension) to the same options,
+        and which takes precedence over the leading comments.
         """
-        filename, file_extension = os.path.splitext(file_name)
-        call = self.extensions[file_extension] + [file_name]
-        subprocess.call(call)
+        manifest = {}
+        if os.path.isfile(self.directory + MANIFEST_NAME):
+            with open(self.directory + MANIFEST_NAME) as f:
+                manifest = json.load(f)
+        options = {}
+        for file in self.files:
+            options[file] = {}
+            if not os.path.isdir(self.directory + file):
+                options[file] = self.header_options(self.directory + file)
+            declared = manifest.get(file, manifest.get(
+                os.path.splitext(file)[0], {}))
+            for k, v in declared.items():
+                options[file][k] = list(v) if isinstance(v, (list, tuple)) \
+                    else [v]
+        return options
+
+
+    def header_options(self, file_name):
+        """The options declared in the leading comment lines of a file (see
+        read_header_options), from the index if the file has not changed
+        since they were indexed.
+        """
+        if self.index is None:
+            return self.read_header_options(file_name)
+        options = self.index.lookup(file_name, 'options')
+        if options is None:
+            signature = self.index.signature(file_name)
+            options = self.read_header_options(file_name)
+            self.index.store(file_name, 'options', options, signature)
+        return dict((k, list(v)) for k, v in options.items())
+
+
+    @staticmethod
+    def read_header_options(file_name):
+        """Read the options declared in the leading comment lines of a file,
+        stopping at the first line that is neither blank nor a comment.
+        """
+        options = {}
+        with open(file_name, errors = 'replace') as f:
+            for i, line in enumerate(f):
+                stripped = line.strip()
+                if i >= HEADER_LINES or (stripped and not
+                        stripped.startswith(('#', '--', '//'))):
+                    break
+                match = HEADER_OPTION.match(line)
+                if match is not None:
+                    values = re.split(r'[,\s]+', match.group(2))
+                    options.setdefault(match.group(1), []).extend(
+                        v for v in values if v)
+        return options
+
+
+    def step_setting(self, file, option, settings):
+        """Look up a setting for a file: the first value of the option the file
+        declares if it declares it, otherwise the value in settings for the
+        file's name, name without extension, extension, or '*', in that order,
+        or None.
+        """
+        if self.options.get(file, {}).get(option):
+            return self.options[file][option][0]
+        name, extension = os.path.splitext(file)
+        for key in (file, name, extension, '*'):
+            if key in settings:
+                return settings[key]
         return None
 
 
+    def timeout_for(self, file):
+        """How many seconds a file may run for, or None for no limit.
+        """
+        timeout = self.step_setting(file, 'timeout', self.timeouts)
+        return None if timeout is None else float(timeout)
+
+
+    def retries_for(self, file):
+        """How many more times to try a file if it fails.
+        """
+        return int(self.step_setting(file, 'retries', self.retries) or 0)
+
+
+    def resources_for(self, file):
+        """What a file reserves from the resource pool while it runs, as a
+        (cores, memory in GB, exclusive) tuple, or None for a file that
+        reserves nothing of its own: a sub-pipeline, whose files reserve
+        their own, or a file streamed into from another, which reserves what
+        it needs along with that file since the two run together.
+        """
+        from .resources import parse_memory
+        if file in self.streamed() or os.path.isdir(self.directory + file):
+            return None
+        settings = dict((o, dict((k, v[o]) for k, v in self.resources.items()
+                                 if o in v)) for o in RESOURCE_OPTIONS)
+
+        def declared(file):
+            cores = self.step_setting(file, 'cores', settings['cores'])
+            memory = self.step_setting(file, 'memory', settings['memory'])
+            exclusive = self.step_setting(file, 'exclusive',
+                                          settings['exclusive'])
+            return (1.0 if cores is None else float(cores),
+                    0.0 if memory is None else parse_memory(memory),
+                    str(exclusive).lower() in ('true', 'yes', '1'))
+
+        request = declared(file)
+        if file in self.streams:
+            consumer = declared(self.streams[file][0])
+            request = (request[0] + consumer[0], request[1] + consumer[1],
+                       request[2] or consumer[2])
+        return request
+
+
+    def limits_for(self, file):
+        """The (memory_max in GB, cpu_max in cores) a file is limited to while
+        it runs, with None for no limit.
+        """
+        from .resources import parse_memory
+        memory_max, cpu_max = [self.step_setting(file, o, dict(
+            (k, v[o]) for k, v in self.limits.items() if o in v))
+            for o in LIMIT_OPTIONS]
+        return (None if memory_max is None else parse_memory(memory_max),
+                None if cpu_max is None else float(cpu_max))
+
+
+    def find_file(self, name):
+        """Find the file in self.files called name, with or without its
+        extension.
+        """
+        for file in self.files:
+            if name == file or name == os.path.splitext(file)[0]:
+                return file
+        raise Exception('No file to run is called {}!'.format(name))
+
+
+    def dependencies(self):
+        """Build the dependency graph over self.files, as a dict mapping each
+        file to the tuple of files that have to finish before it can start.
+
+        A file depends on every file it `needs`, and on every file whose
+        `outputs` include one of its `inputs`. A file that declares neither
+        `needs` nor `inputs` waits for every file in the stages before its
+        own, so undeclared files keep their prefix order even next to files
+        that declare otherwise; it depends directly on each of those files
+        that is not already upstream of another of them, which is just the
+        stage before its own when nothing is declared. An empty `# needs:`
+        declares that a file depends on nothing at all.
+        """
+        producers = {}
+        for file in self.files:
+            for output in self.options[file].get('outputs', []):
+                producers.setdefault(os.path.normpath(output), []).append(file)
+        dependencies = {}
+        for file in self.files:
+            needs = self.options[file].get('needs')
+            inputs = self.options[file].get('inputs')
+            if needs is None and inputs is None:
+                continue
+            upstream = [self.find_file(name) for name in needs or []]
+            for path in inputs or []:
+                upstream.extend(producers.get(os.path.normpath(path), []))
+            dependencies[file] = tuple(
+                f for f in self.files if f in upstream and f != file)
+        ancestors = {}
+
+        def upstream_of(file):
+            # -- every file that has to finish before file can start
+            if file not in ancestors:
+                ancestors[file] = set()
+                for u in dependencies.get(file, ()):
+                    ancestors[file].update(upstream_of(u), [u])
+            return ancestors[file]
+
+        earlier = []
+        covered = set()
+        for stage in self.stages:
+            for file in stage:
+                if file not in dependencies:
+                    dependencies[file] = tuple(f for f in earlier
+                                               if f not in covered)
+            for file in stage:
+                covered.update(upstream_of(file))
+                earlier.append(file)
+        return self.stream_dependencies(dependencies)
+
+
+    def stage_dependencies(self):
+        """The dependency graph for running stage by stage, where every file
+        depends on every file in the stage before its own.
+        """
+        dependencies = {}
+        previous_stage = ()
+        for stage in self.stages:
+            for file in stage:
+                dependencies[file] = previous_stage
+            previous_stage = stage
+        return self.stream_dependencies(dependencies)
+
+
+    def stream_pairs(self):
+        """The files that stream their output into the next file, as a dict
+        mapping each such file to the file it streams into and the stream,
+        which is either 'stdout' or the path of a named pipe. A file declares
+        a stream with the `stream` option, and the next file is the one file
+        with the next prefix, raising an Exception if there is not exactly
+        one.
+        """
+        pairs = {}
+        for index, stage in enumerate(self.stages):
+            for file in stage:
+                stream = self.options[file].get('stream')
+                if not stream:
+                    continue
+                if index + 1 == len(self.stages) or \
+                        len(self.stages[index + 1]) != 1:
+                    raise Exception('{} streams into the next file, so there '
+                                    'must be exactly one file with the next '
+                                    'prefix!'.format(file))
+                pairs[file] = (self.stages[index + 1][0], stream[0])
+        consumers = [consumer for consumer, _ in pairs.values()]
+        for file in consumers:
+            if file in pairs or consumers.count(file) > 1:
+                raise Exception('{} can only be streamed into by one file, '
+                                'and cannot stream itself!'.format(file))
+        return pairs
+
+
+    def stream_dependencies(self, dependencies):
+        """Adjust a dependency graph so that each pair of streaming files
+        (see stream_pairs) is started together: the file being streamed into
+        depends only on the file streaming into it, which in turn waits for
+        everything either of them depends on.
+        """
+        dependencies = dict(dependencies)
+        for producer, (consumer, _) in self.streams.items():
+            upstream = set(dependencies[producer]) | \
+                set(dependencies[consumer]) - set([producer])
+            dependencies[producer] = tuple(f for f in self.files
+                                           if f in upstream)
+            dependencies[consumer] = (producer,)
+        return dependencies
+
+
+    @staticmethod
+    def topological_order(dependencies):
+        """Order the files in a dependency graph so that every file comes after
+        the files it depends on, raising an Exception if there is a cycle.
+        """
+        remaining = dict((f, set(d)) for f, d in dependencies.items())
+        order = []
+        while remaining:
+            ready = sorted(f for f, d in remaining.items() if not d)
+            if not ready:
+                raise Exception('Dependency cycle between {}!'.format(
+                    ', '.join(sorted(remaining))))
+            for file in ready:
+                del remaining[file]
+                for upstream in remaining.values():
+                    upstream.discard(file)
+            order.extend(ready)
+        return order
+
+
+    def estimate_duration(self, file):
+        """Estimate how long a file takes to run, used to find the critical
+        path through the dependency graph, in seconds. This is the file's
+        baseline in the run history if there is one; without anything better
+        to go on, every file is assumed to take one minute.
+        """
+        if self.history is not None:
+            baseline = self.history.baseline(self.directory, file, 'elapsed')
+            if baseline is not None:
+                return baseline
+        return 60.0
+
+
+    def critical_path(self, dependencies):
+        """For each file, the estimated duration of the longest chain of files
+        starting with it and running through everything downstream of it.
+        Files on longer chains are started first.
+        """
+        dependents = dict((f, []) for f in dependencies)
+        for file, upstream in dependencies.items():
+            for u in upstream:
+                dependents[u].append(file)
+        lengths = {}
+        for file in reversed(self.topological_order(dependencies)):
+            lengths[file] = self.estimate_duration(file) + max(
+                [lengths[d] for d in dependents[file]] + [0])
+        return lengths
+
+
+    def plan_dependencies(self):
+        """The dependency graph that run follows: the declared dependencies
+        when graph is True, and otherwise the stages in prefix order.
+        """
+        if self.graph:
+            return self.dependencies()
+        return self.stage_dependencies()
+
+
+    @staticmethod
+    def hash_file(file_name):
+        """The SHA-256 hex digest of a file's contents, or None if the file
+        does not exist. For a sub-pipeline directory, this is a digest of its
+        manifest and of every prefixed file (or sub-pipeline) in it.
+        """
+        if os.path.isdir(file_name):
+            digest = hashlib.sha256()
+            with os.scandir(file_name) as entries:
+                names = sorted(e.name for e in entries
+                               if e.name == MANIFEST_NAME or
+                               RunningShoes.parse_file_name(e.name) is not None)
+            for name in names:
+                digest.update(json.dumps([name, RunningShoes.hash_file(
+                    os.path.join(file_name, name))]).encode('utf-8'))
+            return digest.hexdigest()
+        if not os.path.isfile(file_name):
+            return None
+        digest = hashlib.sha256()
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+    def content_hash(self, file_name):
+        """The hash of a file (see hash_file), from the index if the file has
+        not changed since it was hashed.
+        """
+        if self.index is None or not os.path.isfile(file_name):
+            return self.hash_file(file_name)
+        digest = self.index.lookup(file_name, 'hash')
+        if digest is None:
+            signature = self.index.signature(file_name)
+            digest = self.hash_file(file_name)
+            self.index.store(file_name, 'hash', digest, signature)
+        return digest
+
+
+    def fingerprints(self, dependencies):
+        """Fingerprint each file, as a dict mapping each file to a hex digest
+        of its contents, the command used to run it, the contents of its
+        declared inputs, and the fingerprints of the files it depends on. A
+        file's fingerprint changes whenever anything upstream of it changes.
+        """
+        fingerprints = {}
+        for file in self.topological_order(dependencies):
+            extension = os.path.splitext(file)[1]
+            inputs = sorted(self.options[file].get('inputs', []))
+            fingerprints[file] = hashlib.sha256(json.dumps([
+                self.content_hash(self.directory + file),
+                self.extensions.get(extension),
+                [[i, self.content_hash(os.path.join(self.directory, i))]
+                    for i in inputs],
+                sorted(fingerprints[u] for u in dependencies[file])
+            ]).encode('utf-8')).hexdigest()
+        if self.index is not None:
+            self.index.save()
+        return fingerprints
+
+
+    def load_state(self):
+        """Load the fingerprints of the files as of their last successful run.
+        """
+        state_file = self.state_file('state.json')
+        if not os.path.isfile(state_file):
+            return {}
+        with open(state_file) as f:
+            return json.load(f)
+
+
+    def save_state(self, file):
+        """Record that a file ran successfully with its current fingerprint.
+        """
+        with self.lock:
+            self.state[file] = self.fingerprint[file]
+            self.write_json(self.state_file('state.json'), self.state)
+        return None
+
+
+    def load_journal(self):
+        """Load the journal of the last run, which records the status of each
+        file as 'pending', 'running', 'success', 'failure' or 'skipped'.
+        """
+        journal_file = os.path.join(self.directory + STATE_DIRECTORY,
+                                    'journal.json')
+        if not os.path.isfile(journal_file):
+            return None
+        with open(journal_file) as f:
+            return json.load(f)
+
+
+    def update_journal(self, file, status):
+        """Record the status of a file in the journal, rewriting the journal
+        atomically so that it survives the runner itself being killed. The
+        journal is only needed to resume a run, so if it cannot be written
+        (such as in a read-only checkout), the run carries on without it,
+        saying so once.
+        """
+        with self.lock:
+            self.journal['files'][file] = status
+            self.journal['updated'] = time.strftime('%c')
+            if self.journal_error is not None:
+                return None
+            try:
+                self.write_json(self.state_file('journal.json'), self.journal)
+            except OSError as e:
+                self.journal_error = e
+                print('Not keeping a journal of this run, so it cannot be '
+                      'resumed: {}'.format(e), file = sys.stderr)
+        return None
+
+
+    @staticmethod
+    def wait(process):
+        """Wait for a process to finish, returning a dict of its returncode and
+        the resources it used (see RESOURCE_COLUMNS). Resource usage comes from
+        os.wait4, and covers the process along with every descendant of it
+        that was waited for; max_rss is the peak resident memory of the
+        largest of those processes, in megabytes. Where os.wait4 is not
+        available, only the returncode is given.
+        """
+        if not hasattr(os, 'wait4'):
+            process.wait()
+            return {'returncode': process.returncode}
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        result = RunningShoes.resource_usage(usage)
+        result['returncode'] = process.returncode
+        return result
+
+
+    @staticmethod
+    def exited(process):
+        """Whether a process has exited, without waiting for it, so that wait
+        can still collect its resource usage. Where os.waitid is not
+        available, this is never known, and False is returned.
+        """
+        if not hasattr(os, 'waitid'):
+            return False
+        return os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG |
+                         os.WNOWAIT) is not None
+
+
+    @staticmethod
+    def resource_usage(usage):
+        """Convert a resource.struct_rusage into a dict of the resources used
+        by a process (see RESOURCE_COLUMNS).
+        """
+        # -- ru_maxrss is in kilobytes on Linux but in bytes on macOS
+        rss_unit = 1 if sys.platform == 'darwin' else 1024
+        return {
+            'user_time': usage.ru_utime,
+            'system_time': usage.ru_stime,
+            'max_rss': usage.ru_maxrss * rss_unit / (1024 * 1024),
+            'block_input': usage.ru_inblock,
+            'block_output': usage.ru_oublock,
+            'voluntary_switches': usage.ru_nvcsw,
+            'involuntary_switches': usage.ru_nivcsw
+        }
+
+
+    def open_log(self, file_name):
+        """Open a fresh StepLog for a file's output.
+        """
+        from .logs import StepLog
+        return StepLog(os.path.join(self.logs, os.path.basename(file_name) +
+                                    '.log'),
+                       max_bytes = self.log_max_bytes,
+                       backups = self.log_backups)
+
+
+    def tees(self):
+        """Where captured stdout and stderr are passed through to, if anywhere.
+        """
+        if self.tee:
+            return sys.stdout.buffer, sys.stderr.buffer
+        return None, None
+
+
+    def run_file(self, file_name, timeout = None, stdin = None,
+                 stdout = None, stream = None):
+        """Runs a file, using its extension to determine how to run it, and
+        returns its returncode and the resources its process used (see the
+        wait method). When logs is set, the file's stdout and stderr are
+        streamed into its log. When timeout is given, the file is run in its
+        own process group, which is killed if the file runs for longer than
+        timeout seconds (see Watchdog). A directory is run as a sub-pipeline.
+        The file is run in a cgroup of its own, and with its limits, as set
+        up by the confine method. How long the file took to start, and to
+        write its first output, is given under 'timing' (see spawn_timing).
+
+        stdin and stdout, when given, are file descriptors for the file's
+        stdin and stdout (such as the ends of a pipe between two files), and
+        are closed here as soon as the file has started, so that the file is
+        the only one left holding them. Such a file is never run in the warm
+        Python interpreter. stream, when given, is the absolute path of a
+        named pipe the file reads from or writes to, which is passed on to it
+        in the RUNNINGSHOES_STREAM environment variable.
+        """
+        cgroup = None
+        try:
+            if os.path.isdir(file_name):
+                return self.run_subpipeline(file_name)
+            filename, file_extension = os.path.splitext(file_name)
+            if self.warm_python and file_extension == '.py' and \
+                    stdin is None and stdout is None:
+                return self.run_warm_python(file_name, timeout, stream)
+            call, cgroup = self.confine(file_name, self.extensions[
+                file_extension] + [file_name])
+            group = timeout is not None
+            if self.logs is None:
+                spawning = time.monotonic_ns()
+                process = subprocess.Popen(call, stdin = stdin,
+                                           stdout = stdout,
+                                           env = self.environment(stream),
+                                           start_new_session = group)
+                timing = self.spawn_timing(spawning)
+                stdin, stdout = self.close_fds(stdin, stdout)
+                with Watchdog(process.pid if group else None, timeout,
+                              file_name):
+                    return self.account(dict(self.wait(process),
+                                             timing = timing), cgroup)
+            from .logs import pump
+            log = self.open_log(file_name)
+            try:
+                spawning = time.monotonic_ns()
+                process = subprocess.Popen(
+                    call, stdin = stdin,
+                    stdout = subprocess.PIPE if stdout is None else stdout,
+                    stderr = subprocess.PIPE, env = self.environment(stream),
+                    start_new_session = group)
+                timing = self.spawn_timing(spawning)
+                stdin, stdout = self.close_fds(stdin, stdout)
+                with Watchdog(process.pid if group else None, timeout,
+                              file_name):
+                    tee_stdout, tee_stderr = self.tees()
+                    streams = [(process.stderr.fileno(), tee_stderr)]
+                    if process.stdout is not None:
+                        streams.append((process.stdout.fileno(), tee_stdout))
+                    pump(streams, log, lambda: self.exited(process))
+                    if process.stdout is not None:
+                        process.stdout.close()
+                    process.stderr.close()
+                    return self.account(dict(self.wait(process), timing =
+                        self.spawn_timing(spawning, log, timing)), cgroup)
+            finally:
+                log.close()
+        finally:
+            self.close_fds(stdin, stdout)
+            if cgroup is not None:
+                cgroup.remove()
+
+
+    def confine(self, file_name, call):
+        """The command to run a file with, and the StepCgroup to run it in
+        (or None). The command starts the file in a new group in cgroup_tree
+        when there is one, limited to what limits_for the file gives; any
+        memory limit that the group cannot enforce becomes a limit on the
+        file's address space instead.
+        """
+        memory_max, cpu_max = self.limits_for(os.path.basename(file_name))
+        cgroup = None
+        if self.cgroup_tree is not None:
+            cgroup = self.cgroup_tree.step(os.path.basename(file_name))
+        if cgroup is None and memory_max is None:
+            return call, None
+        from .cgroups import confine
+        group_memory_max = None
+        if cgroup is not None:
+            unset, cpu_max = cgroup.limit(memory_max, cpu_max)
+            if unset is None:
+                group_memory_max, memory_max = memory_max, None
+        return confine(call, cgroup and cgroup.path, memory_max,
+                       group_memory_max), cgroup
+
+
+    @staticmethod
+    def account(result, cgroup):
+        """Fold what a file's StepCgroup accounted for into the result of
+        waiting for it, since the group's accounting covers every process the
+        file started, including any that were never waited for.
+        """
+        if cgroup is not None:
+            result.update(cgroup.usage())
+        return result
+
+
+    @staticmethod
+    def spawn_timing(spawning, log = None, timing = None):
+        """Timings for a file whose process started being spawned at
+        spawning, on the monotonic clock in nanoseconds: spawn_latency, the
+        seconds from then until the process had forked and exec-ed its
+        command, and, once a log has been written, first_output, the seconds
+        from then until the file first wrote any output to it.
+        """
+        if timing is None:
+            timing = {'spawn_latency': (time.monotonic_ns() - spawning) / 1e9}
+        if log is not None and log.first_output is not None:
+            timing['first_output'] = (log.first_output - spawning) / 1e9
+        return timing
+
+
+    @staticmethod
+    def close_fds(*fds):
+        """Close any of a number of file descriptors that are not None,
+        returning a None for each of them.
+        """
+        for fd in fds:
+            if fd is not None:
+                os.close(fd)
+        return (None,) * len(fds)
+
+
+    def environment(self, stream = None):
+        """The environment variables that files are run with: our own, along
+        with where the artifact store is when there is one and where the named
+        pipe a file streams through is when it has one (see run_stream), or
+        None to simply pass on our own.
+        """
+        if self.artifact_store is None and stream is None:
+            return None
+        environment = dict(os.environ)
+        if self.artifact_store is not None:
+            from .artifacts import ARTIFACTS_VARIABLE
+            environment[ARTIFACTS_VARIABLE] = self.artifact_store.path
+        if stream is not None:
+            environment[STREAM_VARIABLE] = stream
+        return environment
+
+
+    def run_stream(self, producer, consumer, stream, timeout = None):
+        """Run two files at the same time, with the first one's output
+        streaming straight into the second (see stream_pairs), returning the
+        first file's results and recording the second's in file_data.
+
+        With a stream of 'stdout', the first file's stdout is piped into the
+        second file's stdin. Otherwise, the stream is the path (relative to
+        the directory) of a named pipe that the first file writes to and the
+        second file reads from. Since files are not run from inside the
+        directory, both are given the named pipe's absolute path in the
+        RUNNINGSHOES_STREAM environment variable. The named pipe is made here,
+        replacing any regular file at that path, and removed once both files
+        finish.
+        """
+        fifo = None
+        if stream == 'stdout':
+            read_fd, write_fd = os.pipe()
+        else:
+            read_fd = write_fd = None
+            fifo = os.path.abspath(os.path.join(self.directory, stream))
+            if os.path.lexists(fifo) and \
+                    not stat.S_ISFIFO(os.lstat(fifo).st_mode):
+                os.remove(fifo)
+            if not os.path.lexists(fifo):
+                os.mkfifo(fifo)
+        done = {'producer': threading.Event(), 'consumer': threading.Event()}
+        results = {}
+
+        def run_consumer():
+            try:
+                results['result'] = self.run_file(
+                    self.directory + consumer, self.timeout_for(consumer),
+                    stdin = read_fd, stream = fifo)
+            except Exception as e:
+                results['error'] = e
+            finally:
+                done['consumer'].set()
+                if fifo is not None:
+                    self.release_fifo(fifo, os.O_RDONLY, done['producer'])
+
+        thread = threading.Thread(target = run_consumer)
+        thread.start()
+        try:
+            result = self.run_file(self.directory + producer, timeout,
+                                   stdout = write_fd, stream = fifo)
+        finally:
+            done['producer'].set()
+            if fifo is not None:
+                self.release_fifo(fifo, os.O_WRONLY, done['consumer'])
+            thread.join()
+            if fifo is not None:
+                os.remove(fifo)
+        if 'error' in results:
+            raise results['error']
+        self.check_result(consumer, results['result'])
+        return result
+
+
+    @staticmethod
+    def release_fifo(fifo, flags, finished):
+        """Once one end of a named pipe is done with, keep opening and closing
+        it from that end until the other end's file has finished, so that the
+        other file never waits forever to open the pipe, and sees the end of
+        the stream (or a broken pipe) instead.
+        """
+        while not finished.is_set():
+            try:
+                os.close(os.open(fifo, flags | os.O_NONBLOCK))
+            except OSError:
+                pass
+            finished.wait(0.1)
+        return None
+
+
+    def run_warm_python(self, file_name, timeout = None, stream = None):
+        """Runs a .py file in the fork server. When logs is set, the child's
+        stdout and stderr reach us through a pair of FIFOs. When timeout is
+        given, the child is put in its own process group, which is killed if
+        it runs for longer than timeout seconds. See run_file for stream.
+        """
+        server = self.start_fork_server()
+        group = timeout is not None
+        if self.logs is None:
+            spawning = time.monotonic_ns()
+            request = server.start(file_name, env = self.environment(stream),
+                                   process_group = group)
+            timing = self.spawn_timing(spawning)
+            with Watchdog(request['pid'] if group else None, timeout,
+                          file_name):
+                returncode, usage = server.wait(request)
+            return dict(self.resource_usage(usage), returncode = returncode,
+                        timing = timing)
+        import shutil
+        import tempfile
+        from .logs import pump
+        fifos = tempfile.mkdtemp(prefix = 'runningshoes-')
+        log = self.open_log(file_name)
+        try:
+            streams = []
+            for name, tee in zip(('stdout', 'stderr'), self.tees()):
+                os.mkfifo(os.path.join(fifos, name))
+                streams.append((os.open(os.path.join(fifos, name),
+                                        os.O_RDONLY | os.O_NONBLOCK), tee))
+            spawning = time.monotonic_ns()
+            request = server.start(file_name, env = self.environment(stream),
+                                   process_group = group,
+                                   stdout = os.path.join(fifos, 'stdout'),
+                                   stderr = os.path.join(fifos, 'stderr'))
+            timing = self.spawn_timing(spawning)
+            with Watchdog(request['pid'] if group else None, timeout,
+                          file_name):
+                try:
+                    pump(streams, log, request['done'].is_set)
+                finally:
+                    for fd, _ in streams:
+                        os.close(fd)
+                returncode, usage = server.wait(request)
+        finally:
+            log.close()
+            shutil.rmtree(fifos)
+        return dict(self.resource_usage(usage), returncode = returncode,
+                    timing = self.spawn_timing(spawning, log, timing))
+
+
+    def subpipeline(self, directory):
+        """A RunningShoes for a sub-pipeline directory, with the same settings
+        as this one. Its logs go in a directory of their own inside ours.
+        """
+        logs = self.logs
+        if logs is not None:
+            logs = os.path.join(logs, os.path.basename(
+                os.path.normpath(directory)))
+        return type(self)(directory, custom_extensions = self.extensions,
+                          parallel = self.parallel,
+                          max_workers = self.max_workers, graph = self.graph,
+                          history = self.history,
+                          warm_python = self.warm_python,
+                          preload = self.preload, batch_hql = self.batch_hql,
+                          hql_marker = self.hql_marker, logs = logs,
+                          tee = self.tee, log_max_bytes = self.log_max_bytes,
+                          log_backups = self.log_backups,
+                          timeouts = self.timeouts, retries = self.retries,
+                          backoff = self.backoff, on_failure = self.on_failure,
+                          cache = self.index is not None,
+                          artifacts = self.artifacts,
+                          resources = self.resources, cgroups = self.cgroups,
+                          limits = self.limits)
+
+
+    def run_subpipeline(self, directory):
+        """Run a sub-pipeline directory as one step (see the subpipeline
+        method), returning a returncode of 0 if it succeeds and raising its
+        error if it does not. Its file_data is kept in this step's file_data
+        under 'pipeline', and its resource usage is rolled up into this step's
+        (see the rollup method). Timeouts apply to the files inside it, not to
+        the sub-pipeline as a whole. When resuming, it resumes from its own
+        journal, so only its files that failed or never finished are run.
+        """
+        file = os.path.basename(os.path.normpath(directory))
+        child = self.subpipeline(directory)
+        info = self.file_data['info'][file]
+        info['pipeline'] = child.file_data
+        # -- a sub-pipeline shares our artifact store, cgroup tree and tracer
+        child.artifact_store = self.artifact_store
+        child.cgroup_tree = self.cgroup_tree
+        child.tracer = self.tracer
+        # -- and our resource pool, which its files reserve from
+        if self.resource_pool is not None:
+            child.resource_pool = self.resource_pool
+        child.prepare_run(self.incremental, self.resuming)
+        try:
+            child.run_plan()
+        finally:
+            child.finish_run(report = False)
+            info.update(child.rollup())
+        return {'returncode': 0}
+
+
+    def rollup(self):
+        """The resource usage of every file in the last run, rolled up into
+        totals: the peak of max_rss and memory_peak, and the sum of everything
+        else.
+        """
+        totals = {}
+        for info in self.file_data['info'].values():
+            for key, _ in RESOURCE_COLUMNS:
+                if info.get(key) is None:
+                    continue
+                if key in ('max_rss', 'memory_peak'):
+                    totals[key] = max(totals.get(key, 0), info[key])
+                else:
+                    totals[key] = totals.get(key, 0) + info[key]
+        return totals
+
+
+    def start_fork_server(self):
+        """The ForkServer that .py files are run in when warm_python is True,
+        starting it the first time it is needed.
+        """
+        with self.lock:
+            if self.fork_server is None:
+                from .forkserver import ForkServer
+                self.fork_server = ForkServer(self.extensions['.py'],
+                                              preload = self.preload)
+        return self.fork_server
+
+
+    @staticmethod
+    def start_timing():
+        """A timing record for something starting now: start_ns, on the
+        monotonic clock in nanoseconds, and start_epoch, the wall-clock time
+        in seconds since the epoch. See stop_timing.
+        """
+        return {'start_ns': time.monotonic_ns(), 'start_epoch': time.time()}
+
+
+    @staticmethod
+    def stop_timing(timing):
+        """Finish a timing record (see start_timing) for something ending
+        now, adding end_ns, end_epoch and elapsed, the seconds between
+        start_ns and end_ns.
+        """
+        timing['end_ns'] = time.monotonic_ns()
+        timing['end_epoch'] = time.time()
+        timing['elapsed'] = (timing['end_ns'] - timing['start_ns']) / 1e9
+        return timing
+
+
+    def begin_step(self, file):
+        """Record that a file has started running. Its timing record (see
+        start_timing) is kept in file_data under 'timing', along with the
+        spawn_latency and first_output of its process, when there is one
+        (see spawn_timing).
+        """
+        self.update_journal(file, 'running')
+        self.file_data['info'][file] = {
+            'ran': True,
+            'timing': self.start_timing()
+        }
+        if self.tracer is not None:
+            self.tracer.begin(self.directory + file)
+        return None
+
+
+    def end_step(self, file, result):
+        """Record that a file finished running successfully, along with the
+        dict of results (such as resource usage) from running it.
+        """
+        self.file_data['info'][file].update(result)
+        self.stop_timing(self.file_data['info'][file]['timing'])
+        if self.incremental:
+            self.save_state(file)
+        self.update_journal(file, 'success')
+        self.trace_step(file, 'success')
+        return None
+
+
+    def fail_step(self, file):
+        """Record that a file failed.
+        """
+        self.stop_timing(self.file_data['info'][file]['timing'])
+        self.file_data['info'][file]['ran'] = False
+        self.update_journal(file, 'failure')
+        self.trace_step(file, 'failure')
+        return None
+
+
+    def trace_step(self, file, status):
+        """Close a file's span in the trace, if there is one, showing its
+        exit code and resource usage with it.
+        """
+        if self.tracer is None:
+            return None
+        info = self.file_data['info'][file]
+        args = dict((k, info[k]) for k, _ in RESOURCE_COLUMNS +
+                    [('returncode', None)] if info.get(k) is not None)
+        for key in ('spawn_latency', 'first_output'):
+            if key in info.get('timing', {}):
+                args[key] = info['timing'][key]
+        self.tracer.end(self.directory + file, status, args)
+        return None
+
+
+    def begin_attempt(self, file):
+        """Record that an attempt at running a file has started, with a
+        timing record of its own (see start_timing).
+        """
+        self.file_data['info'][file]['attempts'].append(
+            {'timing': self.start_timing()})
+        if self.tracer is not None:
+            self.tracer.begin_attempt(self.directory + file)
+        return None
+
+
+    def end_attempt(self, file, error = None):
+        """Record that an attempt at running a file has finished, with the
+        error it failed with, if any.
+        """
+        attempt = self.file_data['info'][file]['attempts'][-1]
+        if error is not None:
+            attempt['error'] = str(error)
+        self.stop_timing(attempt['timing'])
+        if self.tracer is not None:
+            self.tracer.end_attempt(self.directory + file, error)
+        return None
+
+
+    def check_result(self, file, result):
+        """Record the results of running a file in file_data, raising
+        StepFailed if it exited with a non-zero exit code.
+        """
+        info = self.file_data['info'][file]
+        result = dict(result)
+        info.setdefault('timing', {}).update(result.pop('timing', {}))
+        info.update(result)
+        returncode = result.get('returncode')
+        if returncode is not None and returncode != 0:
+            if result.get('oom_kills'):
+                message = '{} ran out of memory!'.format(file)
+            elif returncode < 0:
+                message = '{} was killed by signal {}!'.format(file,
+                                                              -returncode)
+            else:
+                message = '{} failed with exit code {}!'.format(file,
+                                                               returncode)
+            raise StepFailed(message, file = file, returncode = returncode)
+        return None
+
+
+    def skip_step(self, file):
+        """Record that a file was skipped. A file left out of the run by only
+        is left as it was in the journal, so that resuming does not take it
+        for done.
+        """
+        self.file_data['info'][file] = {'ran': False, 'skipped': True}
+        if file not in self.excluded:
+            self.update_journal(file, 'skipped')
+        return None
+
+
+    def block_step(self, file, blockers):
+        """Record that a file was not run because files it depends on failed.
+        """
+        self.file_data['info'][file] = {'ran': False,
+                                        'blocked_by': list(blockers)}
+        self.update_journal(file, 'blocked')
+        return None
+
+
+    def blocked_by(self, file, broken):
+        """When on_failure is 'continue-independent', the files in broken (the
+        files that failed or were blocked) that a file depends on. Otherwise,
+        nothing blocks a file.
+        """
+        if self.on_failure != 'continue-independent':
+            return []
+        with self.lock:
+            if self.declared_dependencies is None:
+                self.declared_dependencies = self.dependencies()
+        return [f for f in self.declared_dependencies[file] if f in broken]
+
+
+    def raise_failures(self, failures):
+        """Raise the error for a run in which the files in failures (a dict
+        mapping each file to its error) failed, if any did.
+        """
+        if not failures:
+            return None
+        if self.on_failure == 'fail-fast':
+            raise list(failures.values())[0]
+        raise PipelineFailed(failures)
+
+
+    def run_step(self, file):
+        """Runs a single file from self.files, recording when it was run, how
+        long it took, and whether or not it ran successfully in file_data.
+        Files in self.skip are recorded as skipped instead of being run.
+
+        A file fails if it exits with a non-zero exit code (see check_result),
+        times out, or cannot be run at all. A file that fails is tried again
+        up to retries_for(file) more times, waiting backoff seconds before the
+        first retry and twice as long before each retry after that. Each
+        attempt's timing record (see start_timing) and error, if any, are
+        recorded in file_data under 'attempts'.
+        """
+        if file in self.skip:
+            return self.skip_step(file)
+        if file in self.streamed():
+            # -- already run, along with the file streaming into it
+            return None
+        consumer, stream = self.streams.get(file, (None, None))
+        self.begin_step(file)
+        if consumer is not None:
+            self.begin_step(consumer)
+        self.file_data['info'][file]['attempts'] = []
+        tries = self.retries_for(file) + 1
+        try:
+            for attempt in range(1, tries + 1):
+                self.begin_attempt(file)
+                try:
+                    if consumer is None:
+                        result = self.run_file(self.directory + file,
+                                               self.timeout_for(file))
+                    else:
+                        result = self.run_stream(file, consumer, stream,
+                                                 self.timeout_for(file))
+                    self.check_result(file, result)
+                except Exception as e:
+                    self.end_attempt(file, e)
+                    if attempt == tries:
+                        raise
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                    continue
+                self.end_attempt(file)
+                self.end_step(file, {})
+                if consumer is not None:
+                    self.end_step(consumer, {})
+                break
+        except:
+            self.fail_step(file)
+            if consumer is not None:
+                self.fail_step(consumer)
+            raise
+        return None
+
+
+    def streamed(self):
+        """The files that are run along with the file streaming into them,
+        rather than on their own.
+        """
+        return set(consumer for consumer, _ in self.streams.values())
+
+
+    def run_hql_batch(self, files):
+        """Runs consecutive .hql files in a single Hive session (see
+        HiveSession), recording each file in file_data as it starts and
+        finishes. Hive stops at the first statement that fails, so if the
+        session fails, the file it was in is recorded as a failure with the
+        session's exit code, the files after it are left unrun, and StepFailed
+        (or the error the session failed with) is raised. A session that
+        fails, or ends, between files, such as one that cannot reach the
+        metastore or cannot be started at all, is blamed on the next file it
+        would have run, so that every failed session accounts for at least
+        one file. Each file's timeout starts when the file does, and if it
+        passes, the whole session is killed.
+        """
+        from .hive import HIVE_MARKER, HiveSession
+        session = HiveSession(self.extensions['.hql'],
+                              marker = self.hql_marker or HIVE_MARKER)
+        timeouts = [self.timeout_for(f) for f in files]
+        group = any(t is not None for t in timeouts)
+        started = []
+        finished = []
+        process = None
+        error = None
+        # -- with logs, each line goes to the log of the file that printed it,
+        # -- and anything printed between files to the first file's log
+        logs = [self.open_log(f) for f in files] if self.logs else None
+        current = [0]
+
+        def output(line):
+            logs[current[0]].write(line)
+            if self.tee:
+                sys.stdout.buffer.write(line)
+                sys.stdout.flush()
+
+        try:
+            with contextlib.ExitStack() as stack:
+                events = session.run([self.directory + f for f in files],
+                                     output = output if logs else None,
+                                     start_new_session = group)
+                for event, value in events:
+                    if event == 'started':
+                        watchdog = stack.enter_context(Watchdog(
+                            value.pid if group else None, None, 'Hive'))
+                    elif event == 'start':
+                        watchdog.arm(timeouts[value])
+                        watchdog.name = files[value]
+                        current[0] = value
+                        self.begin_batched_step(files[value])
+                        started.append(files[value])
+                    elif event == 'end':
+                        watchdog.arm(None)
+                        started.remove(files[value])
+                        finished.append(files[value])
+                        self.end_attempt(files[value])
+                        self.end_step(files[value], {'batch': tuple(files),
+                                                     'returncode': 0})
+                    else:
+                        process = value
+                self.wait(process)
+        except Exception as e:
+            error = e
+        finally:
+            for log in logs or []:
+                log.close()
+        returncode = None if process is None else process.returncode
+        if error is None and returncode == 0 and len(finished) == len(files):
+            return None
+        if not started:
+            started.append(files[len(finished)])
+            self.begin_batched_step(started[0])
+        if error is None:
+            if returncode == 0:
+                message = 'Hive session ended before {} finished (check ' \
+                    'hql_marker)!'.format(', '.join(started))
+            else:
+                message = 'Hive session failed with exit code {} in ' \
+                    '{}!'.format(returncode, ', '.join(started))
+            error = StepFailed(message, file = ', '.join(started),
+                               returncode = returncode)
+        for file in started:
+            self.file_data['info'][file].update({
+                'batch': tuple(files),
+                'returncode': returncode})
+            self.end_attempt(file, error)
+            self.fail_step(file)
+        raise error
+
+
+    def begin_batched_step(self, file):
+        """Record that a file in a Hive session batch has started, as a step
+        with a single attempt, since batched files are never retried.
+        """
+        self.begin_step(file)
+        self.file_data['info'][file]['attempts'] = []
+        self.begin_attempt(file)
+        return None
+
+
+    def batchable(self, file):
+        """Whether a file can be run as part of a Hive session batch. Files
+        that can be retried are run in sessions of their own, since a failed
+        session cannot be picked up again from the file that failed.
+        """
+        return self.batch_hql and file not in self.skip and \
+            os.path.splitext(file)[1] == '.hql' and \
+            file not in self.streams and file not in self.streamed() and \
+            not self.retries_for(file)
+
+
     def run_files(self):
         """Runs many files, recording information on when the files were run,
-        how long they took, and whether or not they ran successfully.
+        how long they took, and whether or not they ran successfully. When
+        batch_hql is True, each run of consecutive .hql files that are not
+        being skipped is run in a single Hive session. What happens when a
+        file fails depends on on_failure.
         """
-        for order, file in enumerate(self.files, start = 1):
-            start = time.time()
-            self.file_data['info'][file] = {
-                'ran': True,
-                'start_time': time.strftime('%c')
-            }
+        failures = OrderedDict()
+        broken = set()
+        pending = list(self.files)
+        while pending:
+            file = pending.pop(0)
+            blockers = self.blocked_by(file, broken)
+            if blockers:
+                self.block_step(file, blockers)
+                broken.add(file)
+                continue
+            batch = [file]
+            while self.batchable(file) and pending and \
+                    self.batchable(pending[0]) and \
+                    not self.blocked_by(pending[0], broken):
+                batch.append(pending.pop(0))
             try:
-                self.run_file(self.directory + file)
-                self.file_data['info'][file]['end_time'] = time.strftime('%c')
-                self.file_data['info'][file]['elapsed'] = \
-                    (time.time() - start) / 60
-            except:
-                self.file_data['info'][file]['end_time'] = time.strftime('%c')
-                self.file_data['info'][file]['elapsed'] = \
-                    (time.time() - start) / 60
-                self.file_data['info'][file]['ran'] = False
-                raise
+                if len(batch) > 1:
+                    self.run_hql_batch(batch)
+                else:
+                    self.run_step(file)
+            except Exception as e:
+                if self.on_failure == 'fail-fast':
+                    raise
+                # -- a failed Hive session leaves the files after the failure
+                # -- unrun, so put them back in line, but only if it got
+                # -- anywhere, so that a session that keeps failing is never
+                # -- tried over and over again
+                unrun = [f for f in batch if f not in self.file_data['info']]
+                if len(unrun) == len(batch):
+                    for f in batch:
+                        self.begin_step(f)
+                        self.fail_step(f)
+                    unrun = []
+                pending[0:0] = unrun
+                for f in batch:
+                    if self.file_data['info'].get(f, {}).get('ran') is False:
+                        failures[f] = e
+                        broken.add(f)
+        self.raise_failures(failures)
         return None
 
 
-    def format_file_data(self):
+    def run_stages(self):
+        """Runs many files stage by stage, where every file in a stage shares
+        an integer prefix. The files in a stage are run at the same time on a
+        pool of at most max_workers threads, and each stage has to finish
+        before the next one starts. What happens when a file fails depends on
+        on_failure; see run_graph.
+        """
+        return self.run_graph(self.stage_dependencies())
+
+
+    def run_graph(self, dependencies = None):
+        """Runs many files on a pool of at most max_workers threads, starting
+        each file as soon as every file it depends on has finished. When more
+        files are ready than there are free workers, the ones on the longest
+        remaining chain go first.
+
+        If a file fails and on_failure is 'fail-fast', no new files are
+        started, the files already running are allowed to finish, and then
+        the first error is raised. Otherwise, the files that depend on it are
+        treated as though it finished, except that with
+        'continue-independent' they are recorded as blocked rather than run
+        when they depend on it by the dependencies method.
+
+        When there is a resource pool, a ready file is also only started once
+        its reservation (see the resources_for method) fits. A file that does
+        not fit is passed over for the next one that does, as long as that
+        leaves room for every file passed over, so a big or exclusive file is
+        never starved by small ones.
+
+        Parameters
+        ----------
+        dependencies : dict (default is the dependencies method)
+            maps each file to the files that have to finish before it starts
+        """
+        from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                        wait)
+        if dependencies is None:
+            dependencies = self.dependencies()
+        priority = self.critical_path(dependencies)
+        waiting_on = dict((f, set(d)) for f, d in dependencies.items())
+        ready = []
+        for file, upstream in waiting_on.items():
+            if not upstream:
+                heapq.heappush(ready, (-priority[file],
+                                       self.files.index(file), file))
+        running = {}
+        reserved = {}
+        failures = OrderedDict()
+        broken = set()
+
+        def release(finished):
+            for file, upstream in waiting_on.items():
+                if finished in upstream:
+                    upstream.discard(finished)
+                    if not upstream:
+                        heapq.heappush(ready, (-priority[file],
+                                               self.files.index(file), file))
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+            while ready or running:
+                passed_over = []
+                while ready and len(running) < self.max_workers and not \
+                        (failures and self.on_failure == 'fail-fast'):
+                    entry = heapq.heappop(ready)
+                    file = entry[2]
+                    blockers = self.blocked_by(file, broken)
+                    if blockers:
+                        self.block_step(file, blockers)
+                        broken.add(file)
+                        release(file)
+                        continue
+                    request = None
+                    if self.resource_pool is not None:
+                        request = self.resources_for(file)
+                    if request is not None:
+                        claimed = [r for _, r in passed_over]
+                        if not self.resource_pool.try_reserve(request,
+                                                              claimed):
+                            passed_over.append((entry, request))
+                            continue
+                        reserved[file] = request
+                    running[pool.submit(self.run_step, file)] = file
+                for entry, _ in passed_over:
+                    heapq.heappush(ready, entry)
+                if not running:
+                    if ready and passed_over:
+                        # -- waiting on a pool shared with other runs
+                        time.sleep(RESOURCE_RECHECK)
+                        continue
+                    break
+                # -- look at the machine again now and then while files are
+                # -- waiting, since the guardrails can change on their own
+                done, _ = wait(running, timeout = RESOURCE_RECHECK
+                               if passed_over else None,
+                               return_when = FIRST_COMPLETED)
+                for future in done:
+                    finished = running.pop(future)
+                    if finished in reserved:
+                        self.resource_pool.release(reserved.pop(finished))
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failures[finished] = e
+                        broken.add(finished)
+                        if self.on_failure == 'fail-fast':
+                            continue
+                    release(finished)
+        self.raise_failures(failures)
+        return None
+
+
+    def format_file_data(self, file_data = None, parent = None):
         """Formats a file_data dictionary into list of lists that can be nicely
-        printed using the tabulate package.
+        printed using the tabulate package. Each sub-pipeline's files follow
+        its own row, numbered and named from it, such as 3.1 and
+        3-ingest/1-load.py; parent is the (order, name) of the sub-pipeline
+        whose file_data is being formatted.
         """
+        if file_data is None:
+            file_data = self.file_data
         results = []
         success_string = {
             True: 'Success',
             False: 'Failure'}
-        for order, file in enumerate(self.files, start = 1):
-            if self.file_data['info'].get(file, None) is not None:
-                start_time = self.file_data['info'][file]['start_time']
-                end_time = self.file_data['info'][file]['end_time']
-                elapsed = self.file_data['info'][file]['elapsed']
-                ran = self.file_data['info'][file]['ran']
-                results.append([order, file, start_time, end_time, elapsed,
-                    success_string[ran]])
+        for order, file in enumerate(file_data['meta']['files'], start = 1):
+            info = file_data['info'].get(file, None)
+            if info is None:
+                status = 'NA'
+            elif info.get('skipped'):
+                status = 'Skipped'
+            elif info.get('blocked_by'):
+                status = 'Blocked'
             else:
-                results.append([order, file, 'NA', 'NA', 'NA', 'NA'])
+                status = success_string[info['ran']]
+            info = info or {}
+            name = file
+            if parent is not None:
+                order = '{}.{}'.format(parent[0], order)
+                name = '{}/{}'.format(parent[1], file)
+            timing = info.get('timing', {})
+            results.append(
+                [order, name,
+                 self.format_time(timing.get('start_epoch')),
+                 self.format_time(timing.get('end_epoch')),
+                 self.format_duration(timing.get('elapsed'))] +
+                [self.format_resource(key, info.get(key))
+                 for key, _ in RESOURCE_COLUMNS] +
+                [self.format_duration(timing.get('spawn_latency')),
+                 self.format_duration(timing.get('first_output')),
+                 info.get('returncode', 'NA'),
+                 len(info['attempts']) if 'attempts' in info else 'NA',
+                 status])
+            if 'pipeline' in info:
+                results.extend(self.format_file_data(
+                    info['pipeline'], (order, name)))
         return results
 
 
+    @staticmethod
+    def format_time(epoch):
+        """Format a wall-clock time, in seconds since the epoch, as local
+        time to the millisecond, or 'NA' for None.
+        """
+        if epoch is None:
+            return 'NA'
+        return '{}.{:03d}'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch)),
+            int(epoch % 1 * 1000))
+
+
+    @staticmethod
+    def format_duration(seconds):
+        """Format a number of seconds in whichever unit suits it best, such
+        as 850 us, 12.3 ms, 4.56 s or 1h 02m 03s, or 'NA' for None.
+        """
+        if seconds is None:
+            return 'NA'
+        if seconds < 1e-3:
+            return '{:.0f} us'.format(seconds * 1e6)
+        if seconds < 1:
+            return '{:.1f} ms'.format(seconds * 1e3)
+        if seconds < 60:
+            return '{:.2f} s'.format(seconds)
+        minutes, seconds = divmod(int(round(seconds)), 60)
+        if minutes < 60:
+            return '{}m {:02d}s'.format(minutes, seconds)
+        return '{}h {:02d}m {:02d}s'.format(minutes // 60, minutes % 60,
+                                             seconds)
+
+
+    @staticmethod
+    def format_resource(key, value):
+        """Format a file's usage of one of RESOURCE_COLUMNS: CPU times as
+        durations (see format_duration), megabytes to one decimal place, and
+        counts as they are, or 'NA' for None.
+        """
+        if value is None:
+            return 'NA'
+        if key in ('user_time', 'system_time'):
+            return RunningShoes.format_duration(value)
+        if key in ('max_rss', 'memory_peak'):
+            return '{:.1f}'.format(value)
+        return value
+
+
+    @staticmethod
+    def file_data_headers():
+        """The column headers for the rows made by format_file_data.
+        """
+        return ['Order', 'File name', 'Start time', 'End time', 'Elapsed'] + \
+               [header for _, header in RESOURCE_COLUMNS] + \
+               ['Spawn', 'First output', 'Exit code', 'Attempts', 'Status']
+
+
     def pretty_file_data(self):
         """Pretty version of file_data to be printed out.
         """
-        headers = ['Order', 'File name', 'Start time', 'End time',
-                   'Time elapsed (mins)', 'Status']
-        return tabulate(self.format_file_data(), headers = headers,
-            tablefmt = 'psql')
+        from tabulate import tabulate
+        return tabulate(self.format_file_data(),
+            headers = self.file_data_headers(), tablefmt = 'psql')
 
 
     def __str__(self):
@@ -201,11 +2172,342 @@ class RunningShoes(object):
     __repr__ = __str__
 
 
-    def run(self):
+    def prepare_run(self, incremental = False, resume = False, only = None):
+        """Get ready for a run, working out which files to skip and starting a
+        fresh journal. See the run method for the parameters. The run's own
+        timing record (see start_timing) is kept in file_data['meta'], so the
+        time spent outside of the files themselves can be told apart.
+        """
+        self.file_data['meta']['timing'] = self.start_timing()
+        self.incremental = incremental
+        self.resuming = resume
+        self.file_data['info'] = {}
+        self.excluded = set()
+        if only is not None:
+            self.excluded = set(self.files) - set(only)
+        self.skip = set(self.excluded)
+        if incremental:
+            self.state = self.load_state()
+            self.fingerprint = self.fingerprints(self.plan_dependencies())
+            # -- a sub-pipeline is always run, and skips its own files
+            self.skip.update(f for f in self.files
+                             if self.state.get(f) == self.fingerprint[f] and
+                             not os.path.isdir(self.directory + f))
+        previous = self.load_journal() if resume or self.excluded else None
+        if previous is not None and resume:
+            self.skip.update(f for f in self.files if previous['files'].get(f)
+                             in ('success', 'skipped'))
+        # -- a file cannot be streamed into without the file streaming into it
+        for producer, (consumer, _) in self.streams.items():
+            if producer not in self.skip or consumer not in self.skip:
+                self.skip.difference_update([producer, consumer])
+        if self.cgroups and self.cgroup_tree is None:
+            from .cgroups import CgroupTree
+            parent = None if self.cgroups is True else self.cgroups
+            # -- without cgroups, files still get their limits as rlimits,
+            # -- but a group we were pointed at has to be usable
+            self.cgroup_tree = CgroupTree.create(parent)
+            if self.cgroup_tree is None and parent is not None:
+                raise Exception('Cannot run files in cgroups inside {}, which '
+                                'needs to be a cgroup v2 group delegated to us '
+                                'with no processes in it!'.format(parent))
+            self.owns_cgroup_tree = self.cgroup_tree is not None
+        if self.artifacts and self.artifact_store is None:
+            from .artifacts import ArtifactStore
+            self.artifact_store = ArtifactStore.create()
+            self.owns_artifact_store = True
+        if self.trace and self.tracer is None:
+            from .trace import Tracer
+            self.tracer = Tracer(self.directory)
+            self.tracer.start()
+            self.owns_tracer = True
+        self.journal = {
+            'started': time.strftime('%c'),
+            'files': dict((f, 'pending') for f in self.files)
+        }
+        # -- files left out by only keep whatever the last run left them as
+        for file in self.excluded:
+            if previous is not None and file in previous['files']:
+                self.journal['files'][file] = previous['files'][file]
+        self.journal_error = None
+        return None
+
+
+    def finish_run(self, report = True):
+        """Clean up after a run, recording it in the run history if there is
+        one, and printing out file_data (and any regressions) if report is
+        True.
+        """
+        self.stop_timing(self.file_data['meta']['timing'])
+        if self.fork_server is not None:
+            self.fork_server.close()
+            self.fork_server = None
+        if self.owns_artifact_store:
+            self.artifact_store.destroy()
+            self.artifact_store = None
+            self.owns_artifact_store = False
+        if self.owns_cgroup_tree:
+            self.cgroup_tree.destroy()
+            self.cgroup_tree = None
+            self.owns_cgroup_tree = False
+        if self.owns_tracer:
+            self.tracer.stop()
+            self.tracer.write(self.trace)
+            self.tracer = None
+            self.owns_tracer = False
+        if report:
+            print(self.pretty_file_data())
+        if self.history is not None:
+            self.history.record(self)
+            if report:
+                print(self.history.report(self.directory))
+        return None
+
+
+    def run(self, incremental = False, resume = False, only = None):
         """Run all of the files! This is the worker method for the whole class.
+
+        Parameters
+        ----------
+        incremental : bool (default is False)
+            when True, skip every file whose fingerprint (see the fingerprints
+            method) is the same as it was the last time the file ran
+            successfully. Fingerprints are kept in .runningshoes/state.json in
+            the directory.
+
+        resume : bool (default is False)
+            when True, skip every file that ran successfully (or was skipped)
+            in the last run, according to the journal that every run keeps in
+            .runningshoes/journal.json in the directory. See the resume method.
+
+        only : list (default is every file)
+            the files to run, skipping the rest
         """
+        self.prepare_run(incremental, resume, only)
         try:
-            self.run_files()
+            self.run_plan()
         finally:
-            print(self.pretty_file_data())
+            self.finish_run()
+        return None
+
+
+    def run_plan(self):
+        """Run the files by the dependency graph when graph is True, by stage
+        when parallel is True, and otherwise one at a time.
+        """
+        if self.graph:
+            return self.run_graph()
+        if self.parallel:
+            return self.run_stages()
+        return self.run_files()
+
+
+    def resume(self, incremental = False):
+        """Resume the last run, starting again from the files that failed or
+        never finished and skipping the files that already ran successfully.
+        If there is no journal of a previous run, every file is run.
+        """
+        return self.run(incremental = incremental, resume = True)
+
+
+    def format_plan(self, incremental = False):
+        """The plan for a run, as a list of lists with each file's order, name,
+        the command that runs it, the files it waits for, and whether it would
+        be run or skipped (see the run method for incremental).
+        """
+        dependencies = self.plan_dependencies()
+        skip = set()
+        if incremental:
+            state = self.load_state()
+            fingerprint = self.fingerprints(dependencies)
+            skip = set(f for f in self.files
+                       if state.get(f) == fingerprint[f] and
+                       not os.path.isdir(self.directory + f))
+        results = []
+        for file in self.files:
+            if os.path.isdir(self.directory + file):
+                command = 'sub-pipeline'
+            else:
+                command = ' '.join(self.extensions.get(
+                    os.path.splitext(file)[1], ['?']))
+            results.append([self.file_orders[file], file, command,
+                            ', '.join(dependencies[file]) or '-',
+                            'Skip' if file in skip else 'Run'])
+        return results
+
+
+    def dry_run(self, incremental = False):
+        """Print out what a run would do, without running anything.
+        """
+        from tabulate import tabulate
+        print(tabulate(self.format_plan(incremental),
+                       headers = ['Order', 'File name', 'Command', 'Waits for',
+                                  'Action'],
+                       tablefmt = 'psql'))
+        return None
+
+
+    def downstream(self, files):
+        """The given files along with every file downstream of them in the
+        dependency graph that run follows, in run order.
+        """
+        dependencies = self.plan_dependencies()
+        affected = set(files)
+        for file in self.topological_order(dependencies):
+            if affected.intersection(dependencies[file]):
+                affected.add(file)
+        return [f for f in self.files if f in affected]
+
+
+    def watched_subpipelines(self):
+        """Every sub-pipeline directory inside this one, all the way down, as a
+        dict mapping each directory to the file here that runs it.
+        """
+        subpipelines = {}
+        for file in self.files:
+            path = os.path.normpath(self.directory + file)
+            if not os.path.isdir(path):
+                continue
+            subpipelines[path] = file
+            try:
+                child = self.subpipeline(path + os.sep)
+            except Exception:
+                # -- such as while it has two files with the same prefix
+                continue
+            for directory in child.watched_subpipelines():
+                subpipelines[directory] = file
+        return subpipelines
+
+
+    def watched_paths(self):
+        """The paths whose changes matter to a watch: each file, and each
+        file's declared inputs, as a dict mapping each path to the files that
+        read it. Declared outputs are left out, since the files write them.
+        The paths that matter to a sub-pipeline are watched all the way down,
+        and map to the file here that runs it.
+        """
+        outputs = set(os.path.normpath(os.path.join(self.directory, o))
+                      for file in self.files
+                      for o in self.options[file].get('outputs', []))
+        paths = {}
+        for file in self.files:
+            path = os.path.normpath(self.directory + file)
+            if os.path.isdir(path):
+                try:
+                    child = self.subpipeline(path + os.sep)
+                except Exception:
+                    continue
+                for p in child.watched_paths():
+                    paths.setdefault(p, []).append(file)
+                continue
+            paths.setdefault(path, []).append(file)
+            for i in self.options[file].get('inputs', []):
+                path = os.path.normpath(os.path.join(self.directory, i))
+                if path not in outputs:
+                    paths.setdefault(path, []).append(file)
+        return paths
+
+
+    def reload(self):
+        """Look for files in the directory again, and re-read their options,
+        which may have changed since they were last read.
+        """
+        self.files = self.identify_files()
+        self.stages = self.group_stages(self.files)
+        self.options = self.read_options()
+        self.streams = self.stream_pairs()
+        self.declared_dependencies = None
+        self.file_data['meta']['files'] = self.files
+        if self.index is not None:
+            self.index.save()
+        return None
+
+
+    def watch(self, debounce = 0.5, poll_interval = 1.0, initial_run = True,
+              incremental = False, use_inotify = True):
+        """Watch the directory, and whenever a file or one of its declared
+        inputs changes, run it along with everything downstream of it (see the
+        downstream method), skipping the rest. When files are added or removed,
+        or the manifest changes, the directory is reloaded and every file is
+        run. Sub-pipelines are watched all the way down, and any change to
+        their files or inputs, or files added to or removed from them, runs
+        the sub-pipeline along with everything downstream of it. Failures are
+        printed rather than raised, and watching carries on until it is
+        interrupted, such as with Ctrl-C.
+
+        Changes are picked up with inotify where it is available, and by
+        polling otherwise; see DirectoryWatcher.
+
+        Parameters
+        ----------
+        debounce : float (default is 0.5)
+            how many seconds to wait after a change for any more changes, so
+            that a burst of edits leads to one run
+
+        poll_interval : float (default is 1.0)
+            how many seconds to wait between looks at the directory when
+            polling
+
+        initial_run : bool (default is True)
+            whether to run every file once before watching
+
+        incremental : bool (default is False)
+            passed on to each run; see the run method
+
+        use_inotify : bool (default is True)
+            whether to use inotify when it is available
+        """
+        from .watch import DirectoryWatcher
+        only = None if initial_run else []
+        watcher = None
+        try:
+            while True:
+                if only is None or only:
+                    try:
+                        self.run(incremental = incremental, only = only)
+                    except Exception as e:
+                        print('{}: {}'.format(type(e).__name__, e))
+                paths = self.watched_paths()
+                subpipelines = self.watched_subpipelines()
+                directories = sorted(set([os.path.normpath(self.directory)]) |
+                                     set(os.path.dirname(p) for p in paths) |
+                                     set(subpipelines))
+                if watcher is None or watcher.directories != directories:
+                    if watcher is not None:
+                        watcher.close()
+                    watcher = DirectoryWatcher(directories,
+                                               debounce = debounce,
+                                               poll_interval = poll_interval,
+                                               use_inotify = use_inotify)
+                print('Watching {} for changes ({})...'.format(
+                    self.directory, watcher.method))
+                only = []
+                while not only:
+                    changed = set(os.path.normpath(p)
+                                  for p in watcher.changes())
+                    names = set(os.path.basename(p) for p in changed
+                                if os.path.dirname(p) ==
+                                os.path.normpath(self.directory))
+                    files = self.files
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        print('{}: {}'.format(type(e).__name__, e))
+                        continue
+                    if MANIFEST_NAME in names or self.files != files:
+                        only = None
+                        break
+                    # -- a file added to or removed from a sub-pipeline
+                    added = [subpipelines[os.path.dirname(p)] for p in changed
+                             if p not in paths and p not in subpipelines and
+                             os.path.dirname(p) in subpipelines and
+                             (self.parse_file_name(os.path.basename(p))
+                              is not None or
+                              os.path.basename(p) == MANIFEST_NAME)]
+                    only = self.downstream(
+                        [f for p in changed for f in paths.get(p, [])] +
+                        added)
+        finally:
+            if watcher is not None:
+                watcher.close()
         return None
@@ -0,0 +1,251 @@
+from __future__ import division, print_function
+
+"""trace.py - Tracer class, for exporting a run as a Chrome trace.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+# -- where Linux reports on each process
+PROC = '/proc'
+
+
+def process_tree_usage(root):
+    """The CPU time (in seconds) and resident memory (in megabytes) of a
+    process and all of its descendants, or None where /proc is not available.
+    CPU time includes what each process's waited-for children used, so that
+    processes that have already finished still count.
+    """
+    try:
+        ticks = os.sysconf('SC_CLK_TCK')
+        page = os.sysconf('SC_PAGE_SIZE')
+        pids = [p for p in os.listdir(PROC) if p.isdigit()]
+    except (AttributeError, ValueError, OSError):
+        return None
+    stats = {}
+    for pid in pids:
+        try:
+            with open(os.path.join(PROC, pid, 'stat')) as f:
+                # -- the command name may hold spaces, so split after it
+                fields = f.read().rpartition(')')[2].split()
+        except OSError:
+            continue
+        # -- ppid, utime, stime, cutime, cstime and rss, counting from state
+        stats[int(pid)] = (int(fields[1]), sum(int(t) for t in fields[11:15]),
+                           int(fields[21]))
+    if root not in stats:
+        return None
+    children = {}
+    for pid, (ppid, _, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+    cpu = rss = 0
+    tree = [root]
+    while tree:
+        pid = tree.pop()
+        cpu += stats[pid][1]
+        rss += stats[pid][2]
+        tree.extend(children.get(pid, ()))
+    return cpu / ticks, rss * page / (1024 * 1024)
+
+
+class Tracer(object):
+    """Records a run as a timeline in the Chrome trace-event format, which
+    can be opened in Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+    Each file that runs is a span on the track of the worker slot it ran in,
+    where a slot is one of the files that can run at once, and each attempt
+    at a file is a span inside the file's. Alongside them are counters of the
+    CPU (in cores) and resident memory (in MB) used by the run and every
+    process it started, sampled every interval seconds from /proc.
+
+    Times are taken from the monotonic clock, relative to when the tracer was
+    started, and the wall-clock time it was started at is kept in the
+    trace's metadata.
+
+    Examples -------------------------------------------------------------------
+
+    tracer = Tracer('/path/to/pipeline/')
+    tracer.start()
+    tracer.begin('/path/to/pipeline/1-transfer_data.sh')
+    ...
+    tracer.end('/path/to/pipeline/1-transfer_data.sh', 'success')
+    tracer.stop()
+    tracer.write('trace.json')
+    """
+
+
+    def __init__(self, root, interval = 0.5):
+        """Initialize a Tracer object.
+
+        Parameters
+        ----------
+        root : string
+            the directory being run, which files are named relative to
+
+        interval : float (default is 0.5)
+            how many seconds apart to sample CPU and memory, or None not to
+        """
+        self.root = root
+        self.interval = interval
+        self.origin = None
+        self.started = None
+        self.events = []
+        self.spans = {}
+        self.attempts = {}
+        self.slots = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = None
+
+
+    def now(self):
+        """Microseconds since the tracer was started, as trace events want.
+        """
+        return (time.monotonic_ns() - self.origin) / 1000
+
+
+    def name(self, path):
+        """What a file is called in the trace: its path relative to root.
+        """
+        return os.path.relpath(path, self.root)
+
+
+    def start(self):
+        """Start the clock, and sampling CPU and memory.
+        """
+        self.origin = time.monotonic_ns()
+        self.started = time.time()
+        self.stopped.clear()
+        if self.interval:
+            self.sampler = threading.Thread(target = self.sample)
+            self.sampler.daemon = True
+            self.sampler.start()
+        return None
+
+
+    def sample(self):
+        """Add CPU and memory counters every interval seconds until stopped.
+        """
+        previous = None
+        while True:
+            usage = process_tree_usage(os.getpid())
+            if usage is None:
+                return None
+            now = self.now()
+            with self.lock:
+                if previous is not None and now > previous[0]:
+                    cores = max(usage[0] - previous[1], 0) / \
+                        ((now - previous[0]) / 1e6)
+                    self.events.append({'name': 'CPU', 'ph': 'C', 'pid': 1,
+                                        'ts': now,
+                                        'args': {'cores': round(cores, 3)}})
+                self.events.append({'name': 'RSS', 'ph': 'C', 'pid': 1,
+                                    'ts': now,
+                                    'args': {'MB': round(usage[1], 1)}})
+            previous = (now, usage[0])
+            if self.stopped.wait(self.interval):
+                return None
+
+
+    def begin(self, path):
+        """Record that a file has started, in the lowest free slot.
+        """
+        with self.lock:
+            if None in self.slots:
+                slot = self.slots.index(None)
+                self.slots[slot] = path
+            else:
+                slot = len(self.slots)
+                self.slots.append(path)
+            self.spans[path] = (slot, self.now())
+        return None
+
+
+    def end(self, path, status, args = None):
+        """Record that a file has finished with a status ('success' or
+        'failure'), along with any args to show with its span.
+        """
+        with self.lock:
+            if path not in self.spans:
+                return None
+            slot, start = self.spans.pop(path)
+            self.slots[slot] = None
+            self.attempts.pop(path, None)
+            args = dict(args or {}, status = status)
+            self.events.append({'name': self.name(path), 'cat': 'step',
+                                'ph': 'X', 'pid': 1, 'tid': slot + 1,
+                                'ts': start, 'dur': self.now() - start,
+                                'args': args})
+        return None
+
+
+    def begin_attempt(self, path):
+        """Record that an attempt at a running file has started.
+        """
+        with self.lock:
+            self.attempts.setdefault(path, []).append(self.now())
+        return None
+
+
+    def end_attempt(self, path, error = None):
+        """Record that the latest attempt at a running file has finished,
+        with the error it failed with, if any.
+        """
+        with self.lock:
+            if path not in self.spans or not self.attempts.get(path):
+                return None
+            number = len(self.attempts[path])
+            start = self.attempts[path][-1]
+            args = {'attempt': number}
+            if error is not None:
+                args['error'] = str(error)
+            self.events.append({'name': '{} (attempt {})'.format(
+                                    self.name(path), number),
+                                'cat': 'attempt', 'ph': 'X', 'pid': 1,
+                                'tid': self.spans[path][0] + 1, 'ts': start,
+                                'dur': self.now() - start, 'args': args})
+        return None
+
+
+    def stop(self):
+        """Stop sampling, and close the span of any file still running.
+        """
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+        for path in list(self.spans):
+            self.end(path, 'unfinished')
+        return None
+
+
+    def trace(self):
+        """The trace, as a dict in the Chrome trace-event JSON format.
+        """
+        with self.lock:
+            events = [{'name': 'process_name', 'ph': 'M', 'pid': 1,
+                       'args': {'name': self.root}}]
+            for slot in range(len(self.slots)):
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1,
+                               'tid': slot + 1,
+                               'args': {'name': 'Slot {}'.format(slot + 1)}})
+            events.extend(sorted(self.events, key = lambda e: e['ts']))
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'directory': self.root,
+                              'started': self.started}}
+
+
+    def write(self, path):
+        """Write the trace out, as JSON, to path.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(self.trace(), f)
+        os.replace(temporary, path)
+        return None
@@ -0,0 +1,159 @@
+from __future__ import print_function
+
+"""command_line.py - the runningshoes command-line utility.
+"""
+
+import argparse
+import os
+
+
+def parse_args(args = None):
+    """Parse the command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description = 'Run all of the files in a directory with a prefix of '
+                      '<integer>- in the order of their integer prefixes.')
+    parser.add_argument('--directory', default = os.getcwd(),
+        help = 'the directory to run prefixed files in (default is the '
+               'current working directory)')
+    parser.add_argument('--directories', nargs = '+', default = None,
+        help = 'run many directories (or glob patterns of directories) at '
+               'once, sharing --max-workers between them (cannot be used with '
+               '--watch, --warm-python, --preload or --batch-hql)')
+    parser.add_argument('--parallel', action = 'store_true',
+        help = 'run files that share an integer prefix at the same time')
+    parser.add_argument('--graph', action = 'store_true',
+        help = 'run each file as soon as the files it needs have finished')
+    parser.add_argument('--max-workers', type = int, default = None,
+        help = 'the most files to run at the same time (default is the number '
+               'of CPUs)')
+    parser.add_argument('--cores', type = float, default = None,
+        help = 'how many cores files may reserve at once, scheduling files by '
+               'the cores and memory they declare (default is every CPU)')
+    parser.add_argument('--memory', type = float, default = None,
+        help = 'how many GB of memory files may reserve at once (default is '
+               "the machine's total memory)")
+    parser.add_argument('--incremental', action = 'store_true',
+        help = 'skip files that have not changed since they last succeeded')
+    parser.add_argument('--resume', action = 'store_true',
+        help = 'resume the last run from the files that failed or never '
+               'finished')
+    parser.add_argument('--history', default = None,
+        help = 'a SQLite database to record every run in, flagging files '
+               'that have regressed against their previous runs')
+    parser.add_argument('--warm-python', action = 'store_true',
+        help = 'run .py files in forked children of one warm interpreter')
+    parser.add_argument('--preload', action = 'append', default = [],
+        help = 'a module for the warm interpreter to import up front (may be '
+               'given more than once)')
+    parser.add_argument('--batch-hql', action = 'store_true',
+        help = 'run consecutive .hql files in a single Hive session, which '
+               'carries USE, SET and temporary tables over from one file to '
+               'the next')
+    parser.add_argument('--logs', nargs = '?', const = True, default = None,
+        help = "capture each file's output in its own log, in this directory "
+               '(default is .runningshoes/logs; with --directories, each '
+               'directory gets a directory of its own inside it)')
+    parser.add_argument('--tee', action = 'store_true',
+        help = 'when capturing logs, also show the output as it is written')
+    parser.add_argument('--timeout', type = float, default = None,
+        help = 'kill any file that runs for longer than this many seconds')
+    parser.add_argument('--retries', type = int, default = None,
+        help = 'how many more times to try a file that fails')
+    parser.add_argument('--backoff', type = float, default = 1.0,
+        help = 'seconds to wait before the first retry, doubling each time')
+    parser.add_argument('--cgroups', nargs = '?', const = True,
+                        default = False,
+        help = 'run each file in a cgroup of its own, when cgroups are '
+               'available, inside this delegated group with no processes in '
+               'it (default is the group we run in, which only allows '
+               'accounting, not limits)')
+    parser.add_argument('--memory-max', type = float, default = None,
+        help = 'the most GB of memory any file may use')
+    parser.add_argument('--trace', nargs = '?', const = True, default = None,
+        help = 'write each run out as a Chrome trace, to this file (default '
+               'is .runningshoes/trace.json; with --directories, the name of '
+               'each directory is added to it)')
+    parser.add_argument('--artifacts', action = 'store_true',
+        help = 'give each run a shared-memory artifact store')
+    parser.add_argument('--dry-run', action = 'store_true',
+        help = 'print out what would be run, without running anything')
+    parser.add_argument('--no-cache', action = 'store_true',
+        help = 'do not keep an index of what is in the directory')
+    parser.add_argument('--watch', action = 'store_true',
+        help = 'keep watching the directory, re-running whatever changes')
+    parser.add_argument('--on-failure', default = 'fail-fast',
+        choices = ['fail-fast', 'continue-independent', 'continue'],
+        help = 'what to do once a file fails (default is fail-fast)')
+    parsed = parser.parse_args(args)
+    if parsed.directories is not None:
+        # -- the Orchestrator runs directories with AsyncRunningShoes, which
+        # -- cannot do any of these
+        unsupported = [flag for flag, given in [
+            ('--watch', parsed.watch), ('--warm-python', parsed.warm_python),
+            ('--preload', parsed.preload), ('--batch-hql', parsed.batch_hql)]
+            if given]
+        if unsupported:
+            parser.error('--directories cannot be used with {}'.format(
+                ', '.join(unsupported)))
+    return parsed
+
+
+def launch_new_instance(args = None):
+    """Entry point for the runningshoes console script.
+    """
+    args = parse_args(args)
+    # -- imported once the arguments are parsed, so that --help is instant
+    from runningshoes import RunningShoes
+    timeouts = {'*': args.timeout} if args.timeout is not None else None
+    retries = {'*': args.retries} if args.retries is not None else None
+    limits = {'*': {'memory_max': args.memory_max}} \
+        if args.memory_max is not None else None
+    capacity = None
+    if args.cores is not None or args.memory is not None:
+        capacity = {'cores': args.cores, 'memory': args.memory}
+    if args.directories is not None:
+        from runningshoes.orchestrate import Orchestrator
+        orchestrator = Orchestrator(
+            args.directories, max_workers = args.max_workers,
+            parallel = args.parallel, graph = args.graph,
+            history = args.history, logs = args.logs, tee = args.tee,
+            timeouts = timeouts, retries = retries, backoff = args.backoff,
+            on_failure = args.on_failure, cache = not args.no_cache,
+            artifacts = args.artifacts, capacity = capacity,
+            cgroups = args.cgroups, limits = limits, trace = args.trace)
+        if args.dry_run:
+            for directory, runner in orchestrator.runners.items():
+                print(directory)
+                runner.dry_run(incremental = args.incremental)
+        else:
+            orchestrator.run(incremental = args.incremental,
+                             resume = args.resume)
+        return None
+    run = RunningShoes(args.directory, parallel = args.parallel,
+                       max_workers = args.max_workers, graph = args.graph,
+                       history = args.history, warm_python = args.warm_python,
+                       preload = args.preload, batch_hql = args.batch_hql,
+                       logs = args.logs, tee = args.tee, timeouts = timeouts,
+                       retries = retries, backoff = args.backoff,
+                       on_failure = args.on_failure,
+                       cache = not args.no_cache,
+                       artifacts = args.artifacts, capacity = capacity,
+                       cgroups = args.cgroups, limits = limits,
+                       trace = args.trace)
+    if args.dry_run:
+        run.dry_run(incremental = args.incremental)
+    elif args.watch:
+        try:
+            run.watch(incremental = args.incremental)
+        except KeyboardInterrupt:
+            pass
+    elif args.resume:
+        run.resume(incremental = args.incremental)
+    else:
+        run.run(incremental = args.incremental)
+    return None
+
+
+if __name__ == '__main__':
+    launch_new_instance()
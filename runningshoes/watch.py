@@ -0,0 +1,215 @@
+from __future__ import print_function
+
+"""watch.py - DirectoryWatcher class.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+
+# -- inotify events that mean a file's contents or presence changed
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class DirectoryWatcher(object):
+    """Wait for files in a set of directories to change. On Linux this uses
+    inotify, so that waiting costs nothing and changes are seen as soon as
+    they happen; anywhere inotify is not available (or cannot be used, such as
+    on some network filesystems), it falls back to polling the modification
+    time and size of every file in the directories.
+
+    Bursts of changes, such as an editor writing a file in several steps or a
+    checkout touching many files, are debounced into a single set of changes.
+
+    Examples -------------------------------------------------------------------
+
+    watcher = DirectoryWatcher(['/path/to/pipeline/'])
+    while True:
+        print(watcher.changes())
+    """
+
+
+    def __init__(self, directories, debounce = 0.5, poll_interval = 1.0,
+                 use_inotify = True):
+        """Initialize a DirectoryWatcher object.
+
+        Parameters
+        ----------
+        directories : list
+            the directories to watch. Only the files directly inside each
+            directory are watched, not those in its subdirectories.
+
+        debounce : float (default is 0.5)
+            how many seconds to wait after a change for any more changes
+            before reporting them
+
+        poll_interval : float (default is 1.0)
+            how many seconds to wait between looks at the directories when
+            polling
+
+        use_inotify : bool (default is True)
+            whether to use inotify when it is available
+        """
+        self.directories = sorted(set(os.path.abspath(d) for d in directories
+                                      if os.path.isdir(d)))
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.watches = {}
+        if use_inotify:
+            self.start_inotify()
+        if self.fd is None:
+            self.snapshot = self.scan()
+
+
+    def start_inotify(self):
+        """Set up an inotify instance watching every directory, leaving fd as
+        None if inotify cannot be used.
+        """
+        name = ctypes.util.find_library('c')
+        if name is None:
+            return None
+        libc = ctypes.CDLL(name, use_errno = True)
+        if not hasattr(libc, 'inotify_init1'):
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        for directory in self.directories:
+            wd = libc.inotify_add_watch(fd, directory.encode('utf-8'),
+                                        WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                self.watches = {}
+                return None
+            self.watches[wd] = directory
+        self.fd = fd
+        return None
+
+
+    @property
+    def method(self):
+        """How changes are being watched for: 'inotify' or 'polling'.
+        """
+        return 'polling' if self.fd is None else 'inotify'
+
+
+    def scan(self):
+        """The modification time and size of every file in the directories,
+        as a dict keyed by path.
+        """
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+    def read_events(self, timeout):
+        """Wait up to timeout seconds (forever if None) for inotify events,
+        returning the paths they are about.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_IGNORED or wd not in self.watches:
+                continue
+            paths.add(os.path.join(self.watches[wd], os.fsdecode(name)))
+        return paths
+
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds (forever if None) for the next poll that
+        finds a change, returning the paths that changed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self.poll_interval if deadline is None else \
+                min(self.poll_interval, deadline - time.time())
+            if wait > 0:
+                time.sleep(wait)
+            snapshot = self.scan()
+            paths = set(path for path in set(snapshot) | set(self.snapshot)
+                        if snapshot.get(path) != self.snapshot.get(path))
+            self.snapshot = snapshot
+            if paths or (deadline is not None and time.time() >= deadline):
+                return paths
+
+
+    def wait(self, timeout = None):
+        """Wait up to timeout seconds (forever if None) for a change, returning
+        the paths that changed.
+        """
+        if self.fd is None:
+            return self.poll(timeout)
+        return self.read_events(timeout)
+
+
+    def changes(self, timeout = None):
+        """Wait up to timeout seconds (forever if None) for files to change,
+        then keep collecting changes until debounce seconds go by without any,
+        and return every path that changed.
+        """
+        paths = self.wait(timeout)
+        while paths:
+            more = self.wait(self.debounce)
+            if not more:
+                break
+            paths |= more
+        return paths
+
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        return None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -10,6 +10,7 @@ setup(
     author = 'Jake Sherman',
     author_email = 'jake@jakesherman.com',
     license = 'MIT license',
+    python_requires = '>=3.9',
     packages = ['runningshoes', 'runningshoes.utilities'],
     package_dir = {
         'runningshoes':'runningshoes',
@@ -21,7 +22,9 @@ setup(
         ]
     },
     install_requires = [
-        'pandas',
         'tabulate',
     ],
+    extras_require = {
+        'pandas': ['pandas'],
+    },
     zip_safe = False)
@@ -0,0 +1,66 @@
+"""conftest.py - fixtures shared by the tests.
+"""
+
+import os
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    """Make a pipeline directory from a dict mapping file names (which may
+    include sub-directories) to their contents, returning its path with a
+    trailing slash.
+    """
+    def make(files, name = 'pipeline'):
+        root = tmp_path / name
+        root.mkdir(exist_ok = True)
+        for file_name, content in files.items():
+            path = root / file_name
+            path.parent.mkdir(parents = True, exist_ok = True)
+            path.write_text(content)
+        return str(root) + os.sep
+    return make
+
+
+@pytest.fixture
+def runner():
+    """Make a RunningShoes that runs .py files with the interpreter running
+    the tests, keeping no discovery index unless asked to.
+    """
+    from runningshoes import RunningShoes
+
+    def make(directory, **options):
+        options.setdefault('cache', False)
+        extensions = dict(options.pop('custom_extensions', {}))
+        extensions.setdefault('.py', [sys.executable])
+        return RunningShoes(directory, custom_extensions = extensions,
+                            **options)
+    return make
+
+
+def noted(log, body = 'sleep 0.3'):
+    """The contents of a shell file that runs body, noting in log when it
+    starts and ends (see spans).
+    """
+    return ('echo "start $(basename $0)" >> {0}\n{1}\n'
+            'echo "end $(basename $0)" >> {0}\n').format(log, body)
+
+
+def spans(log):
+    """When each file noted in log (see noted) started and ended, as a dict of
+    (start, end) positions in the log, which can be compared with each other
+    however coarse the clock is.
+    """
+    positions = {}
+    for position, line in enumerate(log.read_text().splitlines()):
+        event, name = line.split()
+        positions.setdefault(name, [None, None])[event == 'end'] = position
+    return dict((name, tuple(span)) for name, span in positions.items())
+
+
+def overlapped(first, second):
+    """Whether two spans (see spans) overlap.
+    """
+    return first[0] < second[1] and second[0] < first[1]
@@ -0,0 +1,116 @@
+"""test_artifacts.py - tests of handing data between files in memory.
+"""
+
+import collections
+import os
+
+import pytest
+
+import runningshoes
+from runningshoes.artifacts import ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ArtifactStore.create(root = str(tmp_path))
+    yield store
+    store.destroy()
+
+
+def test_bytes_come_back_without_a_copy(store):
+    store.publish('raw', b'\x00\x01' * 1000)
+    data = store.read('raw')
+    assert isinstance(data, memoryview) and data.readonly
+    assert bytes(data) == b'\x00\x01' * 1000
+
+
+def test_anything_else_is_pickled(store):
+    data = collections.OrderedDict([('a', [1, 2]), ('b', {'c': None})])
+    store.publish('thing', data)
+    assert store.read('thing') == data
+    assert ArtifactStore.encode(data)[0] == {'kind': 'pickle'}
+
+
+def test_names_and_removal(store):
+    store.publish('a', b'1')
+    store.publish('b', b'2')
+    assert store.names() == ['a', 'b']
+    store.remove('a')
+    assert store.names() == ['b']
+    with pytest.raises(KeyError):
+        store.read('a')
+    with pytest.raises(ValueError):
+        store.publish('../escape', b'3')
+
+
+def test_numpy_arrays_come_back_without_a_copy(store):
+    numpy = pytest.importorskip('numpy')
+    array = numpy.arange(12, dtype = 'f8').reshape(3, 4)
+    store.publish('array', array)
+    data = store.read('array')
+    assert (data == array).all() and data.shape == (3, 4)
+    assert not data.flags.writeable and not data.flags.owndata
+    # -- a masked array holds more than its data, so it is pickled
+    masked = numpy.ma.masked_array([1, 2], mask = [False, True])
+    assert ArtifactStore.encode(masked)[0] == {'kind': 'pickle'}
+    store.publish('masked', masked)
+    assert store.read('masked').mask.tolist() == [False, True]
+
+
+def test_numpy_scalars_and_0d_arrays_keep_their_shape(store):
+    numpy = pytest.importorskip('numpy')
+    store.publish('scalar', numpy.float64(1.5))
+    scalar = store.read('scalar')
+    assert type(scalar) is numpy.float64 and scalar == 1.5
+    store.publish('0d', numpy.array(7, dtype = 'i4'))
+    array = store.read('0d')
+    assert array.shape == () and array.dtype == 'i4' and array == 7
+
+
+def test_arrow_tables_come_back_without_a_copy(store):
+    pyarrow = pytest.importorskip('pyarrow')
+    table = pyarrow.table({'x': list(range(1000))})
+    store.publish('table', table)
+    allocated = pyarrow.total_allocated_bytes()
+    data = store.read('table')
+    assert data.equals(table)
+    # -- the columns are read in place from the mapped artifact
+    assert pyarrow.total_allocated_bytes() == allocated
+    batch = pyarrow.record_batch({'y': [1, 2]})
+    store.publish('batch', batch)
+    assert store.read('batch').to_pydict() == {'y': [1, 2]}
+    # -- other Arrow objects are pickled
+    assert ArtifactStore.encode(pyarrow.array([1, 2]))[0] == \
+        {'kind': 'pickle'}
+
+
+def test_only_data_frames_are_stored_as_arrow(store):
+    pandas = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    frame = pandas.DataFrame({'x': [1, 2], 'y': ['a', 'b']})
+    store.publish('frame', frame)
+    assert store.read('frame').equals(frame)
+    assert ArtifactStore.encode(frame)[0] == {'kind': 'pandas'}
+    series = pandas.Series([1, 2], name = 's')
+    assert ArtifactStore.encode(series)[0] == {'kind': 'pickle'}
+    store.publish('series', series)
+    assert store.read('series').equals(series)
+
+
+def test_files_in_a_run_share_a_store(pipeline, runner, tmp_path,
+                                      monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(
+        os.path.dirname(os.path.abspath(runningshoes.__file__))))
+    out = tmp_path / 'out'
+    directory = pipeline({
+        '1-publish.py': 'from runningshoes import artifacts\n'
+                        'artifacts.publish("rows", {"n": 3})\n',
+        '2-read.py': 'from runningshoes import artifacts\n'
+                     'with open({!r}, "w") as f:\n'
+                     '    f.write(str(artifacts.read("rows")["n"]))\n'
+                     .format(str(out))})
+    run = runner(directory, artifacts = True)
+    run.run()
+    assert out.read_text() == '3'
+    # -- and the store is gone once the run is over
+    assert run.artifact_store is None
@@ -0,0 +1,82 @@
+"""test_asyncrun.py - tests of running files with asyncio.
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from runningshoes.asyncrun import AsyncRunningShoes
+from runningshoes.runningshoes import StepTimeout
+
+from conftest import noted, overlapped, spans
+
+
+def arunner(directory, **options):
+    return AsyncRunningShoes(directory, cache = False, **options)
+
+
+def test_stages_run_concurrently_up_to_the_limit(pipeline, tmp_path):
+    log = tmp_path / 'log'
+    directory = pipeline({'1-a.sh': noted(log), '1-b.sh': noted(log),
+                          '1-c.sh': noted(log), '2-d.sh': noted(log, 'true')})
+    run = arunner(directory, parallel = True)
+    asyncio.run(run.arun(concurrency = 2))
+    info = run.file_data['info']
+    assert all(i['ran'] for i in info.values())
+    span = spans(log)
+    stage = [span[f] for f in ('1-a.sh', '1-b.sh', '1-c.sh')]
+    overlaps = sum(overlapped(a, b) for i, a in enumerate(stage)
+                   for b in stage[i + 1:])
+    assert overlaps in (1, 2)
+    assert span['2-d.sh'][0] > max(end for _, end in stage)
+
+
+def test_a_timeout_kills_the_file(pipeline):
+    directory = pipeline({'1-slow.sh': 'sleep 30\n'})
+    run = arunner(directory)
+    started = time.monotonic()
+    with pytest.raises(StepTimeout):
+        asyncio.run(run.arun(timeout = 0.3))
+    assert time.monotonic() - started < 10
+    assert run.file_data['info']['1-slow.sh']['ran'] is False
+
+
+def test_a_background_process_holding_the_output_does_not_stall_the_run(
+        pipeline):
+    directory = pipeline({'1-a.sh': 'echo before\nsleep 5 &\necho after\n'})
+    run = arunner(directory, logs = True)
+    started = time.monotonic()
+    asyncio.run(run.arun())
+    assert time.monotonic() - started < 2
+    with open(os.path.join(run.logs, '1-a.sh.log')) as f:
+        assert f.read() == 'before\nafter\n'
+
+
+def test_cancelling_kills_the_running_files(pipeline, tmp_path):
+    pid_file = tmp_path / 'pid'
+    directory = pipeline({'1-slow.sh': 'sleep 30 &\necho $! > {}\nwait\n'
+                          .format(pid_file)})
+    run = arunner(directory)
+
+    async def cancel_soon():
+        task = asyncio.ensure_future(run.arun(report = False))
+        while not pid_file.exists() or not pid_file.read_text().strip():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_soon())
+    pid = int(pid_file.read_text())
+    # -- the whole process group was killed, including what the file started
+    for _ in range(50):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.1)
+    else:
+        pytest.fail('the file was left running')
+    assert run.file_data['info']['1-slow.sh']['ran'] is False
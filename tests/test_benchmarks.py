@@ -0,0 +1,49 @@
+"""test_benchmarks.py - tests of the runner-overhead benchmarks.
+"""
+
+import importlib.util
+import os
+
+import pytest
+
+
+SIZES = {'extra_files': [5], 'repeats': 1, 'dispatch_steps': 2,
+         'report_rows': [3], 'scaling_steps': 2, 'seconds': 0.01,
+         'lines': 10}
+
+
+@pytest.fixture(scope = 'module')
+def benchmarks():
+    path = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'benchmarks', 'runner_overhead.py')
+    spec = importlib.util.spec_from_file_location('runner_overhead', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_synthetic_pipelines_are_built(benchmarks, tmp_path):
+    directory = benchmarks.build_pipeline(str(tmp_path / 'p'), 3, 'sleep',
+                                          extra_files = 4, same_prefix = True)
+    names = sorted(os.listdir(directory))
+    assert names[:3] == ['1-sleep_1.py', '1-sleep_2.py', '1-sleep_3.py']
+    assert len(names) == 7
+
+
+@pytest.mark.parametrize('name', ['discovery', 'dispatch', 'reporting'])
+def test_each_benchmark_gives_results(benchmarks, tmp_path, name):
+    results = benchmarks.BENCHMARKS[name](str(tmp_path), SIZES)
+    assert results and all(r['benchmark'] == name for r in results)
+    assert all(v >= 0 or name == 'dispatch'
+               for r in results for v in r['metrics'].values())
+
+
+def test_results_are_compared_by_benchmark_and_params(benchmarks):
+    before = {'results': [{'benchmark': 'b', 'params': {'n': 1},
+                           'metrics': {'seconds': 2.0}}]}
+    after = {'results': [{'benchmark': 'b', 'params': {'n': 1},
+                          'metrics': {'seconds': 3.0}},
+                         {'benchmark': 'b', 'params': {'n': 2},
+                          'metrics': {'seconds': 1.0}}]}
+    assert benchmarks.compare(after, before) == [
+        ['b', '{"n": 1}', 'seconds', 2.0, 3.0, '+50.0%']]
@@ -0,0 +1,145 @@
+"""test_cgroups.py - tests of running each file in a cgroup of its own.
+"""
+
+import os
+import subprocess
+import uuid
+
+import pytest
+
+from runningshoes import cgroups
+from runningshoes.cgroups import CgroupTree, StepCgroup, confine
+from runningshoes.runningshoes import StepFailed
+
+
+@pytest.fixture
+def parent(tmp_path, monkeypatch):
+    """A stand-in for a delegated cgroup v2 group, as a plain directory."""
+    monkeypatch.setattr(cgroups.os, 'access', lambda path, mode: True)
+    monkeypatch.setattr(cgroups, 'EMPTY_TIMEOUT', 0.05)
+    (tmp_path / 'cgroup.subtree_control').write_text('cpu io\n')
+    return tmp_path
+
+
+@pytest.fixture
+def delegated():
+    """A real, empty cgroup v2 group to make trees in, or a skip if there is
+    no cgroup v2 hierarchy we can make groups in.
+    """
+    mount = None
+    with open(cgroups.MOUNTS) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) > 2 and fields[2] == 'cgroup2':
+                mount = fields[1]
+                break
+    if mount is None:
+        pytest.skip('no cgroup v2 hierarchy')
+    path = os.path.join(mount, 'runningshoes-test-' + uuid.uuid4().hex[:8])
+    try:
+        os.mkdir(path)
+    except OSError:
+        pytest.skip('cannot make cgroups')
+    yield path
+    os.rmdir(path)
+
+
+def test_the_group_we_run_in_is_left_alone(parent):
+    tree = CgroupTree.create(parent = str(parent))
+    assert tree is not None
+    assert os.path.dirname(tree.path) == str(parent)
+    assert (parent / 'cgroup.subtree_control').read_text() == 'cpu io\n'
+    tree.destroy()
+    assert (parent / 'cgroup.subtree_control').read_text() == 'cpu io\n'
+
+
+def test_steps_are_made_and_removed_inside_the_tree(parent):
+    tree = CgroupTree.create(parent = str(parent))
+    step = tree.step('4-train model.py')
+    assert os.path.dirname(step.path) == tree.path
+    assert os.path.basename(step.path).startswith('4-train_model.py-')
+    tree.destroy()
+    assert not os.path.exists(step.path)
+
+
+def test_no_cgroups_without_a_parent(tmp_path):
+    assert CgroupTree.create(parent = str(tmp_path / 'missing')) is None
+
+
+def test_no_cgroups_in_a_parent_with_processes_in_it(parent):
+    (parent / 'cgroup.procs').write_text('1\n')
+    assert CgroupTree.create(parent = str(parent)) is None
+
+
+def test_limits_need_their_controllers(tmp_path):
+    step = StepCgroup(str(tmp_path), set(['memory']))
+    assert step.limit(memory_max = 2, cpu_max = 1.5) == (None, 1.5)
+    assert (tmp_path / 'memory.max').read_text() == str(2 * 1024 ** 3)
+    assert (tmp_path / 'memory.swap.max').read_text() == '0'
+    assert not (tmp_path / 'cpu.max').exists()
+
+
+def test_usage_is_read_from_the_group(tmp_path):
+    (tmp_path / 'cpu.stat').write_text('usage_usec 3000000\n'
+                                       'user_usec 2000000\n'
+                                       'system_usec 1000000\n')
+    (tmp_path / 'memory.peak').write_text(str(64 * 1024 * 1024))
+    (tmp_path / 'memory.events').write_text('oom 1\noom_kill 1\n')
+    assert StepCgroup(str(tmp_path), set()).usage() == {
+        'user_time': 2.0, 'system_time': 1.0, 'memory_peak': 64.0,
+        'oom_kills': 1}
+
+
+def test_nothing_is_reported_for_a_group_nothing_ran_in(tmp_path):
+    (tmp_path / 'cpu.stat').write_text('usage_usec 0\nuser_usec 0\n'
+                                       'system_usec 0\n')
+    assert StepCgroup(str(tmp_path), set()).usage() == {}
+
+
+def test_confine_without_a_group_limits_the_address_space():
+    assert confine(['true']) == ['true']
+    call = confine(['sh', '-c', 'ulimit -v'], memory_max = 1)
+    assert call[0] == '/bin/sh' and 'ulimit -v 1048576' in call[2]
+    assert subprocess.check_output(call).decode().strip() == '1048576'
+
+
+def test_a_file_that_cannot_join_its_group_still_runs(tmp_path):
+    call = confine(['sh', '-c', 'ulimit -v'], cgroup = str(tmp_path / 'gone'),
+                   group_memory_max = 1)
+    assert subprocess.check_output(call).decode().strip() == '1048576'
+
+
+def test_files_run_in_groups_inside_a_delegated_group(pipeline, runner,
+                                                      delegated, tmp_path):
+    where = tmp_path / 'cgroup'
+    directory = pipeline({'1-a.sh': 'cat /proc/self/cgroup > {}\n'
+                                    'i=0\nwhile [ $i -lt 10000 ]; do '
+                                    'i=$((i + 1)); done\n'.format(where)})
+    run = runner(directory, cgroups = delegated)
+    run.run()
+    group = where.read_text().split('::')[-1].strip()
+    assert os.path.dirname(os.path.dirname(group)) == \
+        '/' + os.path.basename(delegated)
+    assert os.path.basename(group).startswith('1-a.sh-')
+    assert run.file_data['info']['1-a.sh']['user_time'] > 0
+    assert not [e for e in os.scandir(delegated) if e.is_dir()]
+
+
+def test_limits_are_set_inside_a_delegated_group(pipeline, runner, delegated):
+    with open(os.path.join(delegated, 'cgroup.controllers')) as f:
+        if 'memory' not in f.read().split():
+            pytest.skip('the memory controller is not available')
+    with open(os.path.join(delegated, 'cgroup.subtree_control'), 'w') as f:
+        f.write('+memory')
+    directory = pipeline({'1-hog.py': '# memory_max: 64M\n'
+                                      'hog = bytearray(256 * 1024 ** 2)\n'})
+    run = runner(directory, cgroups = delegated)
+    with pytest.raises(StepFailed):
+        run.run()
+    assert run.file_data['info']['1-hog.py']['oom_kills'] >= 1
+
+
+def test_a_delegated_group_has_to_be_usable(pipeline, runner, tmp_path):
+    directory = pipeline({'1-a.sh': 'true\n'})
+    with pytest.raises(Exception, match = 'delegated'):
+        runner(directory, cgroups = str(tmp_path / 'missing')).run()
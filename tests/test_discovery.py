@@ -0,0 +1,42 @@
+"""test_discovery.py - tests of finding the files to run in a directory.
+"""
+
+import os
+
+import pytest
+
+from runningshoes import RunningShoes
+
+
+@pytest.mark.parametrize('name, order', [
+    ('1-a.sh', 1), ('010-b.py', 10), ('2-', 2), ('-1-c.sh', None),
+    ('a-1.sh', None), ('data.csv', None), ('12.sh', None)])
+def test_file_names_are_parsed_once(name, order):
+    assert RunningShoes.parse_file_name(name) == order
+    assert RunningShoes.should_we_run_this_file(name) == \
+        (False if order is None else (True, order))
+
+
+def test_files_are_found_in_numeric_order(pipeline, runner):
+    directory = pipeline({'10-c.sh': 'true\n', '2-b.sh': 'true\n',
+                          '1-a.sh': 'true\n', 'notes.txt': '',
+                          'data/1-raw.csv': '', '3-sub/1-s.sh': 'true\n'})
+    run = runner(directory)
+    assert list(run.files) == ['1-a.sh', '2-b.sh', '3-sub', '10-c.sh']
+    assert run.file_orders['10-c.sh'] == 10
+
+
+def test_a_directory_with_nothing_to_run(pipeline, runner):
+    directory = pipeline({'notes.txt': '', 'data.csv': ''})
+    run = runner(directory)
+    assert run.files == ()
+    assert run.stages == []
+    run.run()
+    assert run.file_data['info'] == {}
+
+
+def test_only_files_and_directories_are_run(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n'})
+    os.mkfifo(directory + '2-fifo.sh')
+    os.symlink(directory + 'missing.sh', directory + '3-dangling.sh')
+    assert list(runner(directory).files) == ['1-a.sh']
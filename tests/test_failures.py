@@ -0,0 +1,53 @@
+"""test_failures.py - tests of what happens once a file fails.
+"""
+
+import pytest
+
+from runningshoes.runningshoes import PipelineFailed, StepFailed
+
+
+FILES = {'1-a.sh': 'true\n', '2-fail.sh': 'exit 2\n', '3-c.sh': 'true\n'}
+
+
+def test_fail_fast_stops_at_the_first_failure(pipeline, runner):
+    run = runner(pipeline(FILES))
+    with pytest.raises(StepFailed, match = 'exit code 2'):
+        run.run()
+    assert '3-c.sh' not in run.file_data['info']
+
+
+def test_continue_runs_everything(pipeline, runner):
+    run = runner(pipeline(FILES), on_failure = 'continue')
+    with pytest.raises(PipelineFailed) as raised:
+        run.run()
+    assert list(raised.value.failures) == ['2-fail.sh']
+    assert run.file_data['info']['3-c.sh']['ran'] is True
+
+
+def test_continue_independent_blocks_only_dependents(pipeline, runner):
+    directory = pipeline({'1-fail.sh': 'exit 1\n',
+                          '2-needs_it.sh': 'true\n',
+                          '2-free.sh': '# needs:\ntrue\n'})
+    run = runner(directory, graph = True,
+                 on_failure = 'continue-independent')
+    with pytest.raises(PipelineFailed):
+        run.run()
+    info = run.file_data['info']
+    assert info['2-needs_it.sh']['blocked_by'] == ['1-fail.sh']
+    assert info['2-free.sh']['ran'] is True
+
+
+def test_fail_fast_lets_running_files_finish(pipeline, runner):
+    directory = pipeline({'1-fail.sh': 'exit 1\n', '1-slow.sh': 'sleep 0.3\n',
+                          '2-after.sh': 'true\n'})
+    run = runner(directory, parallel = True, max_workers = 2)
+    with pytest.raises(StepFailed):
+        run.run()
+    info = run.file_data['info']
+    assert info['1-slow.sh']['ran'] is True
+    assert '2-after.sh' not in info
+
+
+def test_on_failure_must_be_a_known_policy(pipeline, runner):
+    with pytest.raises(ValueError):
+        runner(pipeline(FILES), on_failure = 'ignore')
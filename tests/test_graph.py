@@ -0,0 +1,54 @@
+"""test_graph.py - tests of the dependency graph and running by it.
+"""
+
+import pytest
+
+from conftest import noted, spans
+
+
+def test_needs_inputs_and_outputs(pipeline, runner):
+    directory = pipeline({
+        '1-a.sh': 'true\n',
+        '2-b.sh': '# outputs: b.csv\ntrue\n',
+        '3-c.sh': '# inputs: b.csv\ntrue\n',
+        '4-d.sh': '# needs: 1-a\ntrue\n'})
+    dependencies = runner(directory, graph = True).dependencies()
+    assert dependencies['3-c.sh'] == ('2-b.sh',)
+    assert dependencies['4-d.sh'] == ('1-a.sh',)
+
+
+def test_undeclared_files_wait_for_every_earlier_stage(pipeline, runner,
+                                                       tmp_path):
+    log = tmp_path / 'log'
+    directory = pipeline({
+        '1-s.sh': 'true\n',
+        '3-pull_a.sh': noted(log, 'sleep 0.5'),
+        '3-pull_b.sh': 'sleep 0.5\n',
+        '5-ind.sh': '# needs:\n' + noted(log, 'true'),
+        '6-e.sh': noted(log, 'true')})
+    run = runner(directory, graph = True, max_workers = 4)
+    dependencies = run.dependencies()
+    assert dependencies['5-ind.sh'] == ()
+    assert dependencies['3-pull_a.sh'] == ('1-s.sh',)
+    assert set(dependencies['6-e.sh']) == \
+        set(['3-pull_a.sh', '3-pull_b.sh', '5-ind.sh'])
+    run.run()
+    span = spans(log)
+    assert span['6-e.sh'][0] > span['3-pull_a.sh'][1]
+    # -- the file that opted out did not wait for anything
+    assert span['5-ind.sh'][0] < span['3-pull_a.sh'][1]
+
+
+def test_without_declarations_the_graph_is_the_stages(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n',
+                          '2-c.sh': 'true\n', '3-d.sh': 'true\n'})
+    run = runner(directory, graph = True)
+    assert run.dependencies() == run.stage_dependencies()
+
+
+def test_cycles_are_an_error(pipeline, runner):
+    directory = pipeline({'1-a.sh': '# needs: 2-b\ntrue\n',
+                          '2-b.sh': '# needs: 1-a\ntrue\n'})
+    run = runner(directory, graph = True)
+    with pytest.raises(Exception, match = 'cycle'):
+        run.run()
@@ -0,0 +1,36 @@
+"""test_history.py - tests of the run history and regression reports.
+"""
+
+from runningshoes.history import RunHistory
+
+
+def test_runs_are_recorded_and_regressions_flagged(pipeline, runner,
+                                                    tmp_path):
+    history = RunHistory(str(tmp_path / 'history.db'))
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n'})
+    for _ in range(3):
+        runner(directory, history = history).run()
+    with open(directory + '2-b.sh', 'w') as f:
+        f.write('sleep 0.5\n')
+    runner(directory, history = history).run()
+    assert history.last_run(directory) == 4
+    regressions = dict(((r['step'], r['metric']), r)
+                       for r in history.regressions(directory))
+    # -- 1-a.sh only takes milliseconds, so whether it is flagged is noise
+    assert ('2-b.sh', 'elapsed') in regressions
+    # -- elapsed times are kept in seconds
+    assert regressions['2-b.sh', 'elapsed']['value'] >= 0.5
+    assert '2-b.sh' in history.report(directory)
+    assert history.baseline(directory, '1-a.sh', 'elapsed') < 0.5
+
+
+def test_failures_do_not_count_towards_baselines(pipeline, runner,
+                                                  tmp_path):
+    history = RunHistory(str(tmp_path / 'history.db'))
+    directory = pipeline({'1-a.sh': 'exit 1\n'})
+    try:
+        runner(directory, history = history).run()
+    except Exception:
+        pass
+    assert history.last_run(directory) == 1
+    assert history.baseline(directory, '1-a.sh', 'elapsed') is None
@@ -0,0 +1,185 @@
+"""test_hive.py - tests of running .hql files in one Hive session, against a
+stub Hive CLI.
+"""
+
+import os
+import sys
+
+import pytest
+
+from runningshoes.hive import HiveSession
+from runningshoes.runningshoes import PipelineFailed, StepFailed
+
+
+# -- a stand-in for `hive -f <script>`: it echoes `!echo ...;` lines, prints
+# -- `SELECT '...';` strings, counts every session it starts in sessions.log,
+# -- and exits 1 at a statement containing FAIL, or at once if the script
+# -- holds `-- metastore down`
+STUB = '''import os, re, sys
+with open(os.path.join(os.path.dirname(__file__), 'sessions.log'), 'a') as f:
+    f.write('session\\n')
+script = open(sys.argv[-1]).read()
+if '-- metastore down' in script:
+    print('FAILED: metastore unavailable', file = sys.stderr)
+    sys.exit(1)
+for line in script.splitlines():
+    echo = re.match(r"^!echo (.*);$", line)
+    if echo:
+        print(echo.group(1), flush = True)
+    elif 'FAIL' in line:
+        print('FAILED: SemanticException', file = sys.stderr)
+        sys.exit(1)
+    elif line.startswith('SELECT'):
+        print(line.split("'")[1], flush = True)
+'''
+
+
+@pytest.fixture
+def hive(tmp_path):
+    """The command for a stub Hive CLI, and a function giving how many
+    sessions it has started.
+    """
+    stub = tmp_path / 'hive.py'
+    stub.write_text(STUB)
+    log = tmp_path / 'sessions.log'
+
+    def sessions():
+        return len(log.read_text().split()) if log.exists() else 0
+    return [sys.executable, str(stub), '-f'], sessions
+
+
+def test_a_session_reports_each_file(pipeline, hive):
+    command, _ = hive
+    directory = pipeline({'1-a.hql': "SELECT 'a';", '2-b.hql': "SELECT 'b';"})
+    outputs = []
+    session = HiveSession(command)
+    events = [(e, v) for e, v in session.run(
+        [directory + '1-a.hql', directory + '2-b.hql'],
+        output = outputs.append) if e in ('start', 'end')]
+    assert events == [('start', 0), ('end', 0), ('start', 1), ('end', 1)]
+    assert outputs == [b'a\n', b'b\n']
+
+
+def test_consecutive_files_share_one_session(pipeline, runner, hive):
+    command, sessions = hive
+    directory = pipeline({'1-a.hql': "SELECT 'a';", '2-b.hql': "SELECT 'b';",
+                          '3-c.sh': 'true\n', '4-d.hql': "SELECT 'd';"})
+    run = runner(directory, batch_hql = True,
+                 custom_extensions = {'.hql': command})
+    run.run()
+    info = run.file_data['info']
+    assert sessions() == 2
+    assert info['1-a.hql']['batch'] == ('1-a.hql', '2-b.hql')
+    assert all(info[f]['ran'] for f in info)
+    assert [len(info[f]['attempts']) for f in sorted(info)] == [1, 1, 1, 1]
+
+
+def test_a_failure_is_blamed_on_the_file_it_was_in(pipeline, runner, hive):
+    command, sessions = hive
+    directory = pipeline({'1-a.hql': "SELECT 'a';", '2-b.hql': 'FAIL;',
+                          '3-c.hql': "SELECT 'c';"})
+    run = runner(directory, batch_hql = True,
+                 custom_extensions = {'.hql': command})
+    with pytest.raises(StepFailed) as raised:
+        run.run()
+    assert raised.value.file == '2-b.hql'
+    assert raised.value.returncode == 1
+    info = run.file_data['info']
+    assert info['1-a.hql']['ran'] is True
+    assert info['2-b.hql']['ran'] is False
+    assert info['2-b.hql']['returncode'] == 1
+    assert 'exit code 1' in info['2-b.hql']['attempts'][0]['error']
+    assert '3-c.hql' not in info
+    assert sessions() == 1
+
+
+def test_files_with_retries_are_run_in_sessions_of_their_own(pipeline,
+                                                             runner, hive):
+    command, sessions = hive
+    directory = pipeline({'1-a.hql': "SELECT 'a';", '2-b.hql': 'FAIL;',
+                          '3-c.hql': "SELECT 'c';"})
+    run = runner(directory, batch_hql = True, retries = {'.hql': 2},
+                 backoff = 0, custom_extensions = {'.hql': command})
+    with pytest.raises(StepFailed):
+        run.run()
+    info = run.file_data['info']
+    assert 'batch' not in info['1-a.hql']
+    assert len(info['1-a.hql']['attempts']) == 1
+    assert len(info['2-b.hql']['attempts']) == 3
+    assert sessions() == 4
+
+
+def test_output_goes_to_each_files_log(pipeline, runner, hive):
+    command, _ = hive
+    directory = pipeline({'1-a.hql': "SELECT 'a';", '2-b.hql': "SELECT 'b';"})
+    run = runner(directory, batch_hql = True, logs = True,
+                 custom_extensions = {'.hql': command})
+    run.run()
+    for name, output in (('1-a.hql', 'a\n'), ('2-b.hql', 'b\n')):
+        with open(os.path.join(run.logs, name + '.log')) as f:
+            assert f.read() == output
+
+
+def test_a_failure_before_the_first_file_is_blamed_on_it(pipeline, runner,
+                                                         hive):
+    command, sessions = hive
+    directory = pipeline({'1-a.hql': "-- metastore down\nSELECT 'a';",
+                          '2-b.hql': "SELECT 'b';"})
+    run = runner(directory, batch_hql = True,
+                 custom_extensions = {'.hql': command})
+    with pytest.raises(StepFailed) as raised:
+        run.run()
+    assert raised.value.file == '1-a.hql'
+    info = run.file_data['info']
+    assert info['1-a.hql']['ran'] is False
+    assert info['1-a.hql']['returncode'] == 1
+    assert '2-b.hql' not in info
+    assert sessions() == 1
+
+
+def test_a_session_that_cannot_start_is_blamed_on_the_first_file(
+        pipeline, runner, tmp_path):
+    directory = pipeline({'1-a.hql': "SELECT 'a';", '2-b.hql': "SELECT 'b';"})
+    run = runner(directory, batch_hql = True, custom_extensions = {
+        '.hql': [str(tmp_path / 'no-such-hive'), '-f']})
+    with pytest.raises(OSError):
+        run.run()
+    assert run.file_data['info']['1-a.hql']['ran'] is False
+    assert '2-b.hql' not in run.file_data['info']
+
+
+@pytest.mark.parametrize('on_failure', ['continue', 'continue-independent'])
+def test_a_session_that_keeps_failing_is_not_retried_forever(
+        pipeline, runner, hive, on_failure):
+    command, sessions = hive
+    down = "-- metastore down\nSELECT '{}';"
+    directory = pipeline(dict(('{}-{}.hql'.format(i, i), down.format(i))
+                              for i in range(1, 4)))
+    run = runner(directory, batch_hql = True, on_failure = on_failure,
+                 custom_extensions = {'.hql': command})
+    with pytest.raises(PipelineFailed):
+        run.run()
+    info = run.file_data['info']
+    assert info['1-1.hql']['ran'] is False
+    if on_failure == 'continue':
+        # -- each session fails on its first file, and the rest try again
+        assert sessions() == 3
+        assert all(info[f]['ran'] is False for f in info)
+    else:
+        assert sessions() == 1
+        assert info['3-3.hql']['blocked_by'] == ['2-2.hql']
+
+
+def test_the_rest_of_a_failed_batch_carries_on(pipeline, runner, hive):
+    command, sessions = hive
+    directory = pipeline({'1-a.hql': "SELECT 'a';", '2-b.hql': 'FAIL;',
+                          '3-c.hql': "SELECT 'c';", '4-d.hql': "SELECT 'd';"})
+    run = runner(directory, batch_hql = True, on_failure = 'continue',
+                 custom_extensions = {'.hql': command})
+    with pytest.raises(PipelineFailed) as raised:
+        run.run()
+    assert list(raised.value.failures) == ['2-b.hql']
+    info = run.file_data['info']
+    assert [info[f]['ran'] for f in sorted(info)] == [True, False, True, True]
+    assert info['3-c.hql']['batch'] == ('3-c.hql', '4-d.hql')
+    assert sessions() == 2
@@ -0,0 +1,53 @@
+"""test_incremental.py - tests of skipping files whose fingerprint is
+unchanged.
+"""
+
+import pytest
+
+
+def statuses(run):
+    return dict((f, 'skipped' if i.get('skipped') else 'ran')
+                for f, i in run.file_data['info'].items())
+
+
+def test_unchanged_files_are_skipped(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n'})
+    runner(directory).run(incremental = True)
+    run = runner(directory)
+    run.run(incremental = True)
+    assert statuses(run) == {'1-a.sh': 'skipped', '2-b.sh': 'skipped'}
+
+
+def test_a_change_reruns_the_file_and_everything_after_it(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n',
+                          '3-c.sh': 'true\n'})
+    runner(directory).run(incremental = True)
+    with open(directory + '2-b.sh', 'a') as f:
+        f.write('# -- edited\n')
+    run = runner(directory)
+    run.run(incremental = True)
+    assert statuses(run) == {'1-a.sh': 'skipped', '2-b.sh': 'ran',
+                             '3-c.sh': 'ran'}
+
+
+def test_a_changed_input_reruns_the_files_reading_it(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n',
+                          '2-b.sh': '# inputs: data.csv\n# needs:\ntrue\n',
+                          'data.csv': 'x\n'})
+    runner(directory, graph = True).run(incremental = True)
+    with open(directory + 'data.csv', 'w') as f:
+        f.write('y\n')
+    run = runner(directory, graph = True)
+    run.run(incremental = True)
+    assert statuses(run) == {'1-a.sh': 'skipped', '2-b.sh': 'ran'}
+
+
+def test_a_failed_file_is_not_skipped(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n'})
+    directory = pipeline({'2-b.sh': 'test -e {}ok\n'.format(directory)})
+    with pytest.raises(Exception):
+        runner(directory).run(incremental = True)
+    open(directory + 'ok', 'w').close()
+    run = runner(directory)
+    run.run(incremental = True)
+    assert statuses(run) == {'1-a.sh': 'skipped', '2-b.sh': 'ran'}
@@ -0,0 +1,96 @@
+"""test_index.py - tests of the on-disk discovery index.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from runningshoes.index import INDEX_VERSION, RACY_WINDOW, DiscoveryIndex
+
+
+FILES = {'1-a.sh': 'true\n', '2-b.sh': '# needs: 1-a\ntrue\n'}
+
+
+def backdate(*paths):
+    """Make paths look like they were last changed a minute ago, well before
+    any index made of them, so that the index trusts them.
+    """
+    for path in paths:
+        os.utime(path, (time.time() - 60,) * 2)
+
+
+def test_an_unchanged_directory_is_not_listed_again(pipeline, runner,
+                                                    monkeypatch):
+    directory = pipeline(FILES)
+    # -- the state directory the index goes in is part of the listing
+    os.mkdir(directory + '.runningshoes')
+    backdate(*[directory + f for f in FILES] + [directory])
+    first = runner(directory, cache = True)
+    with monkeypatch.context() as m:
+        m.setattr(os, 'scandir', lambda path: pytest.fail('listed again'))
+        second = runner(directory, cache = True)
+    assert second.files == first.files
+    assert second.options == first.options
+
+
+def test_adding_a_file_invalidates_the_listing(pipeline, runner):
+    directory = pipeline(FILES)
+    runner(directory, cache = True)
+    with open(directory + '3-c.sh', 'w') as f:
+        f.write('true\n')
+    assert list(runner(directory, cache = True).files) == \
+        ['1-a.sh', '2-b.sh', '3-c.sh']
+
+
+def test_an_edited_file_is_read_again(pipeline, runner):
+    directory = pipeline(FILES)
+    runner(directory, cache = True)
+    with open(directory + '2-b.sh', 'w') as f:
+        f.write('# needs:\ntrue\n# -- now independent\n')
+    run = runner(directory, cache = True)
+    assert run.options['2-b.sh']['needs'] == []
+
+
+def test_a_broken_index_is_ignored(pipeline, runner):
+    directory = pipeline(FILES)
+    runner(directory, cache = True)
+    path = directory + '.runningshoes/index.json'
+    with open(path, 'w') as f:
+        f.write('{not json')
+    assert list(runner(directory, cache = True).files) == ['1-a.sh', '2-b.sh']
+    # -- and replaced with a good one
+    with open(path) as f:
+        assert json.load(f)['version'] == INDEX_VERSION
+
+
+def test_stored_values_need_an_unchanged_file(tmp_path):
+    path = tmp_path / 'a.sh'
+    path.write_text('true\n')
+    backdate(str(path))
+    index = DiscoveryIndex(str(tmp_path), str(tmp_path / 'index.json'))
+    index.store(str(path), 'hash', 'abc', index.signature(str(path)))
+    index.save()
+    index = DiscoveryIndex(str(tmp_path), str(tmp_path / 'index.json'))
+    assert index.lookup(str(path), 'hash') == 'abc'
+    path.write_text('false\n')
+    assert index.lookup(str(path), 'hash') is None
+
+
+def test_nothing_changed_as_the_index_was_written_is_trusted(tmp_path):
+    path = tmp_path / 'a.sh'
+    path.write_text('true\n')
+    index = DiscoveryIndex(str(tmp_path), str(tmp_path / 'index.json'))
+    signature = index.signature(str(path))
+    index.store(str(path), 'hash', 'abc', signature)
+    index.save()
+    # -- changed again within the same mtime tick as the index was written
+    path.write_text('fals\n')
+    os.utime(str(path), ns = (signature[0], signature[0]))
+    index = DiscoveryIndex(str(tmp_path), str(tmp_path / 'index.json'))
+    assert index.signature(str(path)) == signature
+    assert index.lookup(str(path), 'hash') is None
+    # -- but once the index is older than that, it is trusted again
+    index.written = signature[0] + RACY_WINDOW + 1
+    assert index.lookup(str(path), 'hash') == 'abc'
@@ -0,0 +1,71 @@
+"""test_journal.py - tests of the run journal and resuming failed runs.
+"""
+
+import json
+
+import pytest
+
+
+def test_resume_skips_the_files_that_succeeded(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n'})
+    directory = pipeline({'2-b.sh': 'test -e {}ok\n'.format(directory),
+                          '3-c.sh': 'true\n'})
+    with pytest.raises(Exception):
+        runner(directory).run()
+    with open(directory + '.runningshoes/journal.json') as f:
+        assert json.load(f)['files'] == {'1-a.sh': 'success',
+                                         '2-b.sh': 'failure',
+                                         '3-c.sh': 'pending'}
+    open(directory + 'ok', 'w').close()
+    run = runner(directory)
+    run.resume()
+    info = run.file_data['info']
+    assert info['1-a.sh'].get('skipped')
+    assert info['2-b.sh']['ran'] and info['3-c.sh']['ran']
+
+
+def test_files_left_out_by_only_are_not_taken_for_done(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n',
+                          '3-c.sh': 'true\n'})
+    runner(directory).run(only = ['1-a.sh', '2-b.sh'])
+    run = runner(directory)
+    run.run(only = ['1-a.sh'])
+    with open(directory + '.runningshoes/journal.json') as f:
+        assert json.load(f)['files'] == {'1-a.sh': 'success',
+                                         '2-b.sh': 'success',
+                                         '3-c.sh': 'pending'}
+    run.resume()
+    info = run.file_data['info']
+    assert info['1-a.sh'].get('skipped') and info['2-b.sh'].get('skipped')
+    assert info['3-c.sh']['ran']
+
+
+def test_a_journal_that_cannot_be_written_is_not_fatal(pipeline, runner,
+                                                        capsys):
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n'})
+    # -- a file where the state directory should be, so that it cannot be
+    # -- made, as in a read-only checkout
+    open(directory + '.runningshoes', 'w').close()
+    run = runner(directory)
+    run.run()
+    assert all(i['ran'] for i in run.file_data['info'].values())
+    assert capsys.readouterr().err.count('Not keeping a journal') == 1
+    run.resume()
+    assert all(i['ran'] for i in run.file_data['info'].values())
+
+
+def test_resume_carries_on_inside_a_failed_sub_pipeline(pipeline, runner,
+                                                        tmp_path):
+    count, ok = tmp_path / 'count', tmp_path / 'ok'
+    directory = pipeline({'1-a.sh': 'true\n',
+                          '2-sub/1-s.sh': 'echo x >> {}\n'.format(count),
+                          '2-sub/2-t.sh': 'test -e {}\n'.format(ok)})
+    with pytest.raises(Exception):
+        runner(directory).run()
+    open(str(ok), 'w').close()
+    run = runner(directory)
+    run.resume()
+    child = run.file_data['info']['2-sub']['pipeline']['info']
+    assert child['1-s.sh'].get('skipped') is True
+    assert child['2-t.sh']['ran'] is True
+    assert count.read_text() == 'x\n'
@@ -0,0 +1,63 @@
+"""test_logs.py - tests of capturing each file's output in its own log.
+"""
+
+import os
+import time
+
+from runningshoes.logs import StepLog
+
+
+def test_each_files_output_goes_to_its_own_log(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'echo out-a\necho err-a >&2\n',
+                          '2-b.sh': 'echo out-b\n'})
+    run = runner(directory, logs = True)
+    run.run()
+    assert run.logs == directory + '.runningshoes/logs'
+    with open(os.path.join(run.logs, '1-a.sh.log')) as f:
+        assert sorted(f.read().split()) == ['err-a', 'out-a']
+    with open(os.path.join(run.logs, '2-b.sh.log')) as f:
+        assert f.read() == 'out-b\n'
+
+
+def test_a_background_process_holding_the_output_does_not_stall_the_run(
+        pipeline, runner):
+    directory = pipeline({'1-a.sh': 'echo before\nsleep 5 &\necho after\n'})
+    run = runner(directory, logs = True)
+    started = time.monotonic()
+    run.run()
+    assert time.monotonic() - started < 2
+    with open(os.path.join(run.logs, '1-a.sh.log')) as f:
+        assert f.read() == 'before\nafter\n'
+
+
+def test_tee_also_passes_output_through(pipeline, runner, capfd):
+    directory = pipeline({'1-a.sh': 'echo teed\n'})
+    runner(directory, logs = True, tee = True).run()
+    assert 'teed' in capfd.readouterr().out
+
+
+def test_without_tee_output_only_reaches_the_log(pipeline, runner, capfd):
+    directory = pipeline({'1-a.sh': 'echo hidden\n'})
+    runner(directory, logs = True).run()
+    assert 'hidden' not in capfd.readouterr().out
+
+
+def test_logs_are_rotated_between_runs_and_when_full(pipeline, runner,
+                                                     tmp_path):
+    directory = pipeline({'1-a.sh': 'echo first\n'})
+    logs = str(tmp_path / 'logs')
+    runner(directory, logs = logs).run()
+    with open(directory + '1-a.sh', 'w') as f:
+        f.write('echo second\n')
+    runner(directory, logs = logs).run()
+    with open(os.path.join(logs, '1-a.sh.log')) as f:
+        assert f.read() == 'second\n'
+    with open(os.path.join(logs, '1-a.sh.log.1')) as f:
+        assert f.read() == 'first\n'
+    log = StepLog(str(tmp_path / 'full.log'), max_bytes = 10, backups = 2)
+    for _ in range(4):
+        log.write(b'123456789\n')
+    log.close()
+    assert not os.path.exists(str(tmp_path / 'full.log.3'))
+    assert os.path.getsize(str(tmp_path / 'full.log')) == 10
+    assert os.path.exists(str(tmp_path / 'full.log.2'))
@@ -0,0 +1,98 @@
+"""test_orchestrate.py - tests of running many pipeline directories at once.
+"""
+
+import asyncio
+
+import pytest
+
+from runningshoes.orchestrate import FairLimiter, Orchestrator
+from runningshoes.utilities.command_line import parse_args
+
+
+def test_globs_are_expanded_to_directories(pipeline):
+    first = pipeline({'1-a.sh': 'true\n'}, name = 'a')
+    second = pipeline({'1-b.sh': 'true\n'}, name = 'b')
+    orchestrator = Orchestrator([first[:-2] + '*', first], cache = False)
+    assert orchestrator.directories == [first, second]
+
+
+def test_a_directory_that_matches_nothing_is_an_error(pipeline, tmp_path):
+    first = pipeline({'1-a.sh': 'true\n'}, name = 'a')
+    with pytest.raises(Exception, match = 'typo'):
+        Orchestrator([first, str(tmp_path / 'typo*')], cache = False)
+
+
+def test_each_directory_resumes_its_own_run(pipeline, tmp_path):
+    ran = tmp_path / 'ran'
+    fixed = tmp_path / 'fixed'
+    directory = pipeline({'1-a.sh': 'echo a >> {}\n'.format(ran),
+                          '2-b.sh': 'test -e {}\n'.format(fixed)})
+    with pytest.raises(Exception, match = '1 of 1 directories failed'):
+        Orchestrator([directory], cache = False).run()
+    fixed.write_text('')
+    orchestrator = Orchestrator([directory], cache = False)
+    orchestrator.run(resume = True)
+    assert ran.read_text() == 'a\n'
+    assert orchestrator.file_data[directory]['info']['2-b.sh']['ran']
+
+
+def test_flags_the_orchestrator_cannot_honour_are_rejected(capsys):
+    with pytest.raises(SystemExit):
+        parse_args(['--directories', 'a', 'b', '--watch', '--batch-hql'])
+    assert '--watch, --batch-hql' in capsys.readouterr().err
+
+
+def test_a_failing_directory_does_not_stop_the_others(pipeline, capsys):
+    good = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n'}, name = 'good')
+    bad = pipeline({'1-a.sh': 'false\n'}, name = 'bad')
+    clash = pipeline({'1-a.sh': 'true\n', '1-b.sh': 'true\n'},
+                     name = 'clash')
+    orchestrator = Orchestrator([good, bad, clash], cache = False)
+    with pytest.raises(Exception, match = '2 of 3 directories failed'):
+        orchestrator.run()
+    assert set(orchestrator.errors) == set([bad, clash])
+    assert all(i['ran'] for i in
+               orchestrator.file_data[good]['info'].values())
+    report = capsys.readouterr().out
+    assert good in report and 'same integer prefix' in report
+
+
+def test_slots_go_to_the_pipeline_holding_the_fewest():
+    served = []
+
+    async def main():
+        limiter = FairLimiter(2)
+        await limiter.acquire('busy')
+        await limiter.acquire('busy')
+
+        async def wait(key):
+            await limiter.acquire(key)
+            served.append(key)
+
+        waiters = [asyncio.ensure_future(wait(key))
+                   for key in ('busy', 'busy', 'quiet')]
+        await asyncio.sleep(0)
+        for _ in waiters:
+            limiter.release('busy')
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiters)
+
+    asyncio.run(main())
+    # -- quiet queued last but was served before busy's second file
+    assert served == ['quiet', 'busy', 'busy']
+
+
+def test_max_workers_is_shared_across_directories(pipeline, tmp_path):
+    log = tmp_path / 'log'
+    step = 'echo + >> {0}; sleep 0.2; echo - >> {0}\n'.format(log)
+    directories = [pipeline({'1-a.sh': step, '1-b.sh': step},
+                            name = name) for name in ('x', 'y')]
+    orchestrator = Orchestrator(directories, max_workers = 2,
+                                parallel = True, cache = False)
+    asyncio.run(orchestrator.arun())
+    assert not orchestrator.errors
+    running = peak = 0
+    for line in log.read_text().split():
+        running += 1 if line == '+' else -1
+        peak = max(peak, running)
+    assert peak == 2
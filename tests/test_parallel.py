@@ -0,0 +1,40 @@
+"""test_parallel.py - tests of running files that share a prefix as stages.
+"""
+
+import os
+
+import pytest
+
+from conftest import noted, overlapped, spans
+
+
+def test_same_prefix_is_an_error_without_parallel(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n', '1-b.sh': 'true\n'})
+    with pytest.raises(Exception, match = 'same integer prefix'):
+        runner(directory)
+
+
+def test_files_in_a_stage_run_at_the_same_time(pipeline, runner, tmp_path):
+    log = tmp_path / 'log'
+    directory = pipeline({'1-a.sh': noted(log), '1-b.sh': noted(log),
+                          '2-c.sh': noted(log, 'true')})
+    runner(directory, parallel = True, max_workers = 2).run()
+    span = spans(log)
+    assert overlapped(span['1-a.sh'], span['1-b.sh'])
+    # -- the next stage waits for the whole of the one before it
+    assert span['2-c.sh'][0] > max(span['1-a.sh'][1], span['1-b.sh'][1])
+
+
+def test_max_workers_bounds_a_stage(pipeline, runner, tmp_path):
+    log = tmp_path / 'log'
+    directory = pipeline({'1-a.sh': noted(log), '1-b.sh': noted(log)})
+    runner(directory, parallel = True, max_workers = 1).run()
+    span = spans(log)
+    assert not overlapped(span['1-a.sh'], span['1-b.sh'])
+
+
+def test_max_workers_defaults_to_the_number_of_cpus(pipeline, runner):
+    cpus = os.cpu_count() or 1
+    directory = pipeline(dict(('1-f{}.sh'.format(i), 'true\n')
+                              for i in range(cpus + 3)))
+    assert runner(directory, parallel = True).max_workers == cpus
@@ -0,0 +1,98 @@
+"""test_resources.py - tests of reserving cores and memory for running files.
+"""
+
+import pytest
+
+from runningshoes import resources
+from runningshoes.resources import ResourcePool, parse_memory
+
+from conftest import noted, overlapped, spans
+
+
+@pytest.mark.parametrize('value, gb', [
+    (16, 16.0), ('16', 16.0), ('16G', 16.0), ('512MB', 0.5), ('2 GiB', 2.0),
+    ('1t', 1024.0)])
+def test_memory_sizes(value, gb):
+    assert parse_memory(value) == gb
+
+
+def test_a_bad_memory_size_is_an_error():
+    with pytest.raises(ValueError):
+        parse_memory('lots')
+
+
+def test_requests_fit_alongside_what_is_reserved():
+    pool = ResourcePool(cores = 4, memory = 16, guardrails = False)
+    assert pool.try_reserve((3, 8, False))
+    assert not pool.fits((2, 1, False))
+    assert not pool.fits((1, 9, False))
+    assert pool.try_reserve((1, 8, False))
+    pool.release((3, 8, False))
+    pool.release((1, 8, False))
+    assert pool.holders == 0 and pool.reserved_cores == 0
+
+
+def test_exclusive_requests_run_alone():
+    pool = ResourcePool(cores = 4, memory = 16, guardrails = False)
+    pool.reserve((1, 1, False))
+    assert not pool.fits((1, 1, True))
+    pool.release((1, 1, False))
+    assert pool.try_reserve((1, 1, True))
+    assert not pool.fits((1, 1, False))
+
+
+def test_big_requests_still_run_on_an_idle_pool():
+    pool = ResourcePool(cores = 4, memory = 16, guardrails = False)
+    assert pool.try_reserve((64, 512, False))
+    assert pool.reserved_cores == 4 and pool.reserved_memory == 16
+
+
+def test_claimed_requests_are_left_room():
+    pool = ResourcePool(cores = 4, memory = 16, guardrails = False)
+    pool.reserve((2, 1, False))
+    assert pool.fits((1, 1, False))
+    # -- a bigger file ahead in line keeps a small one from jumping it
+    assert not pool.fits((1, 1, False), claimed = [(2, 1, False)])
+
+
+def test_guardrails_watch_the_machine(monkeypatch):
+    pool = ResourcePool(cores = 4, memory = 16)
+    pool.reserve((1, 1, False))
+    monkeypatch.setattr(resources, 'memory_available', lambda: 4.0)
+    monkeypatch.setattr(resources, 'load_average', lambda: 0.0)
+    assert pool.fits((1, 2, False))
+    assert not pool.fits((1, 4, False))
+    monkeypatch.setattr(resources, 'load_average', lambda: 4.5)
+    assert not pool.fits((1, 2, False))
+
+
+def test_files_are_scheduled_by_what_they_reserve(pipeline, runner,
+                                                  tmp_path):
+    log = tmp_path / 'log'
+    directory = pipeline({'1-big.sh': '# cores: 2\n' + noted(log),
+                          '1-also_big.sh': '# cores: 2\n' + noted(log),
+                          '1-small.sh': '# cores: 1\n' + noted(log),
+                          '1-tiny.sh': '# cores: 1\n' + noted(log)})
+    run = runner(directory, parallel = True, max_workers = 4,
+                 capacity = {'cores': 2, 'guardrails': False})
+    assert run.resources_for('1-big.sh') == (2.0, 0.0, False)
+    run.run()
+    span = spans(log)
+    assert not overlapped(span['1-big.sh'], span['1-also_big.sh'])
+    assert overlapped(span['1-small.sh'], span['1-tiny.sh'])
+
+
+def test_resources_can_be_set_by_extension(pipeline, runner, tmp_path):
+    log = tmp_path / 'log'
+    directory = pipeline({'1-a.sh': noted(log), '1-b.sh': noted(log),
+                          '1-c.sh': '# exclusive: yes\n' + noted(log)})
+    run = runner(directory, parallel = True, max_workers = 3,
+                 resources = {'.sh': {'cores': 1, 'memory': '512M'}},
+                 capacity = {'cores': 8, 'guardrails': False})
+    assert run.resources_for('1-a.sh') == (1.0, 0.5, False)
+    assert run.resources_for('1-c.sh') == (1.0, 0.5, True)
+    run.run()
+    span = spans(log)
+    assert overlapped(span['1-a.sh'], span['1-b.sh'])
+    for file in ('1-a.sh', '1-b.sh'):
+        assert not overlapped(span[file], span['1-c.sh'])
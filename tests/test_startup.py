@@ -0,0 +1,37 @@
+"""test_startup.py - tests of importing the package and starting the
+command-line utility.
+"""
+
+import subprocess
+import sys
+
+
+def imported_by(code):
+    """The modules a fresh interpreter has imported after running code."""
+    code += '\nimport sys\nprint(" ".join(sys.modules))'
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return set(output.decode().split())
+
+
+def test_importing_the_package_is_lazy():
+    modules = imported_by('import runningshoes\n'
+                          'import runningshoes.utilities.command_line')
+    for heavy in ('runningshoes.runningshoes', 'tabulate', 'csv', 'pandas',
+                  'sqlite3'):
+        assert heavy not in modules
+
+
+def test_running_shoes_is_imported_when_asked_for():
+    modules = imported_by('from runningshoes import RunningShoes')
+    assert 'runningshoes.runningshoes' in modules
+    assert 'tabulate' not in modules
+
+
+def test_the_command_line_utility_runs_a_directory(pipeline, tmp_path):
+    out = tmp_path / 'out'
+    directory = pipeline({'1-a.sh': 'echo ran > {}\n'.format(out)})
+    subprocess.check_call([sys.executable, '-m',
+                           'runningshoes.utilities.command_line',
+                           '--directory', directory, '--no-cache'],
+                          stdout = subprocess.DEVNULL)
+    assert out.read_text() == 'ran\n'
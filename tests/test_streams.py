@@ -0,0 +1,55 @@
+"""test_streams.py - tests of streaming one file's output into the next.
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def elsewhere(tmp_path, monkeypatch):
+    """Run from a directory other than the pipeline's."""
+    path = tmp_path / 'elsewhere'
+    path.mkdir()
+    monkeypatch.chdir(path)
+    return path
+
+
+def test_stdout_is_piped_into_the_next_file(pipeline, runner, tmp_path,
+                                            elsewhere):
+    out = tmp_path / 'out'
+    directory = pipeline({'1-extract.sh': '# stream: stdout\nseq 3\n',
+                          '2-load.sh': 'wc -l > {}\n'.format(out)})
+    run = runner(directory)
+    run.run()
+    assert out.read_text().strip() == '3'
+    assert run.file_data['info']['2-load.sh']['ran'] is True
+
+
+def test_a_named_pipe_is_found_from_any_directory(pipeline, runner, tmp_path,
+                                                  elsewhere):
+    out = tmp_path / 'out'
+    directory = pipeline({
+        '1-extract.sh': '# stream: rows.fifo\n'
+                        'seq 3 > "$RUNNINGSHOES_STREAM"\n',
+        '2-load.py': 'import os\n'
+                     'with open(os.environ["RUNNINGSHOES_STREAM"]) as f:\n'
+                     '    rows = f.read().split()\n'
+                     'with open({!r}, "w") as f:\n'
+                     '    f.write(str(len(rows)))\n'.format(str(out))})
+    runner(directory).run()
+    assert out.read_text() == '3'
+    # -- made in the pipeline's directory, not where we ran from, and removed
+    assert not os.path.lexists(directory + 'rows.fifo')
+    assert os.listdir(str(elsewhere)) == []
+
+
+def test_the_pair_fails_together(pipeline, runner, elsewhere):
+    directory = pipeline({'1-extract.sh': '# stream: stdout\nseq 3\n',
+                          '2-load.sh': 'cat > /dev/null\nexit 4\n'})
+    run = runner(directory)
+    with pytest.raises(Exception, match = 'exit code 4'):
+        run.run()
+    info = run.file_data['info']
+    assert info['1-extract.sh']['ran'] is False
+    assert info['2-load.sh']['ran'] is False
@@ -0,0 +1,51 @@
+"""test_subpipelines.py - tests of running prefixed directories as
+sub-pipelines.
+"""
+
+import pytest
+
+from conftest import noted, overlapped, spans
+
+
+def test_a_sub_pipeline_runs_as_one_step(pipeline, runner, tmp_path):
+    log = tmp_path / 'log'
+    step = 'echo {{}} >> {}\n'.format(log)
+    directory = pipeline({'1-a.sh': step.format('a'),
+                          '2-sub/1-s.sh': step.format('s'),
+                          '2-sub/2-t.sh': step.format('t'),
+                          '3-c.sh': step.format('c')})
+    run = runner(directory)
+    run.run()
+    assert log.read_text().split() == ['a', 's', 't', 'c']
+    info = run.file_data['info']['2-sub']
+    assert list(info['pipeline']['info']) == ['1-s.sh', '2-t.sh']
+    # -- its usage is the rolled up usage of its files
+    children = info['pipeline']['info'].values()
+    assert info['user_time'] == pytest.approx(
+        sum(c['user_time'] for c in children))
+    assert info['max_rss'] == max(c['max_rss'] for c in children)
+    rows = run.format_file_data()
+    assert [r[:2] for r in rows] == [
+        [1, '1-a.sh'], [2, '2-sub'], ['2.1', '2-sub/1-s.sh'],
+        ['2.2', '2-sub/2-t.sh'], [3, '3-c.sh']]
+
+
+def test_sub_pipelines_run_beside_their_siblings(pipeline, runner,
+                                                 tmp_path):
+    log = tmp_path / 'log'
+    directory = pipeline({'1-a.sh': noted(log), '1-sub/1-s.sh': noted(log),
+                          '2-b.sh': 'true\n'})
+    runner(directory, parallel = True, max_workers = 2).run()
+    span = spans(log)
+    assert overlapped(span['1-a.sh'], span['1-s.sh'])
+
+
+def test_a_failure_inside_fails_the_sub_pipeline(pipeline, runner):
+    directory = pipeline({'1-sub/1-s.sh': 'exit 3\n', '2-b.sh': 'true\n'})
+    run = runner(directory)
+    with pytest.raises(Exception, match = 'exit code 3'):
+        run.run()
+    info = run.file_data['info']
+    assert info['1-sub']['ran'] is False
+    assert info['1-sub']['pipeline']['info']['1-s.sh']['returncode'] == 3
+    assert '2-b.sh' not in info
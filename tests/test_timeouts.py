@@ -0,0 +1,64 @@
+"""test_timeouts.py - tests of timeouts and retrying files that fail.
+"""
+
+import os
+import time
+
+import pytest
+
+from runningshoes.runningshoes import StepTimeout
+
+
+def test_a_timeout_kills_the_whole_process_group(pipeline, runner, tmp_path):
+    pid_file = tmp_path / 'pid'
+    directory = pipeline({'1-hang.sh': 'sleep 30 &\necho $! > {}\nwait\n'
+                          .format(pid_file)})
+    run = runner(directory, timeouts = {'.sh': 0.5})
+    started = time.monotonic()
+    with pytest.raises(StepTimeout):
+        run.run()
+    assert time.monotonic() - started < 10
+    # -- what the file started was killed along with it
+    pid = int(pid_file.read_text())
+    for _ in range(50):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.1)
+    else:
+        pytest.fail('the process group was left running')
+
+
+def test_a_declared_timeout_takes_precedence(pipeline, runner):
+    directory = pipeline({'1-a.sh': '# timeout: 0.3\nsleep 30\n'})
+    run = runner(directory, timeouts = {'*': 60})
+    assert run.timeout_for('1-a.sh') == 0.3
+    with pytest.raises(StepTimeout):
+        run.run()
+
+
+def test_failures_are_retried_with_backoff(pipeline, runner, tmp_path):
+    count = tmp_path / 'count'
+    # -- notes when it started, and fails twice, then succeeds
+    directory = pipeline({'1-flaky.sh': 'date +%s.%N >> {0}\n'
+                          'test $(wc -l < {0}) -ge 3\n'.format(count)})
+    run = runner(directory, retries = {'1-flaky': 2}, backoff = 0.1)
+    run.run()
+    attempts = run.file_data['info']['1-flaky.sh']['attempts']
+    assert len(attempts) == 3
+    assert 'exit code 1' in attempts[0]['error']
+    assert 'error' not in attempts[2]
+    # -- waited 0.1 then 0.2 seconds between attempts
+    started = [float(t) for t in count.read_text().split()]
+    assert started[1] - started[0] >= 0.1 and started[2] - started[1] >= 0.2
+
+
+def test_retries_are_bounded(pipeline, runner):
+    directory = pipeline({'1-broken.sh': '# retries: 1\nexit 3\n'})
+    run = runner(directory, backoff = 0)
+    with pytest.raises(Exception, match = 'exit code 3'):
+        run.run()
+    info = run.file_data['info']['1-broken.sh']
+    assert info['ran'] is False
+    assert len(info['attempts']) == 2
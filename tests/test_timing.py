@@ -0,0 +1,56 @@
+"""test_timing.py - tests of timing files and formatting their timings.
+"""
+
+import time
+
+import pytest
+
+from runningshoes import RunningShoes
+
+
+@pytest.mark.parametrize('seconds, formatted', [
+    (None, 'NA'), (0.00085, '850 us'), (0.0123, '12.3 ms'), (4.561, '4.56 s'),
+    (125, '2m 05s'), (3723, '1h 02m 03s')])
+def test_durations_are_shown_in_a_unit_that_suits_them(seconds, formatted):
+    assert RunningShoes.format_duration(seconds) == formatted
+
+
+def test_times_are_shown_to_the_millisecond():
+    epoch = time.mktime((2026, 1, 2, 3, 4, 5, 0, 0, -1)) + 0.25
+    assert RunningShoes.format_time(epoch) == '2026-01-02 03:04:05.250'
+    assert RunningShoes.format_time(None) == 'NA'
+
+
+def test_sub_second_files_are_timed(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'sleep 0.05\n', '2-b.sh': 'true\n'})
+    run = runner(directory)
+    run.run()
+    timing = run.file_data['info']['1-a.sh']['timing']
+    assert timing['end_ns'] > timing['start_ns']
+    assert 0.05 <= timing['elapsed'] < 5
+    assert timing['elapsed'] == (timing['end_ns'] - timing['start_ns']) / 1e9
+    assert timing['start_epoch'] <= timing['end_epoch']
+    assert 0 < timing['spawn_latency'] < timing['elapsed']
+    assert ' ms' in run.format_file_data()[0][4]
+
+
+def test_the_runner_overhead_can_be_measured(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n'})
+    run = runner(directory)
+    run.run()
+    meta = run.file_data['meta']['timing']
+    steps = [i['timing'] for i in run.file_data['info'].values()]
+    assert meta['start_ns'] <= min(t['start_ns'] for t in steps)
+    assert meta['end_ns'] >= max(t['end_ns'] for t in steps)
+    assert meta['elapsed'] >= sum(t['elapsed'] for t in steps)
+
+
+def test_time_to_first_output_needs_logs(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'sleep 0.1\necho hello\n'})
+    run = runner(directory, logs = True)
+    run.run()
+    timing = run.file_data['info']['1-a.sh']['timing']
+    assert 0.1 <= timing['first_output'] <= timing['elapsed']
+    run = runner(directory)
+    run.run()
+    assert 'first_output' not in run.file_data['info']['1-a.sh']['timing']
@@ -0,0 +1,80 @@
+"""test_trace.py - tests of writing runs out as Chrome traces.
+"""
+
+import json
+import os
+
+from runningshoes.orchestrate import Orchestrator
+from runningshoes.trace import Tracer
+from runningshoes.utilities.command_line import launch_new_instance
+
+
+def spans(trace, category = 'step'):
+    return dict((e['name'], e) for e in trace['traceEvents']
+                if e.get('cat') == category)
+
+
+def test_files_get_the_lowest_free_slot():
+    tracer = Tracer('/pipeline/', interval = None)
+    tracer.start()
+    tracer.begin('/pipeline/1-a.sh')
+    tracer.begin('/pipeline/1-b.sh')
+    tracer.end('/pipeline/1-a.sh', 'success')
+    tracer.begin('/pipeline/2-c.sh')
+    tracer.stop()
+    steps = spans(tracer.trace())
+    assert [steps[f]['tid'] for f in ('1-a.sh', '1-b.sh', '2-c.sh')] == \
+        [1, 2, 1]
+    assert steps['1-b.sh']['args']['status'] == 'unfinished'
+
+
+def test_a_run_is_traced(pipeline, runner, tmp_path):
+    path = str(tmp_path / 'trace.json')
+    directory = pipeline({'1-a.sh': 'sleep 0.2\n', '1-b.sh': 'sleep 0.2\n',
+                          '2-flaky.sh': '# retries: 1\nexit 1\n'})
+    run = runner(directory, parallel = True, max_workers = 2, backoff = 0,
+                 trace = path, on_failure = 'continue')
+    try:
+        run.run()
+    except Exception:
+        pass
+    with open(path) as f:
+        trace = json.load(f)
+    steps = spans(trace)
+    assert set([steps['1-a.sh']['tid'], steps['1-b.sh']['tid']]) == \
+        set([1, 2])
+    assert steps['2-flaky.sh']['args']['status'] == 'failure'
+    assert len([a for a in spans(trace, 'attempt')
+                if a.startswith('2-flaky.sh')]) == 2
+    assert trace['otherData']['directory'] == directory
+
+
+def test_each_directory_gets_its_own_trace_and_logs(pipeline, tmp_path):
+    directories = [pipeline({'1-a.sh': 'echo {}\n'.format(name)},
+                            name = name) for name in ('x', 'y')]
+    trace, logs = str(tmp_path / 'trace.json'), str(tmp_path / 'logs')
+    orchestrator = Orchestrator(directories, trace = trace, logs = logs,
+                                cache = False)
+    orchestrator.run()
+    for name in ('x', 'y'):
+        with open(str(tmp_path / 'trace-{}.json'.format(name))) as f:
+            assert list(spans(json.load(f))) == ['1-a.sh']
+        with open(os.path.join(logs, name, '1-a.sh.log')) as f:
+            assert f.read() == '{}\n'.format(name)
+    assert not os.path.exists(trace)
+
+
+def test_directories_that_share_a_name_are_told_apart():
+    names = Orchestrator.short_names(['/a/x/', '/b/x/', '/c/y/'])
+    assert names == {'/a/x/': 'a_x', '/b/x/': 'b_x', '/c/y/': 'y'}
+
+
+def test_the_command_line_splits_trace_and_logs(pipeline, tmp_path):
+    directories = [pipeline({'1-a.sh': 'true\n'}, name = name)
+                   for name in ('x', 'y')]
+    launch_new_instance(['--directories'] + directories +
+                        ['--no-cache', '--trace', str(tmp_path / 't.json'),
+                         '--logs', str(tmp_path / 'logs')])
+    assert sorted(os.listdir(str(tmp_path / 'logs'))) == ['x', 'y']
+    assert os.path.exists(str(tmp_path / 't-x.json'))
+    assert os.path.exists(str(tmp_path / 't-y.json'))
@@ -0,0 +1,45 @@
+"""test_usage.py - tests of recording what each file's process used.
+"""
+
+import pytest
+
+from runningshoes.runningshoes import StepFailed
+
+
+BURN = 'import time\nend = time.process_time() + 0.2\n' \
+       'while time.process_time() < end:\n    pass\n'
+
+
+def test_resource_usage_is_recorded(pipeline, runner):
+    directory = pipeline({'1-burn.py': BURN})
+    run = runner(directory)
+    run.run()
+    info = run.file_data['info']['1-burn.py']
+    assert info['returncode'] == 0
+    assert info['user_time'] + info['system_time'] >= 0.15
+    assert info['max_rss'] > 0
+    for key in ('block_input', 'block_output', 'voluntary_switches',
+                'involuntary_switches'):
+        assert isinstance(info[key], int)
+
+
+def test_exit_codes_are_recorded(pipeline, runner):
+    directory = pipeline({'1-fail.sh': 'exit 3\n'})
+    run = runner(directory)
+    with pytest.raises(StepFailed) as raised:
+        run.run()
+    assert raised.value.returncode == 3
+    assert run.file_data['info']['1-fail.sh']['returncode'] == 3
+
+
+def test_resources_are_rounded_in_the_report(pipeline, runner):
+    directory = pipeline({'1-burn.py': BURN})
+    run = runner(directory)
+    run.run()
+    row = dict(zip(run.file_data_headers(), run.format_file_data()[0]))
+    assert row['CPU user'].endswith(('ms', ' s'))
+    assert len(row['Peak RSS (MB)'].split('.')[1]) == 1
+    assert run.format_resource('max_rss', 14.98828125) == '15.0'
+    assert run.format_resource('user_time', 0.0017009999999999998) == \
+        '1.7 ms'
+    assert run.format_resource('memory_peak', None) == 'NA'
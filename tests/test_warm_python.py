@@ -0,0 +1,78 @@
+"""test_warm_python.py - tests of running .py files in the fork server.
+"""
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+from runningshoes.forkserver import ForkServer
+from runningshoes.runningshoes import StepFailed
+
+
+REPORT = '''import json, os, sys
+with open({path!r}, 'w') as f:
+    json.dump({{'name': __name__, 'pid': os.getpid(),
+               'preloaded': 'csv' in sys.modules}}, f)
+'''
+
+
+def test_files_run_as_main_in_forked_children(pipeline, runner, tmp_path):
+    directory = pipeline({
+        '1-a.py': REPORT.format(path = str(tmp_path / 'a.json')),
+        '2-b.py': REPORT.format(path = str(tmp_path / 'b.json'))})
+    run = runner(directory, warm_python = True, preload = ['csv'])
+    run.run()
+    reports = [json.loads((tmp_path / n).read_text())
+               for n in ('a.json', 'b.json')]
+    assert all(r['name'] == '__main__' for r in reports)
+    assert all(r['preloaded'] for r in reports)
+    assert reports[0]['pid'] != reports[1]['pid'] != os.getpid()
+    # -- the server is shut down at the end of the run
+    assert run.fork_server is None
+
+
+def test_exit_codes_and_exceptions(pipeline, runner):
+    directory = pipeline({'1-exit.py': 'import sys\nsys.exit(4)\n'})
+    with pytest.raises(StepFailed) as raised:
+        runner(directory, warm_python = True).run()
+    assert raised.value.returncode == 4
+    directory = pipeline({'1-raise.py': 'raise ValueError()\n'}, 'raises')
+    run = runner(directory, warm_python = True)
+    with pytest.raises(StepFailed):
+        run.run()
+    assert run.file_data['info']['1-raise.py']['returncode'] == 1
+
+
+def test_output_is_captured_in_logs(pipeline, runner):
+    directory = pipeline({'1-a.py': 'import sys\nprint("out")\n'
+                                    'print("err", file = sys.stderr)\n'})
+    run = runner(directory, warm_python = True, logs = True)
+    run.run()
+    with open(os.path.join(run.logs, '1-a.py.log')) as f:
+        assert sorted(f.read().split()) == ['err', 'out']
+
+
+def test_a_background_process_does_not_stall_the_logs(pipeline, runner):
+    directory = pipeline({'1-a.py': 'import subprocess\n'
+                                    'subprocess.Popen(["sleep", "5"])\n'
+                                    'print("out")\n'})
+    run = runner(directory, warm_python = True, logs = True)
+    started = time.monotonic()
+    run.run()
+    assert time.monotonic() - started < 2
+    with open(os.path.join(run.logs, '1-a.py.log')) as f:
+        assert f.read() == 'out\n'
+
+
+def test_a_fork_server_on_its_own(pipeline):
+    directory = pipeline({'1-a.py': 'import sys\nsys.exit(7)\n'})
+    server = ForkServer([sys.executable])
+    try:
+        returncode, usage = server.run(directory + '1-a.py')
+    finally:
+        server.close()
+    assert returncode == 7
+    assert usage.ru_maxrss > 0
@@ -0,0 +1,118 @@
+"""test_watch.py - tests of watching a directory and re-running what changed.
+"""
+
+import threading
+
+import pytest
+
+from runningshoes.watch import DirectoryWatcher
+
+
+def watch_once(run, change, **options):
+    """Watch a RunningShoes, making a change once the first run is done, and
+    return the files the run after that change was limited to.
+    """
+    runs = []
+    real_run = run.run
+
+    def fake_run(incremental = False, only = None, **kwargs):
+        runs.append(only)
+        if len(runs) > 1:
+            raise KeyboardInterrupt
+        threading.Timer(0.3, change).start()
+        return real_run(incremental = incremental, only = only, **kwargs)
+
+    run.run = fake_run
+    with pytest.raises(KeyboardInterrupt):
+        run.watch(debounce = 0.2, poll_interval = 0.1, **options)
+    return runs[-1]
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_changes_are_seen_and_debounced(tmp_path, use_inotify):
+    path = tmp_path / 'a.sh'
+    path.write_text('true\n')
+    with DirectoryWatcher([str(tmp_path)], debounce = 0.3,
+                          poll_interval = 0.05,
+                          use_inotify = use_inotify) as watcher:
+        assert watcher.changes(timeout = 0.2) == set()
+        threading.Timer(0.1, path.write_text, ['false\n']).start()
+        threading.Timer(0.2, (tmp_path / 'b.sh').write_text,
+                        ['true\n']).start()
+        assert watcher.changes(timeout = 5) == \
+            set([str(path), str(tmp_path / 'b.sh')])
+
+
+def test_downstream_follows_the_graph(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n',
+                          '2-b.sh': '# needs:\n# outputs: b.csv\ntrue\n',
+                          '3-c.sh': '# inputs: b.csv\ntrue\n',
+                          '4-d.sh': '# needs: 1-a\ntrue\n'})
+    run = runner(directory, graph = True)
+    assert run.downstream(['2-b.sh']) == ['2-b.sh', '3-c.sh']
+    assert run.downstream(['1-a.sh']) == ['1-a.sh', '4-d.sh']
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_an_edit_reruns_the_file_and_what_follows(pipeline, runner,
+                                                   use_inotify):
+    directory = pipeline({'1-a.sh': 'true\n', '2-b.sh': 'true\n',
+                          '3-c.sh': 'true\n'})
+
+    def edit():
+        with open(directory + '2-b.sh', 'a') as f:
+            f.write('# -- edited\n')
+
+    only = watch_once(runner(directory), edit, use_inotify = use_inotify)
+    assert only == ['2-b.sh', '3-c.sh']
+
+
+def test_a_changed_input_reruns_the_files_reading_it(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n',
+                          '2-b.sh': '# inputs: data.csv\n# needs:\ntrue\n',
+                          'data.csv': 'x\n'})
+
+    def edit():
+        with open(directory + 'data.csv', 'w') as f:
+            f.write('y\n')
+
+    assert watch_once(runner(directory, graph = True), edit) == ['2-b.sh']
+
+
+def test_a_new_file_reruns_everything(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n'})
+
+    def add():
+        with open(directory + '2-b.sh', 'w') as f:
+            f.write('true\n')
+
+    run = runner(directory)
+    assert watch_once(run, add) is None
+    assert list(run.files) == ['1-a.sh', '2-b.sh']
+
+
+def test_sub_pipelines_are_watched_all_the_way_down(pipeline, runner):
+    directory = pipeline({'1-a.sh': 'true\n', '2-sub/1-s.sh': 'true\n',
+                          '2-sub/2-deep/1-d.sh': 'true\n', '3-c.sh': 'true\n'})
+    run = runner(directory)
+    assert run.watched_paths()[directory + '2-sub/2-deep/1-d.sh'] == \
+        ['2-sub']
+
+    def edit():
+        with open(directory + '2-sub/2-deep/1-d.sh', 'a') as f:
+            f.write('# -- edited\n')
+
+    assert watch_once(run, edit) == ['2-sub', '3-c.sh']
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_a_file_added_to_a_sub_pipeline_reruns_it(pipeline, runner,
+                                                   use_inotify):
+    directory = pipeline({'1-a.sh': 'true\n', '2-sub/1-s.sh': 'true\n'})
+
+    def add():
+        with open(directory + '2-sub/2-t.sh', 'w') as f:
+            f.write('true\n')
+
+    only = watch_once(runner(directory), add, use_inotify = use_inotify)
+    assert only == ['2-sub']